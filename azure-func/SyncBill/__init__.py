@@ -0,0 +1,98 @@
+# SyncBill/__init__.py  — sync bajo demanda de facturas concretas
+#
+#   GET  /api/sync/bills?account=<cuenta Clorian>&bill_id=447732&bill_id=447733[&dry_run=1]
+#   POST /api/sync/bills  {"account": "...", "bill_ids": [447732, 447733], "dry_run": false}
+
+import asyncio
+import json
+import logging
+import os
+import weakref
+from contextlib import AsyncExitStack
+
+import azure.functions as func
+from src.services.resilience import Deadline, RetryBudget, run_scope
+from src.services.sync_service import AsyncService
+from src.services.sync_state import AccountBusy, AccountLock
+from src.services.warm_cache import cache_report
+from src.config.settings import CLORIAN_ACCOUNTS
+
+MAX_BILLS = int(os.getenv("SYNC_BILL_MAX_IDS", "50"))
+DEADLINE_SECONDS = float(os.getenv("SYNC_BILL_DEADLINE_SECONDS", "60"))
+LOCK_WAIT_SECONDS = float(os.getenv("SYNC_BILL_LOCK_WAIT_SECONDS", "20"))
+
+# Una instancia por worker: token de Clorian, catálogo de productos y conexiones a Holded siguen calientes entre peticiones
+_service: AsyncService | None = None
+# Un lock por (cuenta, billId): dos peticiones a la vez de la misma factura no la crean dos veces
+_bill_locks: "weakref.WeakValueDictionary[tuple[str, int], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _bill_lock(account: str, bill_id: int) -> asyncio.Lock:
+    lock = _bill_locks.get((account, bill_id))
+    if lock is None:
+        lock = _bill_locks[(account, bill_id)] = asyncio.Lock()
+    return lock
+
+
+def _response(body: dict, status: int = 200) -> func.HttpResponse:
+    return func.HttpResponse(json.dumps(body, ensure_ascii=False, default=str), status_code=status, mimetype="application/json")
+
+
+def _parse(req: func.HttpRequest) -> tuple[str | None, list[int], bool]:
+    try:
+        body = req.get_json() if req.method == "POST" else {}
+    except ValueError:
+        body = {}
+    account = body.get("account") or req.params.get("account")
+    raw_ids = body.get("bill_ids") or body.get("bill_id") or req.params.get("bill_id") or req.params.get("bill_ids") or []
+    if not isinstance(raw_ids, list):
+        raw_ids = str(raw_ids).split(",")
+    bill_ids = [int(str(b).strip()) for b in raw_ids if str(b).strip()]
+    dry_run = str(body.get("dry_run", req.params.get("dry_run", ""))).lower() in ("1", "true", "yes")
+    return account, bill_ids, dry_run
+
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    global _service
+    try:
+        account, bill_ids, dry_run = _parse(req)
+    except ValueError:
+        return _response({"error": "bill ids must be integers"}, 400)
+    if account not in {acc.get("name") for acc in CLORIAN_ACCOUNTS}:
+        return _response({"error": f"unknown Clorian account {account!r}"}, 400)
+    if not bill_ids or len(bill_ids) > MAX_BILLS:
+        return _response({"error": f"pass between 1 and {MAX_BILLS} bill ids"}, 400)
+
+    logging.info("SyncBill: %s bills of %s%s", len(bill_ids), account, " [dry-run]" if dry_run else "")
+    if _service is None:
+        _service = AsyncService(use_outbox=False)
+    # plazo y presupuesto de reintentos propios de esta petición (el servicio lo comparten las peticiones concurrentes)
+    deadline = Deadline(DEADLINE_SECONDS)
+    try:
+        async with AsyncExitStack() as locks:
+            for bill_id in sorted(set(bill_ids)):          # siempre en el mismo orden: sin interbloqueos
+                await locks.enter_async_context(_bill_lock(account, bill_id))
+            if not dry_run:
+                # el mismo lock de cuenta que la ejecución diaria, el poller y el backfill: nunca dos altas de la misma factura
+                account_lock = AccountLock(account, "normal", "SyncBill")
+                try:
+                    await account_lock.acquire_within(max(0.0, min(LOCK_WAIT_SECONDS, deadline.remaining() - 15)), every=1.0)
+                except AccountBusy as exc:
+                    logging.warning("SyncBill: %s", exc)
+                    return _response({"error": f"account busy, retry later: {exc}"}, 409)
+                locks.callback(account_lock.release)
+            with run_scope(deadline, RetryBudget()):
+                summary = await _service.sync_bills_by_id(account, bill_ids, dry_run=dry_run)
+    except Exception as exc:
+        logging.exception("SyncBill falló: %s", exc)
+        return _response({"error": str(exc)}, 500)
+    logging.info("SyncBill: cachés %s", cache_report())
+
+    status = 200
+    if summary["stopped"]:
+        status = 503                    # Clorian/Holded caídos o sin tiempo: reintentar más tarde
+    elif summary["not_found"] and len(summary["not_found"]) == len(bill_ids):
+        status = 404
+    elif summary["errors"] and not summary["processed"]:
+        status = 502
+    return _response(summary, status)
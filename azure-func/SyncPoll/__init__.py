@@ -0,0 +1,21 @@
+# SyncPoll/__init__.py  — micro-batch cada 5 minutos (ventana reciente, ver src/services/poller.py)
+# Se desactiva con el app setting AzureWebJobs.SyncPoll.Disabled=true
+# No corre sin SYNC_STATE_DIR en almacenamiento compartido (p.ej. /home/data): los locks y la
+# marca de poll en el temp de cada instancia no se ven entre instancias ni sobreviven a un reciclado
+
+import logging
+import azure.functions as func
+from src.config.settings import STATE_DIR_PERSISTENT
+from src.services.poller import poll
+
+async def main(mytimer: func.TimerRequest):
+    if not STATE_DIR_PERSISTENT:
+        logging.error("SyncPoll: omitido, SYNC_STATE_DIR no está configurado (estado compartido obligatorio)")
+        return
+    logging.info("SyncPoll: inicio")
+    try:
+        results = await poll(once=True)
+    except Exception as exc:
+        logging.exception("SyncPoll falló: %s", exc)
+        raise
+    logging.info("SyncPoll: fin OK (%s nuevas)", sum(r["created_invoices"] + r["queued"] for r in results))
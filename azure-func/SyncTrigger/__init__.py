@@ -2,12 +2,15 @@
 
 import logging
 import azure.functions as func
+from src.services.resilience import Deadline
 from src.services.sync_service import migration_proceed  # tu servicio real
 
 async def main(mytimer: func.TimerRequest):
+    # el plazo empieza a contar aquí, no cuando arranca cada servicio
+    deadline = Deadline.from_env()
     logging.info("SyncTrigger: inicio")
     try:
-        await migration_proceed()
+        await migration_proceed(deadline)
     except Exception as exc:
         logging.exception("SyncTrigger falló: %s", exc)
         raise
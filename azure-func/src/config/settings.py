@@ -1,6 +1,7 @@
 import unicodedata, re
 import json
 import os
+import tempfile
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -39,6 +40,15 @@ credentials = load_credentials()
 CLORIAN_ACCOUNTS = credentials["clorian_accounts"]
 HOLDED_API_KEY   = credentials["holded"]["api_key"]
 
+# Clorian API host; point it at a mock (e.g. `python -m src.tests.synth_bills serve`) for scale tests
+CLORIAN_PUBLIC_URL = "https://services.clorian.com"
+CLORIAN_BASE_URL = (os.getenv("CLORIAN_BASE_URL") or CLORIAN_PUBLIC_URL).rstrip("/")
+
+# Local sync state (mappings, progress...). Azure Functions only allow writes under the temp dir.
+STATE_DIR = os.getenv("SYNC_STATE_DIR") or os.path.join(tempfile.gettempdir(), "clorian_holded")
+# Only an explicit SYNC_STATE_DIR (shared storage such as /home/data on Azure) outlives an instance recycle
+STATE_DIR_PERSISTENT = bool(os.getenv("SYNC_STATE_DIR"))
+
 """CLORIAN ACCOUNTS HELPERS"""
 # TOKEN HELPERS 
 def update_auth_token( clorian_account: str, new_token: str) -> None:
@@ -115,6 +125,10 @@ def _clean(text: str, max_len: int | None = None) -> str:
     txt = re.sub(r"\s+", " ", txt).strip()
     return txt[:max_len] if max_len else txt
 
+def _slug(text: str) -> str:
+    """'Clorian Flamenco Granada' → 'clorian-flamenco-granada' (safe for file names)."""
+    return re.sub(r"[^a-z0-9]+", "-", _clean(text).lower()).strip("-")
+
 
 if __name__ == "__main__":
     w = get_auth_token("Clorian Flamenco Granada"); print(w)
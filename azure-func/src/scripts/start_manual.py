@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from src.services.profiler import PROFILE_ENABLED, SamplingProfiler
+from src.services.resilience import Deadline, limiter_report
+from src.services.sync_service import AsyncService
+from src.config.settings import CLORIAN_ACCOUNTS, STATE_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(process)d %(name)s: %(message)s"
+COUNTERS = ("fetched", "processed", "skipped_duplicates", "skipped_by_hash", "skipped_by_mark", "changed", "created_contacts", "created_invoices", "queued", "errors")
+
+
+def _date(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+def shard_accounts(accounts: list[str], processes: int) -> list[list[str]]:
+    """Round-robin accounts over at most *processes* shards (no empty shard)."""
+    shards = [accounts[i::processes] for i in range(max(1, processes))]
+    return [s for s in shards if s]
+
+
+def _install_event_loop(use_uvloop: bool) -> None:
+    if not use_uvloop:
+        return
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("⚠️  uvloop is not installed, using the default asyncio event loop")
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+async def _sync_shard(accounts: list[str], options: dict) -> dict:
+    # every shard gets the same wall-clock budget, counted from its own start
+    deadline = Deadline(options.pop("deadline"))
+    profile_stem = options.pop("profile")
+    profiler = SamplingProfiler().start() if profile_stem else None
+    async_service = AsyncService(max_retries=options.pop("retry_budget"), use_outbox=options.pop("outbox"), deadline=deadline,
+                                 archive=options.pop("archive"))
+    try:
+        results = await async_service.fetch_clorian_invoices(accounts, **options)
+    finally:
+        await async_service.close()
+        if profiler is not None:
+            profiler.stop()
+            profiler.write(profile_stem)
+    # concurrency chosen by the adaptive limiters over time, and the process memory, for the run report
+    return {"accounts": results, "concurrency": limiter_report(), "memory": async_service.memory.report()}
+
+
+def _shard_options(options: dict, n: int) -> dict:
+    """Per-shard copy of the options (each process writes its own profile)."""
+    if options.get("profile"):
+        return {**options, "profile": f"{options['profile']}-shard{n}"}
+    return options
+
+
+def run_shard(accounts: list[str], options: dict, use_uvloop: bool = False, log_level: int = logging.INFO) -> dict:
+    """Sync *accounts* on their own event loop (entry point of every pool process)."""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    _install_event_loop(use_uvloop)
+    logger.info(f"🧵 Shard started with {len(accounts)} accounts: {', '.join(accounts)}")
+    return asyncio.run(_sync_shard(accounts, dict(options)))
+
+
+def merge_summaries(summaries: list[dict]) -> dict:
+    """Add up the per-account counters of every shard."""
+    totals = {k: 0 for k in COUNTERS}
+    for s in summaries:
+        for k in COUNTERS:
+            totals[k] += s.get(k) or 0
+    totals["accounts"] = len({s["account"] for s in summaries})
+    totals["stopped"] = sorted({s["account"] for s in summaries if s.get("stopped")})
+    return totals
+
+
+def print_summaries(summaries: list[dict], totals: dict) -> None:
+    header = f"{'account':<40} {'kind':<10} " + " ".join(f"{k[:10]:>10}" for k in COUNTERS) + f" {'secs':>8}  stopped"
+    print(header)
+    print("-" * len(header))
+    for s in sorted(summaries, key=lambda s: (s["account"], s["kind"])):
+        counters = " ".join(f"{s.get(k) or 0:>10}" for k in COUNTERS)
+        print(f"{s['account'][:40]:<40} {s['kind']:<10} {counters} {s.get('duration', 0):>8.1f}  {s.get('stopped') or ''}")
+    print("-" * len(header))
+    print(f"{'TOTAL':<40} {'':<10} " + " ".join(f"{totals[k]:>10}" for k in COUNTERS))
+
+
+def default_report_path() -> str:
+    return os.path.join(STATE_DIR, "reports", f"run-{datetime.utcnow():%Y%m%dT%H%M%S}.json")
+
+
+def write_report(report: dict, path: Optional[str] = None) -> str:
+    path = path or default_report_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Clorian → Holded sync manually.")
+    parser.add_argument("--account", action="append", help="Clorian account name (repeatable, default: all accounts)")
+    parser.add_argument("--start", type=_date, help="First billDate to sync, YYYY-MM-DD (default: SYNC_START_DATE / resume point)")
+    parser.add_argument("--end", type=_date, help="Last billDate to sync, YYYY-MM-DD (default: now)")
+    summaries = parser.add_mutually_exclusive_group()
+    summaries.add_argument("--summaries", dest="summaries", action="store_true", default=None,
+                           help="Also push simplified bills as daily summaries for every account")
+    summaries.add_argument("--no-summaries", dest="summaries", action="store_false",
+                           help="Never push simplified summaries")
+    parser.add_argument("--dry-run", action="store_true", help="Fetch, check and transform but write nothing to Holded")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent Clorian day requests per account")
+    parser.add_argument("--max-minutes", type=float, default=8, help="Time budget per account")
+    parser.add_argument("--deadline-minutes", type=float, help="Run deadline: no request or bill is started past it (default: none)")
+    parser.add_argument("--retry-budget", type=int, help="Retries allowed per process (default: SYNC_RETRY_BUDGET)")
+    parser.add_argument("--outbox", action="store_true", default=None, help="Queue invoices in the durable outbox and drain it (default: SYNC_OUTBOX)")
+    parser.add_argument("--archive", action="store_true", default=None, help="Also write fetched bills to the local columnar archive (default: SYNC_ARCHIVE)")
+    parser.add_argument("--processes", type=int, default=1, help="Shard accounts over this many processes")
+    parser.add_argument("--uvloop", action="store_true", help="Use uvloop as event loop when installed")
+    parser.add_argument("--report", help="Run report path (default: STATE_DIR/reports/run-<timestamp>.json)")
+    parser.add_argument("--profile", action="store_true", default=PROFILE_ENABLED,
+                        help="Sample the run; writes <report>.folded (flamegraph) and <report>.top.txt per process (default: SYNC_PROFILE)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    log_level = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+
+    known = [acc["name"] for acc in CLORIAN_ACCOUNTS]
+    accounts = args.account or known
+    unknown = sorted(set(accounts) - set(known))
+    if unknown:
+        parser.error(f"Unknown Clorian accounts: {', '.join(unknown)}")
+
+    report_path = args.report or default_report_path()
+    report_stem = os.path.splitext(report_path)[0]
+    options = dict(
+        start_date=args.start,
+        end_date=args.end,
+        summaries=args.summaries,
+        dry_run=args.dry_run,
+        concurrency=args.concurrency,
+        max_execution_time=args.max_minutes * 60,
+        retry_budget=args.retry_budget,
+        outbox=args.outbox,
+        archive=args.archive,
+        deadline=args.deadline_minutes * 60 if args.deadline_minutes else None,
+        profile=report_stem if args.profile else None,
+    )
+    shards = shard_accounts(accounts, args.processes)
+    logger.info(f"🚀 Manual sync of {len(accounts)} accounts in {len(shards)} process(es){' [dry-run]' if args.dry_run else ''}")
+
+    started = time.time()
+    results, concurrency, memory = [], [], []
+    if len(shards) == 1:
+        shard_results = [run_shard(shards[0], options, args.uvloop, log_level)]
+    else:
+        shard_results = []
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [pool.submit(run_shard, shard, _shard_options(options, n), args.uvloop, log_level) for n, shard in enumerate(shards)]
+            for shard, future in zip(shards, futures):
+                try:
+                    shard_results.append(future.result())
+                except Exception as e:
+                    logger.error(f"❌ Shard {', '.join(shard)} failed: {e}")
+                    results.extend({"account": a, "kind": "normal", "errors": 1, "stopped": str(e)} for a in shard)
+    for shard_result in shard_results:
+        results.extend(shard_result["accounts"])
+        concurrency.append(shard_result["concurrency"])
+        memory.append(shard_result["memory"])
+
+    totals = merge_summaries(results)
+    totals["duration"] = round(time.time() - started, 2)
+    totals["peak_rss_mb"] = max((m["peak_rss_mb"] for m in memory), default=None)
+    print_summaries(results, totals)
+    path = write_report({
+        "started_at": datetime.utcfromtimestamp(started).isoformat(),
+        "options": {**options, "processes": len(shards), "uvloop": args.uvloop},
+        "totals": totals,
+        "accounts": results,
+        "concurrency": concurrency,
+        "memory": memory,
+    }, report_path)
+    logger.info(f"📝 Run report written to {path} ({totals['duration']:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
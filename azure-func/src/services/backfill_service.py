@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from src.services.bill_model import ClorianBill
+from src.services.clorian_service import ClorianService
+from src.services.resilience import STOP_ERRORS, Deadline, get_limiter
+from src.services.sync_service import AsyncService, SYNC_START_DATE, run_summary
+from src.services.sync_state import AccountLock
+from src.config.settings import CLORIAN_ACCOUNTS, CLORIAN_BASE_URL, STATE_DIR, _slug
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BACKFILL_DIR = os.path.join(STATE_DIR, "backfill")
+DAY = "%Y-%m-%d"
+
+
+def date_chunks(start: datetime, end: datetime, chunk_days: int) -> list[tuple[str, str]]:
+    """Split [start, end] into inclusive (first_day, last_day) chunks of *chunk_days* days."""
+    chunks = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= end:
+        last = min(day + timedelta(days=chunk_days - 1), end)
+        chunks.append((day.strftime(DAY), last.strftime(DAY)))
+        day = last + timedelta(days=1)
+    return chunks
+
+
+class BackfillProgress:
+    """
+    Per-account chunk ledger under STATE_DIR/backfill, independent from the
+    daily run resume point (resume.json). The account lock keeps a second
+    backfill, the daily run or the poller off the same account meanwhile.
+    """
+    def __init__(self, account: str, kind: str, *, state_dir: str = BACKFILL_DIR):
+        self.path = os.path.join(state_dir, f"{_slug(account)}-{kind}.json")
+        self.lock = AccountLock(account, kind, "backfill")
+        try:
+            with open(self.path) as f:
+                self.chunks: dict[str, dict] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.chunks = {}
+
+    def is_done(self, chunk: tuple[str, str]) -> bool:
+        return self.chunks.get(chunk[0], {}).get("status") == "done"
+
+    def record(self, chunk: tuple[str, str], status: str, **info) -> None:
+        self.chunks[chunk[0]] = {"end": chunk[1], "status": status, "at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"), **info}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.chunks, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+        self.lock.touch()
+
+    def __enter__(self):
+        self.lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+
+
+def _eta(done: int, total: int, elapsed: float) -> str:
+    if not done:
+        return "?"
+    seconds = int(elapsed / done * (total - done))
+    return str(timedelta(seconds=seconds))
+
+
+class BackfillService:
+    """
+    Historical load of one Clorian account, chunk by chunk.
+
+    Each chunk is fetched, pushed and recorded in its own progress store, so
+    a backfill can be stopped and restarted at any time without touching the
+    daily run. The next chunk is downloaded while the current one is pushed,
+    with as many day slices in flight as the adaptive Clorian limiter allows.
+    """
+    def __init__(self, async_service: AsyncService, account_name: str, *, simplified: bool = False, chunk_days: int = 7, concurrency: int = 10, dry_run: bool = False):
+        self.sync = async_service
+        self.clorian = ClorianService(account_name, retry_budget=async_service.retry_budget, deadline=async_service.deadline)
+        self.simplified = simplified
+        self.kind = "simplified" if simplified else "normal"
+        self.chunk_days = chunk_days
+        self.dry_run = dry_run
+        self.concurrency = concurrency
+        self.progress = BackfillProgress(account_name, self.kind)
+
+    def _record(self, chunk: tuple[str, str], status: str, **info) -> None:
+        if not self.dry_run:            # a dry run must not mark history as loaded
+            self.progress.record(chunk, status, **info)
+
+    async def _fetch(self, chunk: tuple[str, str]) -> list[ClorianBill]:
+        fetch = self.clorian.get_bills if self.simplified else self.clorian.get_bills_v2
+        raw = await fetch(start_date=chunk[0], end_date=chunk[1], concurrency=self.concurrency)
+        failed = self.clorian.failed_slices.get(self.kind, [])
+        if failed:
+            # the chunk is recorded as failed and fetched again by the next run
+            raise RuntimeError(f"{len(failed)} slices failed after every retry: {', '.join(failed)}")
+        await self.sync.archive_bills(self.clorian.name, self.kind, raw)
+        return [ClorianBill.from_dict(b) for b in raw]
+
+    async def _push(self, bills: list[ClorianBill], summary: dict) -> bool:
+        """Push one chunk; True when every bill of it was handled."""
+        started = time.time()
+        holded_docs_cache = await self.sync._prefetch_holded_docs(bills, None if self.simplified else self.sync._series_index(self.clorian.name))
+        try:
+            if self.simplified:
+                await self.sync._push_summaries(self.clorian, bills, holded_docs_cache, started, float("inf"), summary)
+                return not summary["stopped"]
+            stopped_at = await self.sync.push_bills(self.clorian, bills, holded_docs_cache, summary, process_start=started,
+                                                    max_execution_time=float("inf"), dry_run=self.dry_run)
+            return stopped_at is None
+        finally:
+            if holded_docs_cache is not None:
+                holded_docs_cache.close()
+
+    async def run(self, start: datetime, end: datetime) -> dict:
+        chunks = [c for c in date_chunks(start, end, self.chunk_days) if not self.progress.is_done(c)]
+        summary = run_summary(self.clorian.name, self.kind, self.dry_run)
+        summary.update(chunks=len(chunks), chunks_done=0, chunks_failed=0)
+        if not chunks:
+            logger.info(f"✅ Backfill of {self.clorian.name} [{self.kind}] already complete")
+            return summary
+
+        logger.info(f"🗂️  Backfill of {self.clorian.name} [{self.kind}]: {len(chunks)} chunks of {self.chunk_days} days pending")
+        await self.clorian.refresh_token()
+        started = time.time()
+
+        with self.progress:
+            next_fetch = asyncio.create_task(self._fetch(chunks[0]))
+            for n, chunk in enumerate(chunks, 1):
+                errors_before, processed_before = summary["errors"], summary["processed"]
+                try:
+                    bills = await next_fetch
+                except STOP_ERRORS as e:
+                    logger.warning(f"🛑 Backfill of {self.clorian.name} stopped at chunk {chunk[0]}: {e}")
+                    summary["stopped"] = str(e)
+                    break
+                except Exception as e:
+                    logger.error(f"❌ Chunk {chunk[0]} → {chunk[1]} of {self.clorian.name} failed to download: {e}")
+                    self._record(chunk, "failed", error=str(e))
+                    summary["chunks_failed"] += 1
+                    bills = None
+
+                # Prefetch: download the next chunk while this one is pushed
+                next_fetch = asyncio.create_task(self._fetch(chunks[n])) if n < len(chunks) else None
+                if bills is None:
+                    continue
+
+                summary["fetched"] += len(bills)
+                complete = await self._push(bills, summary) if bills else True
+                chunk_errors = summary["errors"] - errors_before
+                if not complete:
+                    logger.warning(f"🛑 Backfill of {self.clorian.name} stopped in chunk {chunk[0]}: {summary['stopped']}")
+                    self._record(chunk, "partial", bills=len(bills), reason=summary["stopped"])
+                    break
+                self._record(chunk, "done" if not chunk_errors else "failed", bills=len(bills),
+                                     processed=summary["processed"] - processed_before, errors=chunk_errors)
+                summary["chunks_done" if not chunk_errors else "chunks_failed"] += 1
+
+                elapsed = time.time() - started
+                logger.info(
+                    f"📈 {self.clorian.name} chunk {n}/{len(chunks)} ({chunk[0]} → {chunk[1]}): {len(bills)} bills, "
+                    f"{summary['fetched'] / elapsed:.1f} bills/s, Clorian concurrency {get_limiter(CLORIAN_BASE_URL).limit:.0f}, ETA {_eta(n, len(chunks), elapsed)}"
+                )
+
+            if next_fetch is not None and not next_fetch.done():
+                next_fetch.cancel()
+
+        summary["duration"] = round(time.time() - started, 2)
+        summary["throughput"] = round(summary["fetched"] / summary["duration"], 2) if summary["duration"] else 0.0
+        return summary
+
+
+async def run_backfill(account_names: list[str], start: datetime, end: datetime, *, simplified: bool = False, chunk_days: int = 7, concurrency: int = 10, dry_run: bool = False, max_retries: Optional[int] = None, deadline_seconds: Optional[float] = None) -> list[dict]:
+    """Backfill every account one after another (the account itself is the unit of parallelism of the chunks)."""
+    async_service = AsyncService(max_retries=max_retries, deadline=Deadline(deadline_seconds))
+    results = []
+    try:
+        for account_name in account_names:
+            service = BackfillService(async_service, account_name, simplified=simplified, chunk_days=chunk_days,
+                                      concurrency=concurrency, dry_run=dry_run)
+            results.append(await service.run(start, end))
+    finally:
+        await async_service.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill Clorian history into Holded in resumable date chunks.")
+    parser.add_argument("--account", action="append", help="Clorian account name (repeatable, default: all accounts)")
+    parser.add_argument("--start", default=SYNC_START_DATE.strftime(DAY), help="YYYY-MM-DD")
+    parser.add_argument("--end", default=(datetime.utcnow() - timedelta(days=1)).strftime(DAY), help="YYYY-MM-DD")
+    parser.add_argument("--simplified", action="store_true", help="Backfill simplified bills as daily summaries")
+    parser.add_argument("--chunk-days", type=int, default=7)
+    parser.add_argument("--concurrency", type=int, default=10, help="Initial Clorian fetch concurrency (adapts up to SYNC_MAX_CONCURRENCY)")
+    parser.add_argument("--retry-budget", type=int, help="Retries allowed for the whole backfill")
+    parser.add_argument("--deadline-minutes", type=float, help="Stop cleanly after this long (default: no deadline)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    accounts = args.account or [acc["name"] for acc in CLORIAN_ACCOUNTS]
+    results = asyncio.run(run_backfill(
+        accounts,
+        datetime.strptime(args.start, DAY),
+        datetime.strptime(args.end, DAY),
+        simplified=args.simplified,
+        chunk_days=args.chunk_days,
+        concurrency=args.concurrency,
+        dry_run=args.dry_run,
+        max_retries=args.retry_budget,
+        deadline_seconds=args.deadline_minutes * 60 if args.deadline_minutes else None,
+    ))
+    for r in results:
+        print(f"{r['account']:<40} {r['kind']:<10} chunks {r['chunks_done']}/{r['chunks']} (failed {r['chunks_failed']}), "
+              f"{r['fetched']} bills, {r['created_invoices']} created, {r.get('throughput', 0)} bills/s, stopped: {r['stopped'] or '-'}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+from urllib.parse import quote
+
+from src.config.settings import STATE_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("SYNC_ARCHIVE_DIR") or os.path.join(STATE_DIR, "archive")
+ARCHIVE_ENABLED = os.getenv("SYNC_ARCHIVE", "0").lower() in ("1", "true", "yes")
+
+# table → (columns, key that identifies a row inside an (account, day, kind) partition)
+TABLES = {
+    "bills": ([
+        "bill_id", "bill_number", "series", "bill_date", "process_date", "status", "annulation", "client_id",
+        "base_amount", "tax_amount", "nif", "person_type", "legal_entity_name", "city", "postal_code", "country",
+        "payment_origin", "lines", "fetched_at",
+    ], ["bill_number"]),
+    "lines": ([
+        "bill_id", "bill_number", "bill_line_id", "reservation_id", "product_id", "base_amount", "tax_amount",
+        "payment_origin", "payment_date", "payment_id", "sales_group_id",
+    ], ["bill_number", "bill_line_id"]),
+    "taxes": ([
+        "bill_id", "bill_number", "tax_rate", "tax_amount", "tax_basis",
+    ], ["bill_number", "tax_rate"]),
+}
+
+
+def _pandas():
+    try:
+        import pandas as pd
+    except ImportError as e:
+        raise RuntimeError("The bill archive requires pandas (`pip install pandas`)") from e
+    return pd
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("The bill archive requires pyarrow (`pip install pyarrow`)") from e
+    return pa, ds, pq
+
+
+def _schemas() -> dict:
+    pa, _, _ = _pyarrow()
+    money, text, ts = pa.float64(), pa.string(), pa.timestamp("s")
+    return {
+        "bills": pa.schema([
+            ("bill_id", pa.int64()), ("bill_number", text), ("series", text), ("bill_date", ts), ("process_date", ts),
+            ("status", text), ("annulation", pa.bool_()), ("client_id", pa.int64()), ("base_amount", money), ("tax_amount", money),
+            ("nif", text), ("person_type", text), ("legal_entity_name", text), ("city", text), ("postal_code", text),
+            ("country", text), ("payment_origin", text), ("lines", pa.int32()), ("fetched_at", ts),
+        ]),
+        "lines": pa.schema([
+            ("bill_id", pa.int64()), ("bill_number", text), ("bill_line_id", pa.int64()), ("reservation_id", pa.int64()),
+            ("product_id", pa.int64()), ("base_amount", money), ("tax_amount", money), ("payment_origin", text),
+            ("payment_date", ts), ("payment_id", pa.int64()), ("sales_group_id", pa.int64()),
+        ]),
+        "taxes": pa.schema([
+            ("bill_id", pa.int64()), ("bill_number", text), ("tax_rate", money), ("tax_amount", money), ("tax_basis", money),
+        ]),
+    }
+
+
+def flatten_bills(bills: Iterable[dict], fetched_at: Optional[datetime] = None) -> dict[str, dict[str, list]]:
+    """Raw Clorian bills → column lists of the bills, lines and taxes tables, plus the `day` of every row."""
+    cols = {table: {c: [] for c in columns + ["day"]} for table, (columns, _) in TABLES.items()}
+    fetched_at = (fetched_at or datetime.utcnow()).strftime("%Y-%m-%d %H:%M:%S")
+    b, l, t = cols["bills"], cols["lines"], cols["taxes"]
+    for bill in bills:
+        number = bill.get("billNumber") or ""
+        bill_id = bill.get("billId")
+        day = (bill.get("billDate") or "")[:10]
+        raw_lines = bill.get("billLines") or []
+        for name, value in (
+            ("bill_id", bill_id), ("bill_number", number), ("series", number.rsplit("-", 1)[0]),
+            ("bill_date", bill.get("billDate")), ("process_date", bill.get("processDate")), ("status", bill.get("status")),
+            ("annulation", bool(bill.get("annulation"))), ("client_id", bill.get("clientId")),
+            ("base_amount", bill.get("baseAmount")), ("tax_amount", bill.get("taxAmount")),
+            ("nif", (bill.get("vatNumber") or "").strip().upper()), ("person_type", bill.get("personType")),
+            ("legal_entity_name", bill.get("legalEntityName")), ("city", bill.get("city")), ("postal_code", bill.get("postalCode")),
+            ("country", (bill.get("country") or "")[:2].upper()),
+            ("payment_origin", (raw_lines[0].get("paymentOrigin") or "").lower() if raw_lines else ""),
+            ("lines", len(raw_lines)), ("fetched_at", fetched_at), ("day", day),
+        ):
+            b[name].append(value)
+        for line in raw_lines:
+            for name, value in (
+                ("bill_id", bill_id), ("bill_number", number), ("bill_line_id", line.get("billLineId")),
+                ("reservation_id", line.get("reservationId")), ("product_id", line.get("productId")),
+                ("base_amount", line.get("billLineBaseAmount")), ("tax_amount", line.get("billLineTaxAmount")),
+                ("payment_origin", (line.get("paymentOrigin") or "").lower()), ("payment_date", line.get("paymentDate")),
+                ("payment_id", line.get("paymentId")), ("sales_group_id", line.get("paymentSalesGroupId")), ("day", day),
+            ):
+                l[name].append(value)
+        for tax in bill.get("billTaxes") or []:
+            for name, value in (
+                ("bill_id", bill_id), ("bill_number", number), ("tax_rate", tax.get("taxRate")),
+                ("tax_amount", tax.get("taxAmount")), ("tax_basis", tax.get("taxBasis")), ("day", day),
+            ):
+                t[name].append(value)
+    return cols
+
+
+class BillArchive:
+    """
+    Local columnar copy of every fetched Clorian bill (Parquet, needs pyarrow).
+
+    Three tables under ARCHIVE_DIR (bills, lines, taxes), each Hive-partitioned
+    as `<table>/account=<name>/day=<YYYY-MM-DD>/<kind>.parquet`. Writing a day
+    again merges by bill number, so refetches and replays never duplicate rows.
+    Queries go through `pyarrow.dataset`: filters on account/day prune whole
+    directories, the rest is pushed down to the Parquet row-group statistics.
+    """
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+        self.schemas = _schemas()
+
+    def _partition(self, table: str, account: str, day: str) -> str:
+        return os.path.join(self.root, table, f"account={quote(account, safe='')}", f"day={day}")
+
+    def write(self, account: str, kind: str, bills: list[dict]) -> int:
+        """Archive raw bills of *account* (`kind`: normal / simplified). Returns the number of day partitions touched."""
+        if not bills:
+            return 0
+        pd = _pandas()
+        pa, _, pq = _pyarrow()
+        started = time.time()
+        days = set()
+        for table, cols in flatten_bills(bills).items():
+            frame = pd.DataFrame(cols)
+            if frame.empty:
+                continue
+            _, key = TABLES[table]
+            for column, kind_of in zip(self.schemas[table].names, self.schemas[table].types):
+                if pa.types.is_timestamp(kind_of):
+                    frame[column] = pd.to_datetime(frame[column], errors="coerce").astype("datetime64[s]")
+            for day, part in frame.groupby("day", sort=False):
+                if not day:
+                    continue
+                days.add(day)
+                directory = self._partition(table, account, day)
+                path = os.path.join(directory, f"{kind}.parquet")
+                part = part.drop(columns="day")
+                if os.path.exists(path):
+                    part = pd.concat([pq.read_table(path).to_pandas(), part], ignore_index=True).drop_duplicates(key, keep="last")
+                os.makedirs(directory, exist_ok=True)
+                tmp = path + ".tmp"
+                pq.write_table(pa.Table.from_pandas(part, schema=self.schemas[table], preserve_index=False), tmp)
+                os.replace(tmp, path)
+        logger.info(f"🗄️  Archived {len(bills)} {kind} bills of {account} into {len(days)} day partitions in {time.time() - started:.2f}s")
+        return len(days)
+
+    def dataset(self, table: str):
+        pa, ds, _ = _pyarrow()
+        partitioning = ds.partitioning(pa.schema([("account", pa.string()), ("day", pa.string())]), flavor="hive")
+        return ds.dataset(os.path.join(self.root, table), schema=self.schemas[table].append(pa.field("account", pa.string())).append(pa.field("day", pa.string())),
+                          format="parquet", partitioning=partitioning)
+
+    def query(self, table: str, *, columns: Optional[list[str]] = None, accounts: Optional[list[str]] = None,
+              start: Optional[str] = None, end: Optional[str] = None, where=None) -> "pd.DataFrame":
+        """
+        Rows of *table* for *accounts* and days in [start, end] (YYYY-MM-DD).
+        *where* is an extra `pyarrow.dataset` expression, e.g. `ds.field("status") == "valid"`.
+        """
+        _, ds, _ = _pyarrow()
+        if not os.path.isdir(os.path.join(self.root, table)):
+            return _pandas().DataFrame(columns=columns or self.schemas[table].names)
+        expr = None
+        for part in (
+            ds.field("account").isin(accounts) if accounts else None,
+            ds.field("day") >= start if start else None,
+            ds.field("day") <= end if end else None,
+            where,
+        ):
+            if part is not None:
+                expr = part if expr is None else expr & part
+        return self.dataset(table).to_table(columns=columns, filter=expr).to_pandas()
+
+    def revenue_by_payment_origin(self, start: str, end: str, accounts: Optional[list[str]] = None) -> "pd.DataFrame":
+        """Base, tax and total of bill lines per paymentOrigin (and account) between two days."""
+        lines = self.query("lines", columns=["account", "payment_origin", "base_amount", "tax_amount"], accounts=accounts, start=start, end=end)
+        out = lines.groupby(["account", "payment_origin"], as_index=False)[["base_amount", "tax_amount"]].sum()
+        out["total"] = out["base_amount"] + out["tax_amount"]
+        return out.sort_values("total", ascending=False).round(2)
+
+    def stats(self) -> "pd.DataFrame":
+        bills = self.query("bills", columns=["account", "day"])
+        if bills.empty:
+            return bills
+        return bills.groupby("account").agg(bills=("day", "size"), first_day=("day", "min"), last_day=("day", "max")).reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local columnar archive of Clorian bills.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Archive a JSON dump of raw bills (e.g. normal_bills.json)")
+    imp.add_argument("path")
+    imp.add_argument("--account", required=True)
+    imp.add_argument("--kind", choices=("normal", "simplified"), default="normal")
+    rev = sub.add_parser("revenue", help="Revenue by paymentOrigin")
+    rev.add_argument("--start", required=True, help="YYYY-MM-DD")
+    rev.add_argument("--end", required=True, help="YYYY-MM-DD")
+    rev.add_argument("--account", action="append")
+    sub.add_parser("stats", help="Bills and day range per account")
+    parser.add_argument("--root", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    archive = BillArchive(args.root)
+    started = time.perf_counter()
+    if args.command == "import":
+        with open(args.path) as f:
+            archive.write(args.account, args.kind, json.load(f))
+    elif args.command == "revenue":
+        print(archive.revenue_by_payment_origin(args.start, args.end, args.account).to_string(index=False))
+    else:
+        print(archive.stats().to_string(index=False))
+    logger.info(f"⏱️  {args.command} took {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    main()
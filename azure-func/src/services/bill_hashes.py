@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+from src.services.bill_model import ClorianBill
+from src.services.sync_state import AccountLock
+from src.config.settings import STATE_DIR, _slug
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+HASH_DIR = os.path.join(STATE_DIR, "hashes")
+CHANGES_DIR = os.path.join(STATE_DIR, "changes")
+
+
+def bill_hash(bill: ClorianBill) -> str:
+    """
+    Canonical content hash of everything `transform_invoice_clorian_to_holded`
+    (and the contact it resolves) reads, plus status/annulation so annulled
+    bills show up as changed.
+    """
+    canonical = (
+        bill.bill_number, bill.date_ts, bill.status, bill.annulation, bill.client_id,
+        bill.nif, bill.legal_entity_name, bill.first_name, bill.last_name1, bill.last_name2,
+        bill.address, bill.city, bill.postal_code, bill.country,
+        bill.tax_pct, bill.payment_origin,
+        [(l.reservation_id, l.product_id, l.subtotal) for l in bill.lines],
+    )
+    data = json.dumps(canonical, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+class BillHashStore:
+    """
+    bill number → content hash of the version last pushed to Holded
+    (STATE_DIR/hashes/<account>.json). Long-lived services keep the store
+    between runs: `stale()` tells when another process rewrote the file, and
+    `save()` merges its own puts into whatever is on disk.
+    """
+    def __init__(self, account: str, *, state_dir: str = HASH_DIR):
+        self.account = account
+        self.path = os.path.join(state_dir, f"{_slug(account)}.json")
+        self._changed: Dict[str, str] = {}
+        self.hashes, self._mtime = self._read()
+
+    def _read(self) -> tuple[Dict[str, str], Optional[int]]:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path) as f:
+                return json.load(f), mtime
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}, None
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @property
+    def _dirty(self) -> bool:
+        return bool(self._changed)
+
+    def stale(self) -> bool:
+        """The file changed since it was read or written here (timer run, `--ack`) and nothing is pending."""
+        return not self._changed and self._file_mtime() != self._mtime
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def get(self, bill_number: str) -> Optional[str]:
+        return self.hashes.get(bill_number)
+
+    def put(self, bill_number: str, digest: str) -> None:
+        if self.hashes.get(bill_number) != digest:
+            self.hashes[bill_number] = digest
+            self._changed[bill_number] = digest
+
+    def save(self) -> None:
+        if not self._changed:
+            return
+        try:
+            if self._file_mtime() != self._mtime:
+                # rewritten meanwhile by another run or an ack: keep its entries, apply ours on top
+                self.hashes, _ = self._read()
+                self.hashes.update(self._changed)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.hashes, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self._changed = {}
+            self._mtime = self._file_mtime()
+        except OSError as e:
+            logger.warning(f"⚠️  Could not persist bill hashes for {self.account}: {e}")
+
+
+# CHANGED BILLS
+def changes_path(account: str) -> str:
+    return os.path.join(CHANGES_DIR, f"{_slug(account)}.ndjson")
+
+
+def record_change(account: str, bill: ClorianBill, old_hash: str, new_hash: str) -> None:
+    """
+    Queue a bill that changed after it was pushed (update / rectificativa handled
+    separately). Its hash is not advanced until the change is acknowledged.
+    """
+    path = changes_path(account)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps({
+            "bill": bill.bill_number,
+            "bill_id": bill.bill_id,
+            "status": bill.status,
+            "annulation": bill.annulation,
+            "old_hash": old_hash,
+            "new_hash": new_hash,
+            "detected_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        }, ensure_ascii=False) + "\n")
+
+
+def load_changes(account: str) -> list[dict]:
+    """Pending changed bills of *account*, oldest first."""
+    try:
+        with open(changes_path(account)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def pending_changes(account: str) -> Dict[str, dict]:
+    """Latest queued change per bill number of *account*."""
+    return {c["bill"]: c for c in load_changes(account)}
+
+
+def acknowledge_changes(account: str, bill_numbers: list[str]) -> list[dict]:
+    """
+    The changes of *bill_numbers* were handled in Holded (rectificativa or
+    update issued by hand): drop them from the queue and take their new hash
+    as the pushed version. Returns the acknowledged changes.
+    """
+    changes = load_changes(account)
+    done = {n: c for n, c in pending_changes(account).items() if n in bill_numbers}
+    if not done:
+        return []
+    store = BillHashStore(account)
+    for number, change in done.items():
+        store.put(number, change["new_hash"])
+    store.save()
+    path = changes_path(account)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        for c in changes:
+            if c["bill"] not in done:
+                f.write(json.dumps(c, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    return list(done.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or acknowledge bills that changed in Clorian after they were pushed to Holded.")
+    parser.add_argument("--account", required=True, help="Clorian account name")
+    parser.add_argument("--ack", action="append", metavar="BILL_NUMBER", help="Mark the change of BILL_NUMBER as handled (repeatable)")
+    args = parser.parse_args()
+
+    if not args.ack:
+        for c in pending_changes(args.account).values():
+            print(f"{c['bill']:<20} {c['detected_at']}  status={c['status']} annulation={c['annulation']}")
+        return
+    # the hash store is per account and both kinds rewrite it: not while either is pushing this account
+    with AccountLock(args.account, "normal", "changes ack"), AccountLock(args.account, "simplified", "changes ack"):
+        done = acknowledge_changes(args.account, args.ack)
+    logger.info(f"✅ {len(done)} changes of {args.account} acknowledged: {', '.join(c['bill'] for c in done) or '-'}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    main()
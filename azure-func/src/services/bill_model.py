@@ -0,0 +1,179 @@
+import sys
+import json
+import os
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, Optional, Tuple
+
+BILL_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _round2(x: float) -> float:
+    return float(Decimal(str(x)).quantize(Decimal("0.01"), ROUND_HALF_UP))
+
+
+def _str(value: Any) -> str:
+    """Intern short repeated strings (country, origin, series...) so 100k bills share them."""
+    return sys.intern(value) if isinstance(value, str) else ""
+
+
+@dataclass(slots=True)
+class BillLine:
+    reservation_id: Optional[int]
+    product_id: Optional[int]  # only present on some Clorian accounts
+    base_amount: float
+    tax_amount: float
+    subtotal: float            # base amount rounded to 2 decimals (Holded item subtotal)
+    payment_origin: str        # lower-cased paymentOrigin
+
+    @classmethod
+    def from_dict(cls, line: Dict[str, Any]) -> "BillLine":
+        base = line.get("billLineBaseAmount", 0) or 0
+        return cls(
+            reservation_id=line.get("reservationId"),
+            product_id=line.get("productId"),
+            base_amount=base,
+            tax_amount=line.get("billLineTaxAmount", 0) or 0,
+            subtotal=_round2(base),
+            payment_origin=_str((line.get("paymentOrigin") or "").lower()),
+        )
+
+
+@dataclass(slots=True)
+class BillTax:
+    tax_rate: float
+    tax_amount: float
+    tax_basis: float
+
+    @classmethod
+    def from_dict(cls, tax: Dict[str, Any]) -> "BillTax":
+        return cls(
+            tax_rate=tax.get("taxRate", 0) or 0,
+            tax_amount=tax.get("taxAmount", 0) or 0,
+            tax_basis=tax.get("taxBasis", 0) or 0,
+        )
+
+
+@dataclass(slots=True)
+class ClorianBill:
+    """
+    Compact view of a Clorian bill (/ws/bills/normal or /ws/bills/simplified).
+
+    Only the fields used by the Holded transforms are kept; `billDate`, amounts,
+    tax rate, payment origin and NIF are parsed once here instead of on every use.
+    """
+    bill_id: Optional[int]
+    bill_number: str
+    bill_date: str             # original "YYYY-mm-dd HH:MM:SS" (sortable)
+    date_ts: int               # bill_date as unix timestamp (same semantics as the old strptime path)
+    simplified: bool
+    status: str
+    annulation: bool
+    client_id: Optional[int]
+    base_amount: float
+    tax_amount: float
+    nif: str                   # vatNumber stripped + upper-cased ("" when missing)
+    person_type: str
+    legal_entity_name: str
+    first_name: str
+    last_name1: str
+    last_name2: str
+    email: str
+    phone: str
+    address: str
+    city: str
+    state: str
+    postal_code: str
+    country: str
+    tax_pct: float             # tax rate applied to every line, already in percent
+    payment_origin: str        # paymentOrigin of the first line, lower-cased
+    lines: Tuple[BillLine, ...]
+    taxes: Tuple[BillTax, ...]
+
+    @classmethod
+    def from_dict(cls, bill: Dict[str, Any]) -> "ClorianBill":
+        bill_id = bill.get("billId")
+        bill_date = bill.get("billDate") or ""
+        date_ts = int(datetime.strptime(bill_date, BILL_DATE_FORMAT).timestamp()) if bill_date else 0
+
+        raw_taxes = bill.get("billTaxes") or []
+        default_rate = raw_taxes[0]["taxRate"] if raw_taxes else 0
+        rate = next((t["taxRate"] for t in raw_taxes if t.get("billId") == bill_id), default_rate)
+        tax_pct = round(rate * 100, 2) if rate <= 1 else round(rate, 2)
+
+        raw_lines = bill.get("billLines") or []
+        lines = tuple(BillLine.from_dict(l) for l in raw_lines)
+
+        return cls(
+            bill_id=bill_id,
+            bill_number=bill.get("billNumber", ""),
+            bill_date=bill_date,
+            date_ts=date_ts,
+            simplified=bool(bill.get("simplified")),
+            status=_str(bill.get("status") or ""),
+            annulation=bool(bill.get("annulation")),
+            client_id=bill.get("clientId"),
+            base_amount=bill.get("baseAmount", 0) or 0,
+            tax_amount=bill.get("taxAmount", 0) or 0,
+            nif=(bill.get("vatNumber") or "").strip().upper(),
+            person_type=_str((bill.get("personType") or "").upper()),
+            legal_entity_name=bill.get("legalEntityName") or "",
+            first_name=bill.get("firstName") or "",
+            last_name1=bill.get("lastName1") or "",
+            last_name2=bill.get("lastName2") or "",
+            email=bill.get("email") or "",
+            phone=bill.get("mobile") or bill.get("telephone") or "",
+            address=bill.get("address") or "",
+            city=bill.get("city") or "",
+            state=bill.get("state") or "",
+            postal_code=bill.get("postalCode") or "",
+            country=_str((bill.get("country") or "")[:2].upper()),
+            tax_pct=tax_pct,
+            payment_origin=lines[0].payment_origin if lines else "",
+            lines=lines,
+            taxes=tuple(BillTax.from_dict(t) for t in raw_taxes),
+        )
+
+    @property
+    def has_nif(self) -> bool:
+        return bool(self.nif)
+
+    @property
+    def day(self) -> str:
+        return self.bill_date[:10]
+
+
+# MEMORY MEASUREMENT
+def measure_memory(fixture: str, n: int = 100_000) -> dict:
+    """
+    Compare the retained memory of *n* bills kept as raw Clorian dicts versus
+    `ClorianBill` objects. The fixture is replicated until *n* bills are reached.
+    """
+    with open(fixture) as f:
+        sample = f.read()
+    base = json.loads(sample)
+    reps = -(-n // len(base))
+    blob = "[" + ",".join([sample.strip()[1:-1]] * reps) + "]"
+
+    tracemalloc.start()
+    dicts = json.loads(blob)[:n]
+    dict_bytes, _ = tracemalloc.get_traced_memory()
+
+    bills = [ClorianBill.from_dict(b) for b in dicts]
+    del dicts
+    slotted_bytes, _ = tracemalloc.get_traced_memory()      # only what the bills retain
+    tracemalloc.stop()
+
+    return {
+        "bills": len(bills),
+        "dict_mb_per_100k": round(dict_bytes / len(bills) * 100_000 / 2**20, 1),
+        "slotted_mb_per_100k": round(slotted_bytes / len(bills) * 100_000 / 2**20, 1),
+    }
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for name in ("normal_bills.json", "simplified_bills.json"):
+        print(name, measure_memory(os.path.join(root, name)))
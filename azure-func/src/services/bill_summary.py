@@ -0,0 +1,114 @@
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.services.bill_model import ClorianBill
+from src.config.settings import STATE_DIR, _slug
+
+
+@dataclass(slots=True)
+class SummaryLine:
+    tax_pct: float
+    payment_origin: str
+    subtotal: float = 0.0
+    bills: int = 0
+
+
+@dataclass(slots=True)
+class SummaryInvoice:
+    """One Holded invoice standing for every simplified bill of a day and series."""
+    account: str
+    day: str                   # YYYY-mm-dd
+    series: str                # ALEFS25
+    number: str                # ALEFS25-R20250701
+    date_ts: int = 0           # latest bill of the group
+    lines: Dict[Tuple[float, str], SummaryLine] = field(default_factory=dict)
+    bill_numbers: List[str] = field(default_factory=list)
+
+    @property
+    def payment_origins(self) -> set:
+        return {origin for _, origin in self.lines}
+
+    def add(self, bill: ClorianBill) -> None:
+        """Fold *bill* into its (tax rate, payment origin) line."""
+        self.date_ts = max(self.date_ts, bill.date_ts)
+        self.bill_numbers.append(bill.bill_number)
+
+        key = (bill.tax_pct, bill.payment_origin)
+        line = self.lines.get(key)
+        if line is None:
+            line = self.lines[key] = SummaryLine(bill.tax_pct, bill.payment_origin)
+        line.subtotal += sum(l.subtotal for l in bill.lines)
+        line.bills += 1
+
+
+def bill_series(bill_number: str) -> str:
+    """ALEFS25-00006831 → ALEFS25"""
+    return bill_number.rsplit("-", 1)[0]
+
+
+def summary_number(series: str, day: str) -> str:
+    return f"{series}-R{day.replace('-', '')}"
+
+
+def summarize_bills(bills: Iterable[ClorianBill], account: str, *, until_day: Optional[str] = None) -> List[SummaryInvoice]:
+    """
+    Group simplified bills per (day, series) into summary invoices with one
+    line per (tax rate, payment origin). Days >= `until_day` are still open
+    and left out so a summary is only ever pushed once, complete.
+    """
+    summaries: Dict[Tuple[str, str], SummaryInvoice] = {}
+    for bill in bills:
+        day = bill.day
+        if until_day and day >= until_day:
+            continue
+        series = bill_series(bill.bill_number)
+        inv = summaries.get((day, series))
+        if inv is None:
+            inv = summaries[(day, series)] = SummaryInvoice(account, day, series, summary_number(series, day))
+        inv.add(bill)
+
+    return sorted(summaries.values(), key=lambda s: (s.day, s.series))
+
+
+# TRACEABILITY
+def summary_map_path(account: str) -> str:
+    return os.path.join(STATE_DIR, "summary_map", f"{_slug(account)}.ndjson")
+
+
+def record_summary_mapping(summary: SummaryInvoice) -> None:
+    """Append `bill → summary invoice` rows so every ticket can be traced to its Holded invoice."""
+    path = summary_map_path(summary.account)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        for bill_number in summary.bill_numbers:
+            f.write(json.dumps({"bill": bill_number, "summary": summary.number, "day": summary.day}) + "\n")
+
+
+def load_summary_mapping(account: str) -> Dict[str, str]:
+    """Return {bill number: summary invoice number} for *account*."""
+    mapping: Dict[str, str] = {}
+    try:
+        with open(summary_map_path(account)) as f:
+            for line in f:
+                row = json.loads(line)
+                mapping[row["bill"]] = row["summary"]
+    except FileNotFoundError:
+        pass
+    return mapping
+
+
+def load_summary_coverage(account: str) -> Dict[Tuple[str, str], Tuple[Set[str], Set[str]]]:
+    """Return {(day, series): (summary invoices issued, bill numbers they cover)} for *account*."""
+    coverage: Dict[Tuple[str, str], Tuple[Set[str], Set[str]]] = {}
+    try:
+        with open(summary_map_path(account)) as f:
+            for line in f:
+                row = json.loads(line)
+                numbers, bills = coverage.setdefault((row["day"], bill_series(row["bill"])), (set(), set()))
+                numbers.add(row["summary"])
+                bills.add(row["bill"])
+    except FileNotFoundError:
+        pass
+    return coverage
@@ -1,8 +1,10 @@
 import asyncio
 import aiohttp
 import logging
+import inspect
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Optional, Union, List
+from typing import Optional, Union, List, AsyncIterator
 import time
 import json
 import base64
@@ -10,9 +12,15 @@ import time
 import re
 import unicodedata
 from urllib.parse import quote_plus
+from aiohttp import ClientTimeout
 from aiohttp.client_exceptions import ClientConnectorError, ClientConnectorDNSError
 
-from src.config.settings import update_auth_token, get_auth_token, update_refresh_token, get_refresh_token, get_clorian_account
+from src.services.hedging import HEDGE_ENABLED, Hedger
+from src.services.json_stream import iter_json_array
+from src.services.resilience import Deadline, DeadlineExceeded, RetryBudget, RunLimits, get_breaker, get_limiter, spend_retry
+from src.services.tracing import start_span, traced
+from src.services.warm_cache import clorian_tokens
+from src.config.settings import CLORIAN_BASE_URL, CLORIAN_PUBLIC_URL, update_auth_token, get_auth_token, update_refresh_token, get_refresh_token, get_clorian_account
 
 AUTH_HEADER = "Basic " + base64.b64encode(
     b"third-party:dGhpcmRQYXJ0eVBhc3M="
@@ -21,8 +29,22 @@ AUTH_HEADER = "Basic " + base64.b64encode(
 # Configure logging
 logger = logging.getLogger(__name__)
 
-class ClorianService:
-    def __init__(self, clorian_account: str):
+# Timeout profile per kind of Clorian call (capped by the run deadline)
+TIMEOUTS = {
+    "auth":  ClientTimeout(total=30, sock_connect=10, sock_read=20),    # token endpoint
+    "read":  ClientTimeout(total=60, sock_connect=10, sock_read=45),    # single bill / product master
+    "slice": ClientTimeout(total=180, sock_connect=10, sock_read=90),   # one 24-hour slice of bills / purchases
+}
+
+class SliceFailed(RuntimeError):
+    """A bills slice that did not come back as a 200 (status None: network retries exhausted)."""
+    def __init__(self, status: Optional[int], what: str):
+        super().__init__(f"Clorian slice {what} failed" + (f" with HTTP {status}" if status else " (network)"))
+        self.status = status
+
+
+class ClorianService(RunLimits):
+    def __init__(self, clorian_account: str, *, retry_budget: RetryBudget | None = None, deadline: Deadline | None = None):
         config = get_clorian_account(clorian_account)
 
         self.name = config.get("name", "Clorian Service")
@@ -31,6 +53,15 @@ class ClorianService:
         self._refresh_token = config.get("refresh_token")
         self.base_url = "https://api.clorian.com"
 
+        # Shared per-host breaker and per-run retry budget (see src.services.resilience)
+        self.retry_budget = retry_budget
+        self.breaker = get_breaker(CLORIAN_BASE_URL)
+        self.deadline = deadline or Deadline()
+        # slice latency history survives between calls so hedging has a threshold from the start
+        self.hedger = Hedger()
+        # windows of the last fetch per endpoint that failed after every retry (reported as errors)
+        self.failed_slices: dict[str, list[str]] = {}
+
         # OAuth client id used for token exchange (fixed per third-party integration)
         self.client_id = "third-party"
 
@@ -43,10 +74,19 @@ class ClorianService:
                 f"Missing 'client_id' or 'pos' for Clorian account '{self.name}' in credentials.json"
             )
 
+        # a warm worker reuses the token of a previous invocation while it is valid
+        cached = clorian_tokens.get(self.name)
+        if cached:
+            self.access_token = cached["access_token"]
+            self._refresh_token = cached["refresh_token"] or self._refresh_token
+            self.expires_at = cached["expires_at"]
+            self.pos = cached["pos"]
+
     # RENEW TOKENS
+    @traced("clorian.token_refresh", lambda self: {"account": self.name})
     async def refresh_token(self) -> str:
         logger.debug(f"🔑 Refreshing token for Clorian account: {self.name}")
-        url = "https://services.clorian.com/user/oauth/token"
+        url = f"{CLORIAN_BASE_URL}/user/oauth/token"
         headers = {
             "Authorization": AUTH_HEADER,
             "Content-Type": "application/x-www-form-urlencoded",
@@ -56,19 +96,26 @@ class ClorianService:
         data = {"grant_type": "refresh_token", "refresh_token": self._refresh_token} if self._refresh_token else None
         auth_method = "refresh_token" if data else "password"
         logger.debug(f"🔐 Using authentication method: {auth_method} for {self.name}")
-        async with aiohttp.ClientSession() as s:
-            if data:
-                r = await s.post(url, headers=headers, data=data)
-                if r.status in (400, 401):
-                    data = None
-                else:
-                    r.raise_for_status()
-                    j = await r.json()
-            if not data:
-                data = {"grant_type": "password", "username": self.username, "password": self.password}
-                r = await s.post(url, headers=headers, data=data)
-                r.raise_for_status()
-                j = await r.json()
+        try:
+            with self.breaker.guard():
+                async with aiohttp.ClientSession(timeout=self._timeout("auth")) as s:
+                    if data:
+                        r = await s.post(url, headers=headers, data=data)
+                        self._record(r.status)
+                        if r.status in (400, 401):
+                            data = None
+                        else:
+                            r.raise_for_status()
+                            j = await r.json()
+                    if not data:
+                        data = {"grant_type": "password", "username": self.username, "password": self.password}
+                        r = await s.post(url, headers=headers, data=data)
+                        self._record(r.status)
+                        r.raise_for_status()
+                        j = await r.json()
+        except (ClientConnectorError, ClientConnectorDNSError, asyncio.TimeoutError):
+            self.breaker.record_failure()
+            raise
 
         # Set variables of token saving
         self.access_token   = j["access_token"]
@@ -97,9 +144,13 @@ class ClorianService:
             logger.warning(f"⚠️  Could not set POS from token posAllowed: {e}")
 
         logger.debug(f"✅ Successfully obtained new tokens for {self.name}")
+        clorian_tokens.put(self.name, {"access_token": self.access_token, "refresh_token": self._refresh_token,
+                                       "expires_at": self.expires_at, "pos": self.pos}, ttl=max(0.0, self.expires_at - time.time()))
         logger.debug(f"🔑 Access token expires in {j.get('expires_in', 3600)} seconds")
 
-        # Save tokens (may fail in Azure Functions due to read-only filesystem)
+        # Save tokens (may fail in Azure Functions due to read-only filesystem); a mock host's never overwrite the real ones
+        if CLORIAN_BASE_URL != CLORIAN_PUBLIC_URL:
+            return
         try:
             logger.debug(f"💾 Attempting to persist tokens for {self.name}")
             update_auth_token(self.name, self.access_token)
@@ -111,18 +162,77 @@ class ClorianService:
             logger.info(f"🔄 {self.name} tokens will be refreshed on next execution")
    
 
-    # BILLS OPERATIONS
-    async def get_bills(self, days_back: int = 365, *, start_date: Optional[Union[datetime, str]] = None, end_date:   Optional[Union[datetime, str]] = None, concurrency: int = 10):
+    def _record(self, status: int) -> None:
+        """Feed the Clorian breaker: 5xx counts as a failure, anything else proves the host is up."""
+        if status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    async def _network_retry(self, attempt: int, what: str) -> None:
+        """Connect/DNS error or timeout on *attempt*: trip the breaker, then wait before the single retry."""
+        self.breaker.record_failure()
+        if attempt == 1:
+            self.deadline.check(2, f"Clorian retry of {what}")
+            spend_retry(self.retry_budget, "clorian")
+            await asyncio.sleep(2)
+        else:
+            print(f"[WARN] network error on {what}")
+
+    def _timeout(self, op: str) -> ClientTimeout:
+        """Timeout of *op* capped to what is left of the run deadline (DeadlineExceeded when spent)."""
+        return self.deadline.client_timeout(TIMEOUTS[op], f"Clorian {op} request for {self.name}")
+
+    @asynccontextmanager
+    async def _get(self, session: aiohttp.ClientSession, url: str, headers: dict, on_start=None):
         """
-        Fetch simplified bills (/ws/bills/simplified).
+        GET *url* behind the breaker and the host's adaptive concurrency limiter.
+        The slot is held, and latency measured, until the caller is done with the body.
         """
-        # RETRIVE ACCES TOKEN
+        with self.breaker.guard():
+            async with self.limiter.slot() as started:
+                status = None
+                if on_start is not None:
+                    on_start()
+                span = start_span("clorian.request", account=self.name, url=url.split("?")[0])
+                try:
+                    async with session.get(url, headers=headers, timeout=self._timeout("slice")) as r:
+                        status = r.status
+                        self._record(r.status)
+                        span.set(status=r.status, bytes=r.content_length)
+                        yield r
+                except asyncio.CancelledError:
+                    started = None              # lost a hedge race: says nothing about Clorian's health
+                    span.set(cancelled=True)
+                    raise
+                except asyncio.TimeoutError as e:
+                    span.fail(e)
+                    if self.deadline.expired:
+                        raise DeadlineExceeded(f"Deadline reached while fetching {url}") from e
+                    raise
+                except Exception as e:
+                    span.fail(e)
+                    raise
+                finally:
+                    span.end()
+                    if started is not None:
+                        self.limiter.record(status, started)
+
+    # BILLS OPERATIONS
+    async def _ensure_token(self) -> None:
         if not getattr(self, "access_token", None) or time.time() >= getattr(self, "expires_at", 0):
             await self.refresh_token()
 
-        # Use account-specific clientId and POS from credentials
+    def _headers(self) -> dict:
+        return {
+            "Accept": "application/json",
+            "Authorization": f"Bearer {self.access_token}",
+            "pos": str(self.pos),
+        }
 
-        # compute date range
+    @staticmethod
+    def _date_range(days_back: int, start_date: Optional[Union[datetime, str]], end_date: Optional[Union[datetime, str]]) -> tuple[datetime, datetime]:
+        """Resolve the [from, end] range used by the bills endpoints (whole days)."""
         if end_date is None:
             utc_end = datetime.utcnow()
         elif isinstance(end_date, str):
@@ -139,146 +249,215 @@ class ClorianService:
 
         utc_end  = utc_end.replace(hour=23, minute=59, second=59, microsecond=0)
         utc_from = utc_from.replace(hour=0,  minute=0, second=0, microsecond=0)
+        return utc_from, utc_end
 
-        # 24-hour slices
+    @staticmethod
+    def _day_windows(utc_from: datetime, utc_end: datetime):
+        """Yield (index, start, end) 24-hour slices formatted as YYYYmmddHHMMSS."""
         one_day = timedelta(days=1)
-        windows = []
         cursor  = utc_from.replace(hour=0, minute=0, second=0, microsecond=0)
         idx     = 0
         while cursor <= utc_end:
             start = cursor.strftime("%Y%m%d%H%M%S")
             end   = min(cursor + one_day - timedelta(seconds=1), utc_end)
             end   = end.strftime("%Y%m%d%H%M%S")
-            windows.append((idx, start, end))
+            yield idx, start, end
             cursor += one_day
             idx += 1
 
-        sem   = asyncio.Semaphore(concurrency)
-        bills = []
+    @staticmethod
+    def _exact_windows(utc_from: datetime, utc_end: datetime):
+        """Like `_day_windows` but keeping the exact bounds (sub-day polling windows); split at midnight."""
+        cursor = utc_from.replace(microsecond=0)
+        idx    = 0
+        while cursor <= utc_end:
+            next_day = cursor.replace(hour=0, minute=0, second=0) + timedelta(days=1)
+            end      = min(next_day - timedelta(seconds=1), utc_end)
+            yield idx, cursor.strftime("%Y%m%d%H%M%S"), end.strftime("%Y%m%d%H%M%S")
+            cursor = next_day
+            idx += 1
 
-        async def fetch_slice(session, index, start_s, end_s):
-            url = (
-                f"https://services.clorian.com/ws/bills/simplified"
-                f"?clientId={self.clorian_client_id}&startDatetime={start_s}&endDatetime={end_s}"
-                f"&showAnnulationLines=true"
-            )
-            headers = {
-                "Accept": "application/json",
-                "Authorization": f"Bearer {self.access_token}",
-                "pos": str(self.pos),
-            }
+    def _bills_url(self, endpoint: str, start_s: str, end_s: str) -> str:
+        return (
+            f"{CLORIAN_BASE_URL}/ws/bills/{endpoint}"
+            f"?clientId={self.clorian_client_id}&startDatetime={start_s}&endDatetime={end_s}"
+            f"&showAnnulationLines=true"
+        )
 
-            for attempt in (1, 2):
-                try:
-                    async with sem, session.get(url, headers=headers) as r:
-                        if r.status == 401:
-                            await self.refresh_token()
-                            headers["Authorization"] = f"Bearer {self.access_token}"
-                            continue
-                        if r.status == 200:
-                            return index, (await r.json() or [])
-                        return index, []
-                except (ClientConnectorError, ClientConnectorDNSError):
-                    if attempt == 1:
-                        await asyncio.sleep(2)
-                    else:
-                        print(f"[WARN] network error on {start_s}-{end_s}")
+    async def _fetch_bills(self, endpoint: str, days_back: int, start_date, end_date, concurrency: int, hedge: Optional[bool] = None, on_slice=None) -> list:
+        """
+        Fetch /ws/bills/{endpoint} in parallel 24-hour slices, in chronological order.
+        In-flight slices follow the adaptive Clorian limiter (`concurrency` is its starting value).
+        With `hedge` (default: SYNC_HEDGE) slow slices get a second, racing request.
+        With `on_slice(index, bills)` (may be async) every slice is handed over as
+        soon as it arrives and not kept here; the return value is then empty.
+        """
+        utc_from, utc_end = self._date_range(days_back, start_date, end_date)
+        return await self._fetch_windows(endpoint, list(self._day_windows(utc_from, utc_end)), concurrency, hedge, on_slice)
+
+    async def _fetch_windows(self, endpoint: str, windows: list, concurrency: int, hedge: Optional[bool] = None, on_slice=None) -> list:
+        await self._ensure_token()
+        self.limiter = get_limiter(CLORIAN_BASE_URL, initial=concurrency)
+
+        async def fetch_slice(session, index, start_s, end_s, on_start=None):
+            """(index, bills) of one slice; SliceFailed on any non-200 or when the network retry is spent."""
+            url = self._bills_url(endpoint, start_s, end_s)
+            headers = self._headers()
+            status = None
+
+            with start_span("clorian.window", account=self.name, endpoint=endpoint, start=start_s, end=end_s) as span:
+                for attempt in (1, 2):
+                    try:
+                        async with self._get(session, url, headers, on_start) as r:
+                            status = r.status
+                            if r.status == 401:
+                                await self.refresh_token()
+                                headers["Authorization"] = f"Bearer {self.access_token}"
+                                continue
+                            if r.status == 200:
+                                bills = await r.json() or []
+                                span.set(status=200, bills=len(bills), attempts=attempt)
+                                return index, bills
+                            span.set(status=r.status, bills=0, attempts=attempt)
+                            if r.status == 429 or r.status >= 500:
+                                self.hedger.pause()          # Clorian is pushing back: no extra hedge load
+                            raise SliceFailed(r.status, f"{start_s}-{end_s}")
+                    except (ClientConnectorError, ClientConnectorDNSError, asyncio.TimeoutError):
+                        status = None
+                        await self._network_retry(attempt, f"{start_s}-{end_s}")
+                raise SliceFailed(status, f"{start_s}-{end_s}")
+
+        failed = self.failed_slices[endpoint] = []
+
+        async def settle(coro, window):
+            # a failed slice (after the hedge, if any, failed too) is left empty and reported in failed_slices
+            try:
+                return await coro
+            except SliceFailed as e:
+                logger.error(f"❌ {self.name}/{endpoint}: {e}, slice left empty")
+                failed.append(f"{window[1]}-{window[2]}")
+                return window[0], []
+
+        async def collect(coro, window):
+            index, bills = await settle(coro, window)
+            if on_slice is None:
+                return index, bills
+            handed = on_slice(index, bills)
+            if inspect.isawaitable(handed):
+                await handed
             return index, []
 
-        # parallel fetch
-        connector = aiohttp.TCPConnector(limit_per_host=concurrency)
-        async with aiohttp.ClientSession(connector=connector) as sess:
-            results = await asyncio.gather(*(fetch_slice(sess, *w) for w in windows))
+        # parallel fetch (the limiter decides how many slices are in flight)
+        connector = aiohttp.TCPConnector(limit_per_host=self.limiter.maximum)
+        async with aiohttp.ClientSession(connector=connector, timeout=TIMEOUTS["slice"]) as sess:
+            if HEDGE_ENABLED if hedge is None else hedge:
+                self.hedger.start_batch(len(windows))
+                results = await asyncio.gather(*(collect(self.hedger.run(lambda on_start, w=w: fetch_slice(sess, *w, on_start)), w) for w in windows))
+                await self.hedger.drain_shadows()
+                logger.info(f"🪁 Hedging {self.name}/{endpoint}: {self.hedger.report()}")
+            else:
+                results = await asyncio.gather(*(collect(fetch_slice(sess, *w), w) for w in windows))
 
         # keep chronological order
         results.sort(key=lambda t: t[0])
         ordered = [bill for _, chunk in results for bill in chunk]
         return ordered
 
-    async def get_bills_v2(self, days_back: int = 365, *, start_date: Optional[Union[datetime, str]] = None, end_date:   Optional[Union[datetime, str]] = None, concurrency: int = 10):
+    async def get_bills(self, days_back: int = 365, *, start_date: Optional[Union[datetime, str]] = None, end_date:   Optional[Union[datetime, str]] = None, concurrency: int = 10, hedge: Optional[bool] = None, on_slice=None):
         """
-        Fetch normal bills (/ws/bills/normal).
+        Fetch simplified bills (/ws/bills/simplified).
         """
-        # Ensure valid access token
-        if not getattr(self, "access_token", None) or time.time() >= getattr(self, "expires_at", 0):
-            await self.refresh_token()
-
-        # Use account-specific clientId and POS from credentials
-
-        # Compute date range
-        if end_date is None:
-            utc_end = datetime.utcnow()
-        elif isinstance(end_date, str):
-            utc_end = datetime.strptime(end_date, "%Y-%m-%d")
-        else:
-            utc_end = end_date
-
-        if start_date is None:
-            utc_from = utc_end - timedelta(days=days_back)
-        elif isinstance(start_date, str):
-            utc_from = datetime.strptime(start_date, "%Y-%m-%d")
-        else:
-            utc_from = start_date
-
-        utc_end  = utc_end.replace(hour=23, minute=59, second=59, microsecond=0)
-        utc_from = utc_from.replace(hour=0,  minute=0, second=0, microsecond=0)
-
-        # Build 24-hour windows
-        one_day = timedelta(days=1)
-        windows = []
-        cursor  = utc_from.replace(hour=0, minute=0, second=0, microsecond=0)
-        idx     = 0
-        while cursor <= utc_end:
-            start = cursor.strftime("%Y%m%d%H%M%S")
-            end   = min(cursor + one_day - timedelta(seconds=1), utc_end)
-            end   = end.strftime("%Y%m%d%H%M%S")
-            windows.append((idx, start, end))
-            cursor += one_day
-            idx += 1
+        return await self._fetch_bills("simplified", days_back, start_date, end_date, concurrency, hedge, on_slice)
 
-        sem   = asyncio.Semaphore(concurrency)
-        bills = []
+    async def get_bills_v2(self, days_back: int = 365, *, start_date: Optional[Union[datetime, str]] = None, end_date:   Optional[Union[datetime, str]] = None, concurrency: int = 10, hedge: Optional[bool] = None, on_slice=None):
+        """
+        Fetch normal bills (/ws/bills/normal).
+        """
+        return await self._fetch_bills("normal", days_back, start_date, end_date, concurrency, hedge, on_slice)
 
-        async def fetch_slice(session, index, start_s, end_s):
-            url = (
-                f"https://services.clorian.com/ws/bills/normal"
-                f"?clientId={self.clorian_client_id}&startDatetime={start_s}&endDatetime={end_s}"
-                f"&showAnnulationLines=true"
-            )
-            headers = {
-                "Accept": "application/json",
-                "Authorization": f"Bearer {self.access_token}",
-                "pos": str(self.pos),
-            }
+    async def get_bills_between(self, local_from: datetime, local_end: datetime, *, simplified: bool = False, concurrency: int = 4) -> list:
+        """
+        Bills of an exact [local_from, local_end] window, to the second (micro-batch
+        polling of the last minutes/hours instead of whole days). The bounds are
+        naive Europe/Madrid wall-clock times, the convention of billDate.
+        """
+        endpoint = "simplified" if simplified else "normal"
+        return await self._fetch_windows(endpoint, list(self._exact_windows(local_from, local_end)), concurrency, hedge=False)
 
+    async def iter_bills(self, days_back: int = 365, *, start_date: Optional[Union[datetime, str]] = None, end_date: Optional[Union[datetime, str]] = None, simplified: bool = False, concurrency: int = 10, chunk_size: int = 64 * 1024) -> AsyncIterator[dict]:
+        """
+        Stream bills one at a time instead of materialising every slice.
+
+        Each 24-hour slice is decoded incrementally from the response body, so
+        peak memory is one bill per in-flight slice plus a small queue, not one
+        day. Bills keep their order inside a slice; with `concurrency > 1`
+        slices interleave (use `concurrency=1` for strict chronological order).
+        `concurrency` workers are started; the adaptive limiter may keep fewer on the wire.
+        Slices that did not come back are listed in `failed_slices[endpoint]` once the stream ends.
+        """
+        await self._ensure_token()
+        endpoint = "simplified" if simplified else "normal"
+        utc_from, utc_end = self._date_range(days_back, start_date, end_date)
+        windows = self._day_windows(utc_from, utc_end)
+
+        self.limiter = get_limiter(CLORIAN_BASE_URL, initial=concurrency)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(16, concurrency * 4))
+        done = object()
+
+        failed = self.failed_slices[endpoint] = []
+
+        async def stream_slice(session, start_s, end_s):
+            """Queue the bills of one slice; a non-200 or a spent network retry is reported in failed_slices."""
+            url = self._bills_url(endpoint, start_s, end_s)
+            headers = self._headers()
+            status = None
             for attempt in (1, 2):
                 try:
-                    async with sem, session.get(url, headers=headers) as r:
+                    async with self._get(session, url, headers) as r:
+                        status = r.status
                         if r.status == 401:
                             await self.refresh_token()
                             headers["Authorization"] = f"Bearer {self.access_token}"
                             continue
-                        if r.status == 200:
-                            return index, (await r.json() or [])
-                        return index, []
+                        if r.status != 200:
+                            break
+                        async for bill in iter_json_array(r.content.iter_chunked(chunk_size)):
+                            await queue.put(bill)
+                        return
                 except (ClientConnectorError, ClientConnectorDNSError):
-                    if attempt == 1:
-                        await asyncio.sleep(2)
-                    else:
-                        print(f"[WARN] network error on {start_s}-{end_s}")
-            return index, []
-
-        # Parallel fetch
-        connector = aiohttp.TCPConnector(limit_per_host=concurrency)
-        async with aiohttp.ClientSession(connector=connector) as sess:
-            results = await asyncio.gather(*(fetch_slice(sess, *w) for w in windows))
-
-        # Keep chronological order
-        results.sort(key=lambda t: t[0])
-        ordered = [bill for _, chunk in results for bill in chunk]
-        return ordered
+                    status = None
+                    await self._network_retry(attempt, f"{start_s}-{end_s}")
+            logger.error(f"❌ {self.name}/{endpoint}: {SliceFailed(status, f'{start_s}-{end_s}')}, slice skipped")
+            failed.append(f"{start_s}-{end_s}")
 
+        async def worker(session):
+            try:
+                for _, start_s, end_s in windows:        # shared generator → each slice taken once
+                    await stream_slice(session, start_s, end_s)
+            except Exception as e:
+                await queue.put(e)
+            finally:
+                await queue.put(done)
+
+        connector = aiohttp.TCPConnector(limit_per_host=self.limiter.maximum)
+        async with aiohttp.ClientSession(connector=connector, timeout=TIMEOUTS["slice"]) as sess:
+            workers = [asyncio.create_task(worker(sess)) for _ in range(concurrency)]
+            try:
+                pending = len(workers)
+                while pending:
+                    item = await queue.get()
+                    if item is done:
+                        pending -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                for w in workers:
+                    w.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
 
+    @traced("clorian.get_bill", lambda self, bill_id, *a, **k: {"account": self.name, "bill_id": bill_id})
     async def get_bill_by_id(self, bill_id: int, show_annulations: bool = True) -> List[dict]:
         """Retrieve one ordinary bill by its identifier"""
 
@@ -287,7 +466,7 @@ class ClorianService:
             await self.refresh_token()
 
         # Use account-specific clientId and POS from credentials
-        base_url = "https://services.clorian.com/ws/bills/normal"
+        base_url = f"{CLORIAN_BASE_URL}/ws/bills/normal"
         url = (
             f"{base_url}?clientId={self.clorian_client_id}"
             f"&billId={bill_id}"
@@ -302,46 +481,56 @@ class ClorianService:
 
         # single request, retry once on token expiry
         for attempt in (1, 2):
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, headers=headers) as resp:
-                        if resp.status == 401 and attempt == 1:
-                            await self.refresh_token()
-                            headers["Authorization"] = f"Bearer {self.access_token}"
-                            continue                    # retry once
-                        if resp.status == 200:
-                            return await resp.json()
-                        if resp.status == 404:
-                            return None                 # bill not found
-                        raise RuntimeError(f"get_bill_by_id failed {resp.status}: {await resp.text()}")
-            except (ClientConnectorError, ClientConnectorDNSError) as e:
-                raise RuntimeError(f"Network error while fetching bill {bill_id}: {e}") from e
+            with self.breaker.guard():
+                try:
+                    async with aiohttp.ClientSession(timeout=self._timeout("read")) as session:
+                        async with session.get(url, headers=headers) as resp:
+                            self._record(resp.status)
+                            if resp.status == 401 and attempt == 1:
+                                await self.refresh_token()
+                                headers["Authorization"] = f"Bearer {self.access_token}"
+                                continue                    # retry once
+                            if resp.status == 200:
+                                return await resp.json()
+                            if resp.status == 404:
+                                return None                 # bill not found
+                            raise RuntimeError(f"get_bill_by_id failed {resp.status}: {await resp.text()}")
+                except (ClientConnectorError, ClientConnectorDNSError) as e:
+                    self.breaker.record_failure()
+                    raise RuntimeError(f"Network error while fetching bill {bill_id}: {e}") from e
 
     # PRODUCTS OPERATIONS
-    async def get_products(self) -> list:
-        """Get product master data"""
-        if not getattr(self, "access_token", None) or time.time() >= getattr(self, "expires_at", 0):
-            await self.refresh_token()
+    async def get_products_conditional(self, etag: Optional[str] = None) -> tuple[int, Optional[list], Optional[str]]:
+        """
+        Get product master data, revalidating with `If-None-Match` when an ETag is known.
+        Returns (status, products, etag); products is None on 304 (unchanged) or errors.
+        """
+        await self._ensure_token()
 
-        url = f"https://services.clorian.com/ws/masters/products?clientId={self.clorian_client_id}"
+        url = f"{CLORIAN_BASE_URL}/ws/masters/products?clientId={self.clorian_client_id}"
 
-        headers = {
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.access_token}",
-            "Accept-Language": "es",
-            "pos": str(self.pos),
-        }
+        headers = {**self._headers(), "Accept-Language": "es"}
+        if etag:
+            headers["If-None-Match"] = etag
 
-        async with aiohttp.ClientSession() as s:
-            async with s.get(url, headers=headers) as r:
-                if r.status == 200:
-                    return await r.json()
-                if r.status == 401:
-                    await self.refresh_token()
-                    headers["Authorization"] = f"Bearer {self.access_token}"
-                    async with s.get(url, headers=headers) as r2:
-                        return await r2.json() if r2.status == 200 else []
-                return []
+        with self.breaker.guard():
+            async with aiohttp.ClientSession(timeout=self._timeout("read")) as s:
+                for attempt in (1, 2):
+                    async with s.get(url, headers=headers) as r:
+                        self._record(r.status)
+                        if r.status == 401 and attempt == 1:
+                            await self.refresh_token()
+                            headers["Authorization"] = f"Bearer {self.access_token}"
+                            continue
+                        if r.status == 200:
+                            return 200, (await r.json() or []), r.headers.get("ETag")
+                        return r.status, None, etag
+        return 401, None, etag
+
+    async def get_products(self) -> list:
+        """Get product master data"""
+        _, products, _ = await self.get_products_conditional()
+        return products or []
 
     # OTHER OPERATIONS
     async def get_payment(self, payment_id: int) -> dict:
@@ -351,61 +540,83 @@ class ClorianService:
         pass
 
     # TESTING OPERATIONS
-    async def get_purchases(self, days_back: int = 5, concurrency: int = 10) -> list:
-        """Fetch every Clorian purchase from `days_back` days ago up to now."""
-        if not getattr(self, "access_token", None) or time.time() >= getattr(self, "expires_at", 0):
-            await self.refresh_token()
+    async def iter_purchases(self, days_back: int = 5, concurrency: int = 10, *, start_date: Optional[Union[datetime, str]] = None, end_date: Optional[Union[datetime, str]] = None) -> AsyncIterator[tuple[str, list]]:
+        """
+        Yield `(window_start, purchases)` for every 24-hour window, in chronological order.
+
+        At most `concurrency` windows are in flight (or buffered) at any time, so
+        callers can stream a long range without holding it all in memory.
+        """
+        await self._ensure_token()
 
         lang = "es"
-        end_dt   = datetime.utcnow()
-        start_dt = end_dt - timedelta(days=days_back)
+        if end_date is None:
+            end_dt = datetime.utcnow()
+        elif isinstance(end_date, str):
+            end_dt = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59)
+        else:
+            end_dt = end_date
+        if start_date is None:
+            start_dt = end_dt - timedelta(days=days_back)
+        elif isinstance(start_date, str):
+            start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+        else:
+            start_dt = start_date
 
         # build 24-h windows
-        one_day = timedelta(days=1)
-        ranges  = []
-        cur = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-        while cur <= end_dt:
-            ranges.append((
-                cur.strftime("%Y%m%d%H%M%S"),
-                (cur + one_day - timedelta(seconds=1)
-                if cur + one_day <= end_dt else end_dt).strftime("%Y%m%d%H%M%S")
-            ))
-            cur += one_day
-
-        sem = asyncio.Semaphore(concurrency)
-        purchases: list = []
-
-        async def fetch_range(session: aiohttp.ClientSession, start_str: str, end_str: str):
-            url = (f"https://services.clorian.com/ws/purchases"
+        def ranges():
+            one_day = timedelta(days=1)
+            cur = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+            while cur <= end_dt:
+                yield (
+                    cur.strftime("%Y%m%d%H%M%S"),
+                    (cur + one_day - timedelta(seconds=1)
+                    if cur + one_day <= end_dt else end_dt).strftime("%Y%m%d%H%M%S")
+                )
+                cur += one_day
+
+        async def fetch_range(session: aiohttp.ClientSession, start_str: str, end_str: str) -> list:
+            url = (f"{CLORIAN_BASE_URL}/ws/purchases"
                 f"?clientId={self.clorian_client_id}&startDatetime={start_str}&endDatetime={end_str}")
-            headers = {
-                "Accept": "application/json",
-                "Authorization": f"Bearer {self.access_token}",
-                "pos": str(self.pos),
-                "Accept-Language": lang,
-            }
+            headers = {**self._headers(), "Accept-Language": lang}
 
             for attempt in (1, 2):  # one retry on DNS/network error
                 try:
-                    async with sem, session.get(url, headers=headers) as r:
+                    async with self._get(session, url, headers) as r:
                         if r.status == 401:
                             await self.refresh_token()
                             headers["Authorization"] = f"Bearer {self.access_token}"
                             continue  # retry same URL with fresh token
                         if r.status == 200:
-                            purchases.extend(await r.json() or [])
-                        return
-                except (ClientConnectorError, ClientConnectorDNSError):
-                    if attempt == 1:
-                        await asyncio.sleep(2)
-                    else:
-                        print(f"[WARN] skipped {start_str}-{end_str}: DNS/connect error")
-
-        # ---- single shared session ----------------------------------------------
-        connector = aiohttp.TCPConnector(limit_per_host=concurrency)
-        async with aiohttp.ClientSession(connector=connector) as session:
-            await asyncio.gather(*(fetch_range(session, s, e) for s, e in ranges))
+                            return await r.json() or []
+                        return []
+                except (ClientConnectorError, ClientConnectorDNSError, asyncio.TimeoutError):
+                    await self._network_retry(attempt, f"{start_str}-{end_str} (skipped)")
+            return []
+
+        # ---- single shared session, sliding window of in-flight ranges ----------
+        # (`concurrency` bounds the window; the adaptive limiter bounds what is really on the wire)
+        self.limiter = get_limiter(CLORIAN_BASE_URL, initial=concurrency)
+        connector = aiohttp.TCPConnector(limit_per_host=self.limiter.maximum)
+        async with aiohttp.ClientSession(connector=connector, timeout=TIMEOUTS["slice"]) as session:
+            in_flight: list[tuple[str, asyncio.Task]] = []
+            try:
+                for start_str, end_str in ranges():
+                    in_flight.append((start_str, asyncio.create_task(fetch_range(session, start_str, end_str))))
+                    if len(in_flight) >= concurrency:
+                        head, task = in_flight.pop(0)
+                        yield head, await task
+                for head, task in in_flight:
+                    yield head, await task
+            finally:
+                for _, task in in_flight:
+                    task.cancel()
 
+    async def get_purchases(self, days_back: int = 5, concurrency: int = 10) -> list:
+        """Fetch every Clorian purchase from `days_back` days ago up to now (chronological)."""
+        purchases: list = []
+        async for _, chunk in self.iter_purchases(days_back=days_back, concurrency=concurrency):
+            purchases.extend(chunk)
         return purchases
 
 
@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.services.clorian_service import ClorianService
+from src.config.settings import CLORIAN_ACCOUNTS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+BILL_COLS = [
+    "reservationId", "status", "productName", "salesGroupName",
+    "ticketQty", "grossTotal", "netBase", "taxAmount", "taxRate",
+    "firstName", "lastName", "email", "telephone", "country"
+]
+EXPORT_COLS = ["account", *BILL_COLS]
+
+
+def _round_half_up(x: np.ndarray, places: int = 2) -> np.ndarray:
+    """Vectorised ROUND_HALF_UP (away from zero on ties), like Decimal.quantize."""
+    scale = 10 ** places
+    return np.sign(x) * np.floor(np.abs(x) * scale + 0.5 + 1e-9) / scale
+
+
+def split_tax_batch(gross: np.ndarray, rate: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Vectorised `split_tax`: return net, tax arrays given gross and VAT rate (e.g. 0.10)."""
+    net = np.where(rate == 0, gross, _round_half_up(gross / (1 + rate)))
+    tax = np.where(rate == 0, 0.0, _round_half_up(gross - net))
+    return net, tax
+
+
+def purchases_to_frame(purchases: list, account: Optional[str] = None) -> pd.DataFrame:
+    """
+    Flatten one batch of Clorian purchases into one row per reservation.
+
+    The nested purchase → reservation → ticket walk only collects columns;
+    gross totals, ticket counts, VAT rates and the net/tax split are computed
+    with numpy over the whole batch.
+    """
+    res_cols = {c: [] for c in BILL_COLS if c not in ("ticketQty", "grossTotal", "netBase", "taxAmount", "taxRate")}
+    tk_res, tk_amount, tk_rate = [], [], []
+
+    for pur in purchases:
+        buyer = (
+            pur.get("firstName", ""),
+            pur.get("lastName", ""),
+            pur.get("email", ""),
+            pur.get("telephone", ""),
+            pur.get("country", ""),
+        )
+        for res in pur.get("reservationList", []):
+            r = len(res_cols["reservationId"])
+            res_cols["reservationId"].append(res.get("reservationId"))
+            res_cols["status"].append(res.get("status"))
+            res_cols["productName"].append(res.get("productName"))
+            res_cols["salesGroupName"].append(res.get("salesGroupName"))
+            for col, value in zip(("firstName", "lastName", "email", "telephone", "country"), buyer):
+                res_cols[col].append(value)
+
+            for tk in res.get("ticketList", []):
+                tk_res.append(r)
+                tk_rate.append(tk.get("taxRate", 0) or 0)
+                tk_amount.append(
+                    (tk.get("amount", 0) or 0)
+                    + sum((c.get("price", 0) or 0) for c in tk.get("ticketComplementSet", []))
+                    + sum((e.get("price", 0) or 0) for e in tk.get("ticketExtraSet", []))
+                )
+
+    n_res = len(res_cols["reservationId"])
+    tk_res_a = np.asarray(tk_res, dtype=np.int64)
+    tk_amount_a = np.asarray(tk_amount, dtype=np.float64)
+    tk_rate_a = np.asarray(tk_rate, dtype=np.float64)
+
+    gross = _round_half_up(np.bincount(tk_res_a, weights=tk_amount_a, minlength=n_res))
+    ticket_qty = np.bincount(tk_res_a, minlength=n_res)
+
+    # VAT rate = first non-zero ticket rate of each reservation (tickets are in reservation order)
+    rate = np.zeros(n_res)
+    nonzero = tk_rate_a != 0
+    first_res, first_idx = np.unique(tk_res_a[nonzero], return_index=True)
+    rate[first_res] = tk_rate_a[nonzero][first_idx]
+
+    net, tax = split_tax_batch(gross, rate)
+
+    df = pd.DataFrame(res_cols)
+    df["ticketQty"] = ticket_qty
+    df["grossTotal"] = gross
+    df["netBase"] = net
+    df["taxAmount"] = tax
+    df["taxRate"] = rate
+    df["reservationId"] = df["reservationId"].astype("Int64")
+    if account is not None:
+        df.insert(0, "account", account)
+        return df[EXPORT_COLS]
+    return df[BILL_COLS]
+
+
+# CHUNKED WRITERS
+class CsvChunkWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        df.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+        self._header = False
+
+    def close(self) -> None:
+        if self._header:                      # nothing exported → still leave a header-only file
+            pd.DataFrame(columns=EXPORT_COLS).to_csv(self.path, index=False)
+
+
+class ParquetChunkWriter:
+    """Append each batch as a row group of a single Parquet file (needs pyarrow)."""
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export requires pyarrow (`pip install pyarrow`)") from e
+        self._pa = pa
+        self.path = path
+        self.schema = pa.schema([
+            ("account", pa.string()),
+            ("reservationId", pa.int64()),
+            ("status", pa.string()),
+            ("productName", pa.string()),
+            ("salesGroupName", pa.string()),
+            ("ticketQty", pa.int64()),
+            ("grossTotal", pa.float64()),
+            ("netBase", pa.float64()),
+            ("taxAmount", pa.float64()),
+            ("taxRate", pa.float64()),
+            ("firstName", pa.string()),
+            ("lastName", pa.string()),
+            ("email", pa.string()),
+            ("telephone", pa.string()),
+            ("country", pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, df: pd.DataFrame) -> None:
+        self._writer.write_table(self._pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+WRITERS = {"csv": CsvChunkWriter, "parquet": ParquetChunkWriter}
+
+
+async def export_purchases(account_names: list[str], path: str, *, fmt: str = "csv", days_back: int = 365, start_date: Optional[str] = None, end_date: Optional[str] = None, concurrency: int = 10) -> int:
+    """
+    Stream purchases window by window into a CSV/Parquet file.
+
+    Only `concurrency` daily windows are ever held in memory, whatever the
+    date range or the number of accounts. Returns the number of rows written.
+    """
+    writer = WRITERS[fmt](path)
+    rows = 0
+    try:
+        for account_name in account_names:
+            started = time.time()
+            cs = ClorianService(account_name)
+            await cs.refresh_token()
+            account_rows = 0
+            async for window, purchases in cs.iter_purchases(days_back=days_back, start_date=start_date, end_date=end_date, concurrency=concurrency):
+                if not purchases:
+                    continue
+                df = purchases_to_frame(purchases, account=account_name)
+                writer.write(df)
+                account_rows += len(df)
+            rows += account_rows
+            logger.info(f"✅ {account_name}: {account_rows} reservation rows exported in {time.time() - started:.1f}s")
+    finally:
+        writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Clorian purchases (one row per reservation) to CSV or Parquet.")
+    parser.add_argument("--account", action="append", help="Clorian account name (repeatable, default: all accounts)")
+    parser.add_argument("--days-back", type=int, default=365)
+    parser.add_argument("--start", help="YYYY-MM-DD (overrides --days-back)")
+    parser.add_argument("--end", help="YYYY-MM-DD (default: now)")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    parser.add_argument("--out", help="Output file (default: clorian_purchases.<format>)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    accounts = args.account or [acc["name"] for acc in CLORIAN_ACCOUNTS]
+    out = args.out or f"clorian_purchases.{args.format}"
+    rows = asyncio.run(export_purchases(
+        accounts, out,
+        fmt=args.format,
+        days_back=args.days_back,
+        start_date=args.start,
+        end_date=args.end,
+        concurrency=args.concurrency,
+    ))
+    print(f"✓ {rows} reservation lines saved to {out}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+HEDGE_ENABLED = os.getenv("SYNC_HEDGE", "0").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("SYNC_HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.getenv("SYNC_HEDGE_BUDGET", "0.1"))
+HEDGE_SHADOW = float(os.getenv("SYNC_HEDGE_SHADOW", "0"))
+HEDGE_PAUSE_SECONDS = float(os.getenv("SYNC_HEDGE_PAUSE_SECONDS", "30"))
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of *values* (0.0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+class Hedger:
+    """
+    Tail-latency hedging for idempotent requests.
+
+    When a request is still running after the `pct` percentile of recent
+    latencies, an identical second request is started; whichever finishes
+    first wins and the other is cancelled. At most `budget` of the requests
+    of a batch (see `start_batch`) may be hedged, so load amplification is
+    bounded. Hedging only starts once `min_samples` latencies are known, and
+    stops for a while after the server pushes back (`pause`).
+
+    A failed request never wins: the race waits for the other one, and the
+    error only propagates when both fail. Requests must therefore raise on
+    anything that is not a real answer (a 429/5xx, retries exhausted).
+
+    To measure what hedging buys, set `shadow` (e.g. 0.25): one in `1 / shadow`
+    races lets the losing primary run to completion, and its real latency
+    feeds the "without hedging" p99 estimate. Callers must `await
+    drain_shadows()` before closing their session, so this costs wall time
+    and is meant for measurement runs.
+    """
+    def __init__(self, *, pct: float = HEDGE_PERCENTILE, budget: float = HEDGE_BUDGET, min_samples: int = 20, window: int = 500, shadow: float = HEDGE_SHADOW):
+        self.pct = pct
+        self.budget_ratio = budget
+        self.shadow_every = max(1, round(1 / shadow)) if shadow else 0
+        self.min_samples = min_samples
+        self.latencies: deque = deque(maxlen=window)
+        self.budget = 0
+        self._paused_until = 0.0
+        self._shadows: set = set()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.paused = 0
+        self.completions: list[float] = []       # completion time of every request, hedging included
+        self.unhedged: list[float] = []          # primary latency: requests never hedged + shadowed hedge races
+
+    def start_batch(self, n_requests: int) -> None:
+        self.budget = int(n_requests * self.budget_ratio)
+
+    def pause(self, seconds: float = HEDGE_PAUSE_SECONDS) -> None:
+        """No new hedges for *seconds* (the server answered 429/5xx: extra requests would only add load)."""
+        if time.monotonic() >= self._paused_until:
+            self.paused += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def can_hedge(self) -> bool:
+        return self.budget > 0 and time.monotonic() >= self._paused_until
+
+    def threshold(self) -> Optional[float]:
+        if len(self.latencies) < self.min_samples:
+            return None
+        return percentile(self.latencies, self.pct)
+
+    async def run(self, factory: Callable[[Callable[[], None]], Awaitable[T]]) -> T:
+        """
+        Run `factory(on_start)`, hedging it if it is slow. The request calls
+        `on_start()` once it is really on the wire: time spent queued behind a
+        concurrency limit does not count as latency.
+        """
+        self.requests += 1
+        on_wire = asyncio.Event()
+        primary = asyncio.ensure_future(factory(on_wire.set))
+        waiter = asyncio.ensure_future(on_wire.wait())
+        await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        started = time.monotonic()
+        threshold = self.threshold()
+        if threshold is not None and self.can_hedge():
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+            if not done and self.can_hedge():
+                self.budget -= 1
+                self.hedged += 1
+                return await self._race(primary, asyncio.ensure_future(factory(lambda: None)), started)
+        result = await primary
+        self._record(time.monotonic() - started)
+        return result
+
+    async def _race(self, primary: asyncio.Future, hedge: asyncio.Future, started: float):
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if not t.exception()), None)
+                if winner is None and pending:
+                    continue                         # the first one failed: wait for the other
+                elapsed = time.monotonic() - started
+                self.latencies.append(elapsed)
+                self.completions.append(elapsed)
+                if winner is hedge:
+                    self.hedge_wins += 1
+                    if self.shadow_every and self.hedge_wins % self.shadow_every == 0 and primary in pending:
+                        pending.discard(primary)            # keep it running to learn its real latency
+                        self._shadows.add(primary)
+                        primary.add_done_callback(lambda t: self._shadowed(t, started))
+                elif winner is primary:
+                    self.unhedged.append(elapsed)
+                return (winner or done.pop()).result()
+        finally:
+            for t in pending:
+                t.cancel()
+
+    async def drain_shadows(self) -> None:
+        if self._shadows:
+            await asyncio.wait(self._shadows)
+
+    def _shadowed(self, task: asyncio.Future, started: float) -> None:
+        self._shadows.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            # stands for every unshadowed hedge win too (one in `shadow_every` is sampled)
+            self.unhedged.extend([time.monotonic() - started] * self.shadow_every)
+
+    def _record(self, elapsed: float) -> None:
+        self.latencies.append(elapsed)
+        self.completions.append(elapsed)
+        self.unhedged.append(elapsed)
+
+    def report(self) -> dict:
+        """Counters and completion-time percentiles (the estimate is only there when shadowing is on)."""
+        report = {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "paused": self.paused,
+            "p50": round(percentile(self.completions, 50), 3),
+            "p99": round(percentile(self.completions, 99), 3),
+        }
+        if self.shadow_every:
+            report["p99_without_hedging_est"] = round(percentile(self.unhedged, 99), 3)
+        return report
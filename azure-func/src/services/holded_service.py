@@ -3,18 +3,43 @@ import asyncio
 import json
 import base64
 import calendar
+import logging
 import os
 from urllib.parse import quote_plus
 from datetime import datetime, timedelta
+from typing import AsyncIterator
 import random
 from aiohttp import ClientConnectorError, ClientTimeout, ClientError, ServerTimeoutError
 
 from src.config.settings import HOLDED_API_KEY
+from src.services.resilience import Deadline, DeadlineExceeded, RetryBudget, RunLimits, get_breaker, spend_retry
+from src.services.tracing import current_span, traced
 
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# retried statuses; the breaker counts every 5xx (and timeouts) as a failure
 TRANSIENT = {502, 503, 504}
 
-class HoldedService:
-    def __init__(self):
+# Timeout profile per kind of operation
+TIMEOUTS = {
+    "read":  ClientTimeout(total=30, connect=10, sock_connect=10, sock_read=20),   # single document / contact
+    "scan":  ClientTimeout(total=60, connect=10, sock_connect=10, sock_read=45),   # one page of a paginated listing
+    "write": ClientTimeout(total=45, connect=10, sock_connect=10, sock_read=30),   # create invoice / contact
+}
+
+
+class HoldedError(RuntimeError):
+    """Non-successful Holded response (or a body that is not JSON)."""
+    def __init__(self, message: str, status: int | None = None, body: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+        self.retryable = False
+
+
+class HoldedService(RunLimits):
+    def __init__(self, *, retry_budget: RetryBudget | None = None, deadline: Deadline | None = None):
         self.api_key = HOLDED_API_KEY
         self.base_url = "https://api.holded.com/api"
         self.headers = {
@@ -23,12 +48,32 @@ class HoldedService:
         }
         # Reusable HTTP session with sane defaults
         self._session: aiohttp.ClientSession | None = None
-        self._client_timeout = ClientTimeout(total=30, connect=10, sock_connect=10, sock_read=20)
+        self._client_timeout = TIMEOUTS["read"]
+        self.retry_budget = retry_budget
+        self.deadline = deadline or Deadline()
+        self.breaker = get_breaker(self.base_url)
+        self.stats = {"requests": 0, "new_connections": 0, "reused_connections": 0, "retries": 0, "errors": 0}
 
     def _ts(self, dt: datetime) -> int:
         """UTC → unix-timestamp (int)."""
         return calendar.timegm(dt.timetuple())
 
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        async def on_create(session, ctx, params):
+            self.stats["new_connections"] += 1
+
+        async def on_reuse(session, ctx, params):
+            self.stats["reused_connections"] += 1
+
+        async def on_request_end(session, ctx, params):
+            self.stats["requests"] += 1
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        trace.on_request_end.append(on_request_end)
+        return trace
+
     def _get_session(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
             connector = aiohttp.TCPConnector(limit=12, ttl_dns_cache=300)
@@ -36,126 +81,102 @@ class HoldedService:
                 headers=self.headers,
                 timeout=self._client_timeout,
                 connector=connector,
+                trace_configs=[self._trace_config()],
             )
         return self._session
 
-    async def _get(self, url: str, *, max_tries: int = 4) -> aiohttp.ClientResponse:
+    @traced("holded.request", lambda self, method, url, **k: {"method": method, "path": url.split("?")[0].replace(self.base_url, ""), "op": k.get("op", "read")})
+    async def _request(self, method: str, url: str, *, op: str = "read", payload: dict | None = None,
+                       allow: tuple[int, ...] = (), max_tries: int = 4, idempotent: bool = True):
+        """
+        Single entry point for every Holded call: pooled session, timeout profile
+        for *op*, retries with backoff and uniform status handling.
+
+        Returns the decoded JSON body for 2xx responses and `None` for statuses
+        listed in *allow* (e.g. 404). Anything else raises `HoldedError`.
+        Non-idempotent calls (POST) are only retried when the request surely
+        did not reach Holded (connection refused / 503).
+
+        Calls fail fast with `CircuitOpenError` while the Holded breaker is
+        open, and every retry is charged to the run's `RetryBudget`. The
+        timeout is the op profile capped to what is left of the run
+        `Deadline`, which raises `DeadlineExceeded` once it is spent.
+        """
         backoff = 1.5
         for attempt in range(1, max_tries + 1):
+            timeout = self.deadline.client_timeout(TIMEOUTS[op], f"Holded {method} ({op})")
             try:
-                sess = self._get_session()
-                resp = await sess.get(url)
-                if resp.status in TRANSIENT:
-                    raise RuntimeError(f"Holded {resp.status}")
-                await resp.read()          # ⬅️ descarga y deja el body cacheado
-                return resp
-            except (RuntimeError, ClientConnectorError, asyncio.TimeoutError, ServerTimeoutError, ClientError):
+                with self.breaker.guard():
+                    sess = self._get_session()
+                    async with sess.request(method, url, json=payload, timeout=timeout) as resp:
+                        text = await resp.text()
+                        current_span().set(status=resp.status, attempt=attempt, bytes=len(text))
+                        # health and retry are separate calls: any 5xx says Holded is unwell, but
+                        # only gateway errors are worth repeating (a 500 fails the same way again)
+                        if resp.status >= 500:
+                            self.breaker.record_failure()
+                        else:
+                            self.breaker.record_success()
+                        retryable = resp.status in TRANSIENT if idempotent else resp.status == 503
+                        if retryable:
+                            err = HoldedError(f"Holded {resp.status}", resp.status, text[:300])
+                            err.retryable = True
+                            raise err
+                        if resp.status in allow:
+                            return None
+                        if resp.status not in (200, 201):
+                            self.stats["errors"] += 1
+                            raise HoldedError(f"Holded error {resp.status} on {method} {url}: {text[:300]}", resp.status, text[:300])
+                        try:
+                            return json.loads(text or "null")
+                        except json.JSONDecodeError:
+                            self.stats["errors"] += 1
+                            raise HoldedError(
+                                f"Holded replied with HTML (status {resp.status}): {text[:120]}…", resp.status, text[:300]
+                            )
+            except HoldedError as e:
+                if not e.retryable:
+                    raise
                 if attempt == max_tries:
+                    self.stats["errors"] += 1
                     raise
-                await asyncio.sleep(backoff + random.random())
-                backoff *= 2
-        
-                
-    async def _post(self, url: str, payload: dict, *, max_tries: int = 4):
-        backoff = 1.5
-        for attempt in range(1, max_tries + 1):
-            try:
-                sess = self._get_session()
-                resp = await sess.post(url, json=payload)
-                if resp.status in TRANSIENT:
-                    raise RuntimeError(f"Holded {resp.status}")
-                return resp
-            except (RuntimeError, ClientConnectorError, asyncio.TimeoutError, ServerTimeoutError, ClientError):
+            except ClientConnectorError:
+                self.breaker.record_failure()
                 if attempt == max_tries:
+                    self.stats["errors"] += 1
                     raise
-                await asyncio.sleep(backoff + random.random())
-                backoff *= 2
+            except (asyncio.TimeoutError, ServerTimeoutError, ClientError) as e:
+                if self.deadline.expired and isinstance(e, asyncio.TimeoutError):
+                    raise DeadlineExceeded(f"Deadline reached during Holded {method} {url}") from e
+                self.breaker.record_failure()
+                if not idempotent or attempt == max_tries:
+                    self.stats["errors"] += 1
+                    raise
+            # no point waiting for a retry the run has no time left to make
+            self.deadline.check(backoff + 1, f"Holded retry of {method} {url}")
+            spend_retry(self.retry_budget, "holded")
+            self.stats["retries"] += 1
+            await asyncio.sleep(backoff + random.random())
+            backoff *= 2
+
+    def connection_report(self) -> str:
+        st = self.stats
+        opened = st["new_connections"] + st["reused_connections"]
+        reuse = (st["reused_connections"] / opened * 100) if opened else 0.0
+        return (f"{st['requests']} requests, {st['new_connections']} new connections, "
+                f"{st['reused_connections']} reused ({reuse:.1f}% reuse), {st['retries']} retries, {st['errors']} errors")
 
     # IVOICE OPERATIONS
-    async def list_contacts(self, *, page_size: int = 200) -> list[dict]:
-        """
-        Return **every** contact stored in Holded – no silent cut-offs.
-        """
-        base_url = f"{self.base_url}/invoicing/v1/contacts"
-        all_contacts: list[dict] = []
-
-        async with aiohttp.ClientSession(headers=self.headers) as sess:
-            page = 1
-            while True:
-                url = f"{base_url}?page={page}&pageSize={page_size}"
-                async with sess.get(url) as r:
-                    if r.status != 200:
-                        raise RuntimeError(
-                            f"Holded error {r.status}: {await r.text()}"
-                        )
-
-                    contacts: list = await self._json(r)
-
-                all_contacts.extend(contacts)
-
-                # last page reached when we receive fewer rows than page_size
-                if len(contacts) < page_size:
-                    break
-
-                page += 1
-
-        return all_contacts
-                        
     async def invoice_details(self, document_id, doc_type: str = "invoice"):
-        """Get invoice details by document ID"""
-        url = self.base_url + "/invoicing/v1/documents/{doc_type}/{document_id}"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers) as res:
-                if res.status != 200:
-                    print(f"Error getting invoice details for {document_id}")
-                    return None
-                try:
-                    return await res.json()
-                except:
-                    return None
-                
-    async def create_invoice(self, invoice_data: dict, doc_type: str = "invoice"):
-        """Create a new invoice in Holded"""
-        url = self.base_url + f"/invoicing/v1/documents/{doc_type}"
-        body = invoice_data
-
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=body, headers=self.headers) as res:
-
-                if res.status != 200:
-                    try:
-                        error = await res.json()
-                        print(f"An error ocurred: {res.status} : {error}")
-                    except Exception as e:
-                        try:
-                            error = await res.text()
-                            print("Die error ->", error)
-                        except Exception as e:
-                            raise IndexError("An error ocurred while creating the invoice -> ", e)
-
-                if res.status == 500:
-                    print("Interval Server Error ocurred", res.text)
-                    return 
-
-                data = await res.json()
-                print(data)
+        """Get invoice details by document ID (None if it does not exist)"""
+        url = self.base_url + f"/invoicing/v1/documents/{doc_type}/{document_id}"
+        return await self._request("GET", url, op="read", allow=(404,))
 
+    async def create_invoice(self, invoice_data: dict, doc_type: str = "invoice") -> dict:
+        """Create a new invoice in Holded and return Holded's reply (raises HoldedError on failure)"""
+        url = self.base_url + f"/invoicing/v1/documents/{doc_type}"
+        return await self._request("POST", url, op="write", payload=invoice_data, idempotent=False)
 
-    async def _json(self, resp: aiohttp.ClientResponse) -> list | dict:
-        """
-        Return *resp* decoded as JSON – even when Holded lies and sends
-        `text/html`.  If the body is not JSON, raise RuntimeError.
-        """
-        text  = await resp.text()
-        try:
-            return json.loads(text or "null")
-        except json.JSONDecodeError:
-            raise RuntimeError(
-                f"Holded replied with HTML (status {resp.status}): "
-                f"{text[:120]}…"
-            )
-        
     def _unix_ts(self, dt: datetime) -> int:
         """Return *dt* as a UTC-timestamp (int)."""
         return calendar.timegm(dt.timetuple())
@@ -169,8 +190,7 @@ class HoldedService:
         qdoc = quote_plus(doc_number)
 
         # ── 1) filtro rápido ────────────────────────────────────────────────
-        resp = await self._get(f"{base}?docNumber={qdoc}")
-        data = await self._json(resp)        # _json ya comprueba status==200
+        data = await self._request("GET", f"{base}?docNumber={qdoc}", op="read")
 
         # - Si Holded respeta el filtro puede devolver dict, lista con 0..n docs o []
         if isinstance(data, dict):           # ← hit
@@ -182,8 +202,7 @@ class HoldedService:
             # si lista vacía o sin match, probar invoiceNum y luego escaneo
 
         # Intento adicional con invoiceNum por si el API usa ese nombre
-        resp2 = await self._get(f"{base}?invoiceNum={qdoc}")
-        data2 = await self._json(resp2)
+        data2 = await self._request("GET", f"{base}?invoiceNum={qdoc}", op="read")
         if isinstance(data2, dict):
             return data2
         if isinstance(data2, list):
@@ -198,25 +217,11 @@ class HoldedService:
         w_end = today
         while w_end > stop:
             w_start = max(stop, w_end - timedelta(days=365))
-            params  = (
-                f"starttmp={int(w_start.timestamp())}"
-                f"&endtmp={int(w_end.timestamp())}"
-            )
-
-            page = 1
-            while True:
-                url  = f"{base}?{params}&page={page}&pageSize={page_size}"
-                resp = await self._get(url)
-                docs: list = await self._json(resp)
-
+            async for docs in self.iter_documents(w_start.timestamp(), w_end.timestamp(), doc_type=doc_type, page_size=page_size):
                 for doc in docs:
                     if doc.get("docNumber") == doc_number or doc.get("invoiceNum") == doc_number:
                         return doc
 
-                if len(docs) < page_size:            # última página de la ventana
-                    break
-                page += 1
-
             w_end = w_start                           # retrocede un año
 
         return None
@@ -224,36 +229,48 @@ class HoldedService:
     async def close(self):
         if self._session and not self._session.closed:
             await self._session.close()
+            logger.info(f"🔌 Holded HTTP pool: {self.connection_report()}")
 
-    async def list_documents(self,
+    async def iter_documents(self,
                              start_ts: int,
                              end_ts: int,
                              *,
                              doc_type: str = "invoice",
-                             page_size: int = 200) -> list[dict]:
+                             page_size: int = 200) -> AsyncIterator[list[dict]]:
         """
-        List all documents in Holded for a given time window [start_ts, end_ts].
-        Returns a list of document dicts.
+        Yield the documents of [start_ts, end_ts] one page at a time.
         """
         base = f"{self.base_url}/invoicing/v1/documents/{doc_type}"
         params = f"starttmp={int(start_ts)}&endtmp={int(end_ts)}"
 
         page = 1
-        all_docs: list[dict] = []
         while True:
             url = f"{base}?{params}&page={page}&pageSize={page_size}"
-            resp = await self._get(url)
-            docs: list = await self._json(resp)
+            docs = await self._request("GET", url, op="scan")
 
             if not isinstance(docs, list):
                 break
-            all_docs.extend(docs)
+            yield docs
 
             if len(docs) < page_size:
                 break
             page += 1
 
+    async def list_documents(self,
+                             start_ts: int,
+                             end_ts: int,
+                             *,
+                             doc_type: str = "invoice",
+                             page_size: int = 200) -> list[dict]:
+        """
+        List all documents in Holded for a given time window [start_ts, end_ts].
+        Returns a list of document dicts.
+        """
+        all_docs: list[dict] = []
+        async for docs in self.iter_documents(start_ts, end_ts, doc_type=doc_type, page_size=page_size):
+            all_docs.extend(docs)
         return all_docs
+
     async def check_invoice_exists(self, bill_number: str):
         
         factura_holded = {
@@ -263,41 +280,34 @@ class HoldedService:
     # CONTACTS OPERATIOS
             
     async def contact_details(self, contact_id: str):
+        """Get a contact by id ({} if it does not exist)"""
         url = self.base_url + f"/invoicing/v1/contacts/{contact_id}"
+        return await self._request("GET", url, op="read", allow=(404,)) or {}
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers) as res:
-                if res.status != 200:
-                    error_text = await res.text()
-                    print(f"Error fetching contact {contact_id}: {res.status} — {error_text}")
-                    return {}
-
-                return await res.json()
-
-    async def create_contact(self, contact_data: dict):
+    async def create_contact(self, contact_data: dict) -> dict:
+        """Create a contact and return Holded's reply (raises HoldedError on failure)"""
         url = self.base_url + "/invoicing/v1/contacts"
-        body = contact_data
+        return await self._request("POST", url, op="write", payload=contact_data, idempotent=False)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=body, headers=self.headers) as res:
-                if res.status not in (200, 201):
-                    error_text = await res.text()
-                    print(f"Error creating contact: {res.status} — {error_text}")
-                    return None
-
-                return await res.json()
+    async def list_contacts(self, *, page_size: int = 200) -> list[dict]:
+        """
+        Return **every** contact stored in Holded – no silent cut-offs.
+        """
+        base_url = f"{self.base_url}/invoicing/v1/contacts"
+        all_contacts: list[dict] = []
 
-    async def list_contacts(self) -> list[dict]:
-        """ List all contacts in Holded."""
-        url = f"{self.base_url}/invoicing/v1/contacts"
+        page = 1
+        while True:
+            url = f"{base_url}?page={page}&pageSize={page_size}"
+            contacts: list = await self._request("GET", url, op="scan") or []
+            all_contacts.extend(contacts)
 
-        async with aiohttp.ClientSession() as sess:
-            async with sess.get(url, headers=self.headers) as res:
-                if res.status != 200:
-                    print("Error fetching contacts:", res.status, await res.text())
-                    return []
-                return await res.json()
+            # last page reached when we receive fewer rows than page_size
+            if len(contacts) < page_size:
+                break
+            page += 1
 
+        return all_contacts
 
     async def contact_by_code(
         self,
@@ -317,37 +327,32 @@ class HoldedService:
         base = f"{self.base_url}/invoicing/v1/contacts"
         code = code.strip().upper()
 
-        async with aiohttp.ClientSession(headers=self.headers) as sess:
-
-            # ── 1) quick filter ─────────────────────────────────────────────
-            url = f"{base}?code={quote_plus(code)}"
-            async with sess.get(url) as r:
-                try:
-                    data = await self._json(r)              # tolerant JSON helper
-                    if isinstance(data, list):
-                        # Scan the list – only return if the code really matches
-                        for c in data:
-                            if c.get("code", "").strip().upper() == code:
-                                return c
-                        # Filter ignored → fall through to full scan
-                except RuntimeError:
-                    # Received HTML → fall through to full scan
-                    pass
-
-            # ── 2) full paginated scan ─────────────────────────────────────
-            page = 1
-            while True:
-                url = f"{base}?page={page}&pageSize={page_size}"
-                async with sess.get(url) as r:
-                    contacts: list = await self._json(r)
-
-                for c in contacts:
+        # ── 1) quick filter ─────────────────────────────────────────────
+        try:
+            data = await self._request("GET", f"{base}?code={quote_plus(code)}", op="read")
+            if isinstance(data, list):
+                # Scan the list – only return if the code really matches
+                for c in data:
                     if c.get("code", "").strip().upper() == code:
                         return c
+                # Filter ignored → fall through to full scan
+        except HoldedError:
+            # Received HTML → fall through to full scan
+            pass
 
-                if len(contacts) < page_size:     # reached last page
-                    return None
-                page += 1
+        # ── 2) full paginated scan ─────────────────────────────────────
+        page = 1
+        while True:
+            url = f"{base}?page={page}&pageSize={page_size}"
+            contacts: list = await self._request("GET", url, op="scan") or []
+
+            for c in contacts:
+                if c.get("code", "").strip().upper() == code:
+                    return c
+
+            if len(contacts) < page_size:     # reached last page
+                return None
+            page += 1
     # PRODUCTS OPERATIONS
     
 
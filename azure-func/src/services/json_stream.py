@@ -0,0 +1,65 @@
+import codecs
+import json
+from typing import Any, AsyncIterator
+
+_WS = " \t\r\n"
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """
+    Incrementally decode a top-level JSON array from a byte stream and yield
+    its elements one by one.
+
+    Only the undecoded tail of the stream is buffered, so memory stays
+    proportional to the largest element (one bill), not to the whole body.
+    A `null` or empty body yields nothing, like `await r.json() or []`.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    started = False
+
+    async for chunk in chunks:
+        buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+        n = len(buf)
+
+        while True:
+            while pos < n and buf[pos] in _WS:
+                pos += 1
+            if pos >= n:
+                break
+
+            if not started:
+                if buf.startswith("null", pos):
+                    return
+                if "null".startswith(buf[pos:]):
+                    break                   # "nu|ll" split across chunks
+                if buf[pos] != "[":
+                    raise ValueError(f"Expected a JSON array, got {buf[pos:pos + 40]!r}")
+                started = True
+                pos += 1
+                continue
+
+            c = buf[pos]
+            if c == "]":
+                return
+            if c == ",":
+                pos += 1
+                continue
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break                       # element cut by the chunk boundary → need more bytes
+            if end >= n and not isinstance(obj, (dict, list)):
+                break                       # a scalar may continue in the next chunk (e.g. 12|34)
+            yield obj
+            pos = end
+
+    # the stream ended without the closing "]"
+    rest = (buf[pos:] + utf8.decode(b"", final=True)).strip()
+    if not started and rest in ("", "null"):
+        return
+    raise ValueError(f"Truncated JSON array near {rest[:40]!r}")
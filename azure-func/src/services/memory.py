@@ -0,0 +1,185 @@
+import logging
+import os
+import pickle
+import resource
+import sqlite3
+import sys
+import tempfile
+from typing import Iterator, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SPILL_DIR = os.getenv("SYNC_SPILL_DIR") or tempfile.gettempdir()
+DEFAULT_LIMIT_MB = 1536            # Azure Functions Consumption plan instance
+
+
+def rss_mb() -> float:
+    """Current resident set size of the process (Linux /proc; peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024      # bytes on macOS, KiB on Linux
+
+
+def memory_limit_mb() -> float:
+    """SYNC_MEMORY_LIMIT_MB, else the cgroup limit of the container, else the Consumption plan's 1.5 GB."""
+    if os.getenv("SYNC_MEMORY_LIMIT_MB"):
+        return float(os.environ["SYNC_MEMORY_LIMIT_MB"])
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 2**60:
+            return int(value) / 2**20
+    return DEFAULT_LIMIT_MB
+
+
+class MemoryCeiling:
+    """
+    RSS level above which the big run buffers (fetched bills, Holded duplicate
+    index) stop growing in memory and spill to disk: SYNC_MEMORY_CEILING_MB,
+    or SYNC_MEMORY_CEILING (fraction of the limit, default 0.7).
+    """
+    def __init__(self, ceiling_mb: Optional[float] = None):
+        self.limit_mb = memory_limit_mb()
+        if ceiling_mb is None and os.getenv("SYNC_MEMORY_CEILING_MB"):
+            ceiling_mb = float(os.environ["SYNC_MEMORY_CEILING_MB"])
+        self.ceiling_mb = ceiling_mb if ceiling_mb is not None else self.limit_mb * float(os.getenv("SYNC_MEMORY_CEILING", "0.7"))
+
+    def exceeded(self) -> bool:
+        return rss_mb() >= self.ceiling_mb
+
+    def report(self) -> dict:
+        return {"rss_mb": round(rss_mb(), 1), "peak_rss_mb": round(peak_rss_mb(), 1),
+                "ceiling_mb": round(self.ceiling_mb, 1), "limit_mb": round(self.limit_mb, 1)}
+
+
+class StageMeter:
+    """
+    Per-stage memory of one account run in `summary["memory"]`: process RSS
+    after each stage and its growth during the stage. RSS is process-wide, so
+    with several accounts on one event loop the deltas overlap.
+    """
+    def __init__(self, summary: dict):
+        self.summary = summary
+        self.last = rss_mb()
+        summary["memory"] = {"rss_start_mb": round(self.last, 1)}
+
+    def mark(self, stage: str, **extra) -> None:
+        now = rss_mb()
+        self.summary["memory"][stage] = {"rss_mb": round(now, 1), "delta_mb": round(now - self.last, 1), **extra}
+        self.last = now
+
+    def finish(self, ceiling: MemoryCeiling) -> None:
+        peak = max(peak_rss_mb(), rss_mb())          # ru_maxrss lags the page count a little
+        self.summary["memory"].update(peak_rss_mb=round(peak, 1), ceiling_mb=round(ceiling.ceiling_mb, 1))
+
+
+class BillSpool:
+    """
+    Fetched bills grouped by slice index and read back in index (= date)
+    order. Slices stay in memory until the ceiling is reached; from then on
+    they are pickled to an anonymous temp file, deleted when the spool is
+    closed or collected.
+    """
+    def __init__(self, ceiling: MemoryCeiling, *, directory: str = SPILL_DIR):
+        self.ceiling = ceiling
+        self.directory = directory
+        self.count = 0
+        self.spilled = 0
+        self._memory: dict[int, list] = {}
+        self._disk: dict[int, tuple[int, int]] = {}
+        self._file = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, index: int, bills: list) -> None:
+        self.count += len(bills)
+        if self.ceiling.exceeded():
+            for held in list(self._memory):          # what is already held goes first
+                self._spill(held, self._memory.pop(held))
+            self._spill(index, bills)
+        else:
+            self._memory[index] = bills
+
+    def _spill(self, index: int, bills: list) -> None:
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix="bills-", dir=self.directory)
+            logger.warning(f"💽 RSS over the {self.ceiling.ceiling_mb:.0f} MB ceiling: spilling fetched bills to disk")
+        data = pickle.dumps(bills, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.seek(0, os.SEEK_END)
+        self._disk[index] = (self._file.tell(), len(data))
+        self._file.write(data)
+        self.spilled += len(bills)
+
+    def __iter__(self) -> Iterator:
+        for index in sorted(self._memory.keys() | self._disk.keys()):
+            if index in self._memory:
+                yield from self._memory[index]
+            else:
+                offset, size = self._disk[index]
+                self._file.seek(offset)
+                yield from pickle.loads(self._file.read(size))
+
+    def close(self) -> None:
+        self._memory.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DocIndex:
+    """
+    Holded docNumber → document id for the duplicate check (only the id is
+    kept, not the whole document). Past the ceiling it moves into a private
+    temporary SQLite database, removed when closed.
+    """
+    def __init__(self, ceiling: MemoryCeiling):
+        self.ceiling = ceiling
+        self._memory: dict[str, str] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._count = 0
+
+    @property
+    def spilled(self) -> bool:
+        return self._db is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add_many(self, pairs: list[tuple[str, str]]) -> None:
+        if self._db is None and self.ceiling.exceeded():
+            self._db = sqlite3.connect("")                 # "" = temporary on-disk database
+            self._db.execute("CREATE TABLE docs (number TEXT PRIMARY KEY, id TEXT)")
+            self._db.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?)", self._memory.items())
+            self._memory.clear()
+            logger.warning(f"💽 RSS over the {self.ceiling.ceiling_mb:.0f} MB ceiling: Holded duplicate index moved to disk")
+        if self._db is not None:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?)", pairs)
+            self._count = self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        else:
+            self._memory.update(pairs)
+            self._count = len(self._memory)
+
+    def get(self, number: str) -> Optional[str]:
+        if self._db is None:
+            return self._memory.get(number)
+        row = self._db.execute("SELECT id FROM docs WHERE number = ?", (number,)).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        self._memory.clear()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
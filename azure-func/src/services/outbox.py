@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Optional
+
+from src.services.holded_service import HoldedError, HoldedService
+from src.services.resilience import STOP_ERRORS
+from src.config.settings import STATE_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+OUTBOX_PATH = os.path.join(STATE_DIR, "outbox.sqlite3")
+MAX_ATTEMPTS = int(os.getenv("SYNC_OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_ENABLED = os.getenv("SYNC_OUTBOX", "0").lower() in ("1", "true", "yes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    account         TEXT NOT NULL,
+    bill_number     TEXT NOT NULL,
+    payload         TEXT NOT NULL,
+    date_ts         INTEGER NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'pending',   -- pending / sent / dead
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error      TEXT,
+    holded_id       TEXT,
+    created_at      REAL NOT NULL,
+    sent_at         REAL,
+    PRIMARY KEY (account, bill_number)
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, next_attempt_at);
+"""
+
+
+class Outbox:
+    """
+    Durable queue of ready-to-send Holded invoice payloads (SQLite, WAL).
+
+    Keyed by (account, bill number): enqueuing a bill twice keeps a single
+    row, and a bill already sent is never enqueued again. Delivery is
+    at-least-once; the drain checks Holded for the docNumber before posting
+    so a crash between the POST and `mark_sent` does not duplicate invoices.
+    Only durable with SYNC_STATE_DIR on persistent storage: the sync does not
+    use the default path under the temp dir (see AsyncService).
+    """
+    def __init__(self, path: str = OUTBOX_PATH, *, max_attempts: int = MAX_ATTEMPTS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def enqueue(self, account: str, bill_number: str, payload: dict) -> bool:
+        """Store *payload* for delivery. Returns False if the bill was already sent."""
+        with self.db:
+            cur = self.db.execute(
+                """INSERT INTO outbox (account, bill_number, payload, date_ts, created_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (account, bill_number) DO UPDATE SET payload = excluded.payload
+                   WHERE outbox.status != 'sent'""",
+                (account, bill_number, json.dumps(payload, ensure_ascii=False), int(payload.get("date") or 0), time.time()),
+            )
+        return cur.rowcount > 0
+
+    def claim(self, limit: int = 100, *, accounts: Optional[list[str]] = None) -> list[sqlite3.Row]:
+        """Pending rows whose backoff has elapsed, oldest bill first."""
+        sql = "SELECT * FROM outbox WHERE status = 'pending' AND next_attempt_at <= ?"
+        args: list = [time.time()]
+        if accounts:
+            sql += f" AND account IN ({', '.join('?' * len(accounts))})"
+            args.extend(accounts)
+        sql += " ORDER BY date_ts LIMIT ?"
+        args.append(limit)
+        return self.db.execute(sql, args).fetchall()
+
+    def mark_sent(self, row: sqlite3.Row, holded_id: Optional[str] = None) -> None:
+        with self.db:
+            self.db.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, holded_id = ?, attempts = attempts + 1 WHERE account = ? AND bill_number = ?",
+                (time.time(), holded_id, row["account"], row["bill_number"]),
+            )
+
+    def mark_failed(self, row: sqlite3.Row, error: str, *, permanent: bool = False) -> str:
+        """Schedule a retry with exponential backoff, or dead-letter the row. Returns the new status."""
+        attempts = row["attempts"] + 1
+        status = "dead" if permanent or attempts >= self.max_attempts else "pending"
+        delay = min(2 ** attempts * 30, 6 * 3600)
+        with self.db:
+            self.db.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ? WHERE account = ? AND bill_number = ?",
+                (status, attempts, error[:500], time.time() + delay, row["account"], row["bill_number"]),
+            )
+        return status
+
+    def requeue_dead(self, account: Optional[str] = None) -> int:
+        sql = "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = 0 WHERE status = 'dead'"
+        args = []
+        if account:
+            sql += " AND account = ?"
+            args.append(account)
+        with self.db:
+            return self.db.execute(sql, args).rowcount
+
+    def stats(self) -> dict:
+        rows = self.db.execute("SELECT account, status, COUNT(*) AS n FROM outbox GROUP BY account, status").fetchall()
+        out: dict = {}
+        for r in rows:
+            out.setdefault(r["account"], {})[r["status"]] = r["n"]
+        return out
+
+    def dead_letters(self, account: Optional[str] = None) -> list[sqlite3.Row]:
+        sql = "SELECT account, bill_number, attempts, last_error FROM outbox WHERE status = 'dead'"
+        args = []
+        if account:
+            sql += " AND account = ?"
+            args.append(account)
+        return self.db.execute(sql + " ORDER BY date_ts", args).fetchall()
+
+
+def _day_spans(dates: list[int], pad: int = 86400) -> list[tuple[int, int]]:
+    """Windows covering every date ± *pad*, nearby dates merged: only the days with rows are listed."""
+    spans: list[list[int]] = []
+    for ts in sorted(dates):
+        if spans and ts - pad <= spans[-1][1]:
+            spans[-1][1] = ts + pad
+        else:
+            spans.append([ts - pad, ts + pad])
+    return [(lo, hi) for lo, hi in spans]
+
+
+def _holded_id(reply) -> Optional[str]:
+    if isinstance(reply, dict):
+        return reply.get("id") or reply.get("_id")
+    return None
+
+
+async def drain_outbox(outbox: Outbox, holded: HoldedService, *, accounts: Optional[list[str]] = None, batch_size: int = 100, pause: float = 0.1, until: Optional[asyncio.Event] = None, poll_interval: float = 1.0) -> dict:
+    """
+    Push pending payloads of *accounts* (default: all) to Holded.
+
+    Without *until* the drain stops when no row is due; with it, it keeps
+    polling for new rows until the event is set (producers finished) and the
+    outbox is empty. Stops early, leaving rows pending, when the Holded
+    circuit opens, the retry budget runs out or the run deadline is reached.
+    """
+    result = {"sent": 0, "already_in_holded": 0, "retried": 0, "dead": 0, "stopped": None}
+    while True:
+        # read the flag before claiming so rows enqueued right before it was set are not missed
+        producers_done = until is None or until.is_set()
+        rows = outbox.claim(batch_size, accounts=accounts)
+        if not rows:
+            if producers_done:
+                break
+            await asyncio.sleep(poll_interval)
+            continue
+
+        # one Holded listing per run of nearby days instead of a lookup per bill; rows scattered
+        # over many days (old retries next to new bills) are cheaper to look up one by one
+        spans = _day_spans([r["date_ts"] for r in rows])
+        try:
+            existing = None
+            if len(spans) <= max(1, len(rows) // 4):
+                existing = set()
+                for start, end in spans:
+                    existing.update(
+                        str(d.get("docNumber") or d.get("invoiceNum"))
+                        for d in await holded.list_documents(start, end, doc_type="invoice", page_size=200)
+                    )
+        except STOP_ERRORS as e:
+            result["stopped"] = str(e)
+            break
+        except Exception as e:
+            logger.warning(f"⚠️  Could not list Holded documents for the outbox batch ({e}); checking one by one")
+            existing = None
+
+        for row in rows:
+            bill_number = row["bill_number"]
+            try:
+                found = bill_number in existing if existing is not None else await holded.invoice_by_docnumber(bill_number)
+                if found:
+                    outbox.mark_sent(row)
+                    result["already_in_holded"] += 1
+                    continue
+                reply = await holded.create_invoice(json.loads(row["payload"]))
+                outbox.mark_sent(row, _holded_id(reply))
+                result["sent"] += 1
+                logger.info(f"✅ Outbox: invoice {bill_number} ({row['account']}) created in Holded")
+            except STOP_ERRORS as e:
+                logger.warning(f"🛑 Outbox drain stopped at {bill_number}: {e}")
+                result["stopped"] = str(e)
+                return result
+            except Exception as e:
+                # 4xx (other than 429) will fail the same way every time: dead-letter straight away
+                permanent = isinstance(e, HoldedError) and e.status is not None and 400 <= e.status < 500 and e.status != 429
+                status = outbox.mark_failed(row, str(e), permanent=permanent)
+                result["dead" if status == "dead" else "retried"] += 1
+                logger.error(f"❌ Outbox: invoice {bill_number} ({row['account']}) failed [{status}]: {e}")
+            await asyncio.sleep(pause)
+
+    logger.info(f"📮 Outbox drained: {result['sent']} sent, {result['already_in_holded']} already in Holded, "
+                f"{result['retried']} to retry, {result['dead']} dead-lettered")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and drain the Holded outbox.")
+    parser.add_argument("command", choices=("drain", "stats", "dead", "requeue-dead"))
+    parser.add_argument("--account", help="Only this Clorian account")
+    parser.add_argument("--path", default=OUTBOX_PATH)
+    args = parser.parse_args()
+
+    outbox = Outbox(args.path)
+    try:
+        if args.command == "drain":
+            async def run():
+                holded = HoldedService()
+                try:
+                    return await drain_outbox(outbox, holded, accounts=[args.account] if args.account else None)
+                finally:
+                    await holded.close()
+            print(asyncio.run(run()))
+        elif args.command == "stats":
+            for account, counts in outbox.stats().items():
+                print(f"{account:<40} {counts}")
+        elif args.command == "dead":
+            for r in outbox.dead_letters(args.account):
+                print(f"{r['account']:<40} {r['bill_number']:<20} attempts={r['attempts']} {r['last_error']}")
+        else:
+            print(f"{outbox.requeue_dead(args.account)} rows back to pending")
+    finally:
+        outbox.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    main()
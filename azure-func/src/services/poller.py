@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from src.services.bill_hashes import bill_hash
+from src.services.bill_model import BILL_DATE_FORMAT, ClorianBill
+from src.services.outbox import drain_outbox
+from src.services.resilience import STOP_ERRORS, Deadline
+from src.services.sync_service import AsyncService, run_summary
+from src.services.sync_state import AccountBusy, AccountLock
+from src.config.settings import CLORIAN_ACCOUNTS, STATE_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+POLL_FILE = os.path.join(STATE_DIR, "poll.json")
+MARK_FORMAT = "%Y-%m-%d %H:%M:%S"         # Europe/Madrid wall clock, like billDate
+POLL_INTERVAL_MINUTES = float(os.getenv("SYNC_POLL_INTERVAL_MINUTES", "5"))
+POLL_WINDOW_MINUTES = float(os.getenv("SYNC_POLL_WINDOW_MINUTES", "120"))
+POLL_OVERLAP_MINUTES = float(os.getenv("SYNC_POLL_OVERLAP_MINUTES", "15"))
+
+
+def _load_marks() -> dict:
+    try:
+        with open(POLL_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_marks(marks: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(POLL_FILE), exist_ok=True)
+        tmp = POLL_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(marks, f, indent=2)
+        os.replace(tmp, POLL_FILE)
+    except OSError as e:
+        logger.warning(f"⚠️  Could not persist poll marks: {e}")
+
+
+def poll_window(now: datetime, last_until: Optional[datetime], *, window: timedelta, overlap: timedelta) -> tuple[datetime, datetime]:
+    """
+    [from, until] of the next micro-batch: from the previous `until` minus the
+    overlap (late or re-issued bills), never further back than `window` so
+    the cost of one poll stays bounded; a longer gap is left to the daily run.
+    """
+    start = now - window
+    if last_until is not None:
+        start = max(start, last_until - overlap)
+    return start, now
+
+
+class MicroBatchPoller:
+    """
+    Near-real-time sync: every few minutes fetch only the trailing window of
+    each account and push the bills not pushed yet. Bills seen in a previous
+    (overlapping) poll are dropped by content hash before anything touches
+    Holded, so a quiet poll costs one Clorian request per account and kind.
+    """
+    def __init__(self, async_service: AsyncService, account_names: Optional[list[str]] = None, *, kinds: tuple[str, ...] = ("normal",),
+                 window_minutes: float = POLL_WINDOW_MINUTES, overlap_minutes: float = POLL_OVERLAP_MINUTES, dry_run: bool = False):
+        self.sync = async_service
+        self.accounts = [acc for acc in CLORIAN_ACCOUNTS if account_names is None or acc.get("name") in account_names]
+        self.kinds = kinds
+        self.window = timedelta(minutes=window_minutes)
+        self.overlap = timedelta(minutes=overlap_minutes)
+        self.dry_run = dry_run
+
+    def _targets(self) -> list[tuple[str, str]]:
+        targets = []
+        for acc in self.accounts:
+            for kind in self.kinds:
+                # simplified bills of these accounts go out as daily summaries, which need whole days
+                if kind == "simplified" and acc.get("simplified_summary"):
+                    continue
+                targets.append((acc["name"], kind))
+        return targets
+
+    async def _poll_one(self, account_name: str, kind: str, start: datetime, until: datetime) -> dict:
+        summary = run_summary(account_name, kind, self.dry_run)
+        summary["window"] = [start.strftime(MARK_FORMAT), until.strftime(MARK_FORMAT)]
+        if self.dry_run:
+            return await self._poll_window(summary, account_name, kind, start, until)
+        # the daily run or a backfill of this account is pushing: leave the window to the next poll
+        lock = AccountLock(account_name, kind, "poll")
+        try:
+            lock.acquire()
+        except AccountBusy as e:
+            logger.info(f"🔒 {account_name} [{kind}] busy, not polled: {e}")
+            summary["stopped"] = str(e)
+            return summary
+        try:
+            return await self._poll_window(summary, account_name, kind, start, until)
+        finally:
+            lock.release()
+
+    async def _poll_window(self, summary: dict, account_name: str, kind: str, start: datetime, until: datetime) -> dict:
+        clorian_account = self.sync._clorian_account(account_name)
+        try:
+            raw = await clorian_account.get_bills_between(start, until, simplified=kind == "simplified")
+        except STOP_ERRORS as e:
+            summary["stopped"] = str(e)
+            return summary
+        failed = clorian_account.failed_slices.get(kind, [])
+        if failed:
+            summary["failed_slices"] = failed
+            summary["errors"] += len(failed)            # the mark must not move past a window that failed
+        await self.sync.archive_bills(account_name, kind, raw)
+        bills = [ClorianBill.from_dict(b) for b in raw]
+        summary["fetched"] = len(bills)
+
+        # overlap dedupe before any Holded call: same content hash → already pushed
+        hashes = self.sync._hash_store(account_name)
+        fresh = [b for b in bills if hashes.get(b.bill_number) != bill_hash(b)]
+        summary["skipped_by_hash"] = len(bills) - len(fresh)
+        if not fresh:
+            return summary
+
+        started = time.time()
+        holded_docs_cache = await self.sync._prefetch_holded_docs(fresh, self.sync._series_index(account_name))
+        try:
+            await self.sync.push_bills(clorian_account, fresh, holded_docs_cache, summary, process_start=started,
+                                       max_execution_time=float("inf"), dry_run=self.dry_run)
+        finally:
+            if holded_docs_cache is not None:
+                holded_docs_cache.close()
+        pushed = summary["created_invoices"] + summary["queued"]
+        if pushed:
+            # issue → Holded latency of this batch (billDate is Madrid wall clock: localize it before comparing)
+            oldest = self.sync.tz_mad.localize(datetime.strptime(min(b.bill_date for b in fresh), BILL_DATE_FORMAT))
+            summary["max_lag_seconds"] = round(time.time() - oldest.timestamp(), 1)
+        return summary
+
+    async def poll_once(self) -> list[dict]:
+        """One micro-batch over every account and kind; advances the marks of the ones that completed."""
+        # Clorian filters on billDate, which is Madrid local time: the window (and the marks) are too
+        now = datetime.now(self.sync.tz_mad).replace(tzinfo=None, microsecond=0)
+        marks = _load_marks()
+        results = []
+
+        async def run(account_name: str, kind: str) -> dict:
+            mark = marks.get(account_name, {}).get(kind)
+            last_until = datetime.strptime(mark, MARK_FORMAT) if mark else None
+            start, until = poll_window(now, last_until, window=self.window, overlap=self.overlap)
+            if last_until is not None and last_until - self.overlap < start:
+                logger.warning(f"⚠️  {account_name} [{kind}] last polled {last_until:%Y-%m-%d %H:%M}; older bills are left to the daily run")
+            summary = await self._poll_one(account_name, kind, start, until)
+            if not summary["stopped"] and not summary["errors"] and not self.dry_run:
+                marks.setdefault(account_name, {})[kind] = until.strftime(MARK_FORMAT)
+            return summary
+
+        targets = self._targets()
+        for result in await asyncio.gather(*(run(*t) for t in targets), return_exceptions=True):
+            if isinstance(result, BaseException):
+                logger.error(f"❌ Poll failed: {result}")
+                continue
+            results.append(result)
+        _save_marks(marks)
+
+        if self.sync.outbox is not None and not self.dry_run:
+            self.sync.drain_result = await drain_outbox(self.sync.outbox, self.sync.holded_api, accounts=[a for a, _ in targets])
+
+        pushed = sum(r["created_invoices"] + r["queued"] for r in results)
+        seen = sum(r["fetched"] for r in results)
+        logger.info(f"⏱️  Poll: {seen} bills in the window, {pushed} new pushed, "
+                    f"{sum(r['skipped_by_hash'] for r in results)} already pushed, {sum(r['errors'] for r in results)} errors")
+        return results
+
+    async def run_forever(self, interval_minutes: float = POLL_INTERVAL_MINUTES) -> None:
+        """Poll every *interval_minutes*; each poll gets that much time as its deadline."""
+        interval = interval_minutes * 60
+        while True:
+            started = time.monotonic()
+            self.sync.begin_run(deadline=Deadline(interval * 0.9))
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"❌ Poll round failed: {e}")
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+async def poll(account_names: Optional[list[str]] = None, *, once: bool = True, deadline: Optional[Deadline] = None, **options) -> list[dict]:
+    interval = options.pop("interval_minutes", POLL_INTERVAL_MINUTES)
+    async_service = AsyncService(deadline=deadline or Deadline(interval * 60 * 0.9))
+    poller = MicroBatchPoller(async_service, account_names, **options)
+    try:
+        if once:
+            return await poller.poll_once()
+        await poller.run_forever(interval)
+        return []
+    finally:
+        await async_service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batch polling of the latest Clorian bills.")
+    parser.add_argument("--account", action="append", help="Clorian account name (repeatable, default: all accounts)")
+    parser.add_argument("--simplified", action="store_true", help="Also poll simplified bills (accounts without daily summaries)")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL_MINUTES, help="Minutes between polls")
+    parser.add_argument("--window", type=float, default=POLL_WINDOW_MINUTES, help="Longest window fetched by one poll, minutes")
+    parser.add_argument("--overlap", type=float, default=POLL_OVERLAP_MINUTES, help="Minutes re-read before the previous poll")
+    parser.add_argument("--once", action="store_true", help="Run a single poll and exit (cron / timer trigger)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(poll(
+        args.account,
+        once=args.once,
+        interval_minutes=args.interval,
+        kinds=("normal", "simplified") if args.simplified else ("normal",),
+        window_minutes=args.window,
+        overlap_minutes=args.overlap,
+        dry_run=args.dry_run,
+    ))
+    for r in results:
+        print(f"{r['account']:<40} {r['kind']:<10} {r['window'][0]} → {r['window'][1]}  fetched {r['fetched']}, "
+              f"new {r['created_invoices'] + r['queued']}, already pushed {r['skipped_by_hash']}, errors {r['errors']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    main()
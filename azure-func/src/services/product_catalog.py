@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from src.services.bill_model import BillLine
+from src.services.clorian_service import ClorianService
+from src.config.settings import STATE_DIR, _slug, get_clorian_account
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.getenv("SYNC_PRODUCTS_TTL_SECONDS", str(6 * 3600)))
+# Clorian bill lines carry no productId yet, so nothing can be looked up: off until they do
+CATALOG_ENABLED = os.getenv("SYNC_PRODUCT_CATALOG", "0").lower() in ("1", "true", "yes")
+
+
+def _product_id(product: dict):
+    return product.get("productId", product.get("id"))
+
+
+class ProductCatalog:
+    """
+    Per-account cache of the Clorian product master.
+
+    - O(1) lookup by product id (dict index built once per download)
+    - TTL: the catalog is only revalidated once it is older than `ttl`
+    - revalidation uses `If-None-Match` when Clorian sent an ETag (304 → keep)
+    - disk snapshot under STATE_DIR/products so a cold start does not refetch
+    """
+    def __init__(self, clorian: ClorianService, *, ttl: float = DEFAULT_TTL, snapshot_dir: Optional[str] = None):
+        self.clorian = clorian
+        self.ttl = ttl
+        self.snapshot_path = os.path.join(snapshot_dir or os.path.join(STATE_DIR, "products"), f"{_slug(clorian.name)}.json")
+        self.etag: Optional[str] = None
+        self.fetched_at = 0.0
+        self._index: Dict[str, dict] = {}
+        self._lock = asyncio.Lock()
+        # optional Clorian productId → Holded product/service id mapping from credentials.json
+        self.holded_ids: Dict[str, str] = {
+            str(k): v for k, v in (get_clorian_account(clorian.name).get("holded_products") or {}).items()
+        }
+        self._load_snapshot()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def is_fresh(self) -> bool:
+        return bool(self._index) and time.time() - self.fetched_at < self.ttl
+
+    def _build_index(self, products: list) -> None:
+        self._index = {str(_product_id(p)): p for p in products if _product_id(p) is not None}
+
+    def _load_snapshot(self) -> None:
+        try:
+            with open(self.snapshot_path) as f:
+                snap = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.etag = snap.get("etag")
+        self.fetched_at = snap.get("fetched_at", 0.0)
+        self._build_index(snap.get("products") or [])
+        logger.debug(f"📦 Loaded {len(self._index)} products for {self.clorian.name} from snapshot")
+
+    def _save_snapshot(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            tmp = self.snapshot_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"etag": self.etag, "fetched_at": self.fetched_at, "products": list(self._index.values())}, f, ensure_ascii=False)
+            os.replace(tmp, self.snapshot_path)
+        except OSError as e:
+            logger.warning(f"⚠️  Could not write product snapshot for {self.clorian.name}: {e}")
+
+    async def refresh(self, *, force: bool = False) -> None:
+        """Make sure the catalog is fresh: no request while within the TTL."""
+        async with self._lock:
+            if self.is_fresh and not force:
+                return
+            status, products, etag = await self.clorian.get_products_conditional(self.etag if self._index else None)
+            if status == 304:
+                logger.debug(f"📦 Product catalog for {self.clorian.name} unchanged (304)")
+            elif products is not None:
+                self._build_index(products)
+                self.etag = etag
+                logger.info(f"📦 Product catalog for {self.clorian.name}: {len(self._index)} products")
+            else:
+                logger.warning(f"⚠️  Product catalog refresh for {self.clorian.name} failed ({status}); keeping {len(self._index)} cached products")
+                return
+            self.fetched_at = time.time()
+            self._save_snapshot()
+
+    # LOOKUPS
+    def get(self, product_id) -> Optional[dict]:
+        if product_id is None:
+            return None
+        return self._index.get(str(product_id))
+
+    def line_name(self, line: BillLine) -> str:
+        product = self.get(line.product_id)
+        name = product and (product.get("name") or product.get("productName"))
+        if name:
+            return f"{name} (Reserva {line.reservation_id})"
+        return f"Reserva {line.reservation_id if line.reservation_id is not None else ''}"
+
+    def holded_service_id(self, line: BillLine) -> Optional[str]:
+        if line.product_id is None:
+            return None
+        return self.holded_ids.get(str(line.product_id))
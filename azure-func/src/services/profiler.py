@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from src.config.settings import STATE_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PROFILE_ENABLED = os.getenv("SYNC_PROFILE", "0").lower() in ("1", "true", "yes")
+PROFILE_INTERVAL = float(os.getenv("SYNC_PROFILE_INTERVAL_MS", "10")) / 1000
+REPORTS_DIR = os.path.join(STATE_DIR, "reports")
+MAX_TASKS_PER_SAMPLE = 200
+APP_PREFIX = "src."
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _thread_stack(frame) -> list[str]:
+    """Frames of the loop thread, root first, starting at the callback the event loop is running."""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    # drop asyncio's own run_forever / _run_once / Handle._run prefix
+    for i in range(len(frames) - 1, -1, -1):
+        if frames[i].f_code.co_name == "_run" and frames[i].f_code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+            frames = frames[i + 1:]
+            break
+    return [_label(f) for f in frames]
+
+
+def _await_chain(coro) -> list[str]:
+    """Suspended stack of a task: its coroutine and everything it is awaiting, outermost first."""
+    chain = []
+    while coro is not None and len(chain) < 64:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        chain.append(_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return chain
+
+
+def _is_idle(frame) -> bool:
+    """The loop thread is blocked in the selector: every task is waiting on I/O or a timer."""
+    return frame.f_code.co_name in ("select", "poll") and frame.f_code.co_filename.endswith("selectors.py")
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for one event loop, aware of coroutines.
+
+    A daemon thread looks at the loop thread every `interval` seconds. When
+    Python code is running, its stack is recorded under `on-cpu`, rooted at
+    the coroutine of the current task. When the loop sits in the selector,
+    every pending task's await chain is recorded under `waiting` (one sample
+    per task), which is where Clorian and Holded I/O time shows up. Nothing
+    runs unless `start()` is called.
+    """
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        """Start sampling the calling thread (the one running the event loop)."""
+        self.thread_id = threading.get_ident()
+        try:
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sync-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"🔬 Sampling profiler started (every {self.interval * 1000:.0f} ms)")
+        return self
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.monotonic() - self.started
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:           # a racing task set / frame must never kill the run
+                continue
+
+    def _task_root(self, task) -> str:
+        coro = task.get_coro()
+        return f"task:{getattr(coro, '__qualname__', type(coro).__name__)}"
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        self.samples += 1
+        if self.loop is not None and _is_idle(frame):
+            self.idle_samples += 1
+            tasks = [t for t in asyncio.all_tasks(self.loop) if not t.done()][:MAX_TASKS_PER_SAMPLE]
+            for task in tasks:
+                self.stacks[("waiting", self._task_root(task), *_await_chain(task.get_coro()))] += 1
+            if not tasks:
+                self.stacks[("idle",)] += 1
+            return
+        task = asyncio.current_task(self.loop) if self.loop is not None else None
+        root = self._task_root(task) if task is not None else "no-task"
+        self.stacks[("on-cpu", root, *_thread_stack(frame))] += 1
+
+    # REPORTS
+    def folded(self) -> list[str]:
+        """Brendan Gregg's folded format (`a;b;c count`), for flamegraph.pl / speedscope / inferno."""
+        return [f"{';'.join(stack)} {count}" for stack, count in sorted(self.stacks.items())]
+
+    def top(self, n: int = 25) -> str:
+        on_cpu_self, on_cpu_total, waiting = Counter(), Counter(), Counter()
+        for stack, count in self.stacks.items():
+            if stack[0] == "on-cpu" and len(stack) > 2:
+                on_cpu_self[stack[-1]] += count
+                for label in set(stack[2:]):
+                    on_cpu_total[label] += count
+            elif stack[0] == "waiting":
+                # innermost frame of our own code: the service call the task is blocked in
+                app_frames = [label for label in stack[2:] if label.startswith(APP_PREFIX)]
+                waiting[app_frames[-1] if app_frames else stack[-1]] += count
+        busy = self.samples - self.idle_samples
+        lines = [
+            f"{self.samples} samples over {self.duration:.1f}s (every {self.interval * 1000:.0f} ms): "
+            f"{busy} running Python, {self.idle_samples} waiting on I/O",
+        ]
+        for title, counter, total in (("On-CPU, self", on_cpu_self, busy), ("On-CPU, inclusive", on_cpu_total, busy),
+                                      ("Waiting tasks, by the app call they are blocked in (task-samples)", waiting, sum(waiting.values()))):
+            lines += ["", title, "-" * len(title)]
+            for label, count in counter.most_common(n):
+                lines.append(f"{count:>8} {count / total * 100 if total else 0:>6.1f}%  {label}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, stem: Optional[str] = None) -> tuple[str, str]:
+        """Write `<stem>.folded` and `<stem>.top.txt` (default: STATE_DIR/reports/run-<timestamp>)."""
+        stem = stem or os.path.join(REPORTS_DIR, f"run-{datetime.utcnow():%Y%m%dT%H%M%S}")
+        os.makedirs(os.path.dirname(os.path.abspath(stem)), exist_ok=True)
+        with open(stem + ".folded", "w") as f:
+            f.write("\n".join(self.folded()) + "\n")
+        with open(stem + ".top.txt", "w") as f:
+            f.write(self.top())
+        logger.info(f"🔬 Profile written to {stem}.folded / .top.txt ({self.samples} samples)")
+        return stem + ".folded", stem + ".top.txt"
@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from dateutil import tz
+
+from src.services.bill_model import ClorianBill
+from src.services.bill_summary import SummaryInvoice, bill_series, load_summary_coverage, load_summary_mapping, summary_number
+from src.services.clorian_service import ClorianService
+from src.services.holded_service import HoldedService
+from src.config.settings import CLORIAN_ACCOUNTS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+KEYS = ["day", "series"]
+
+
+def _series(numbers: pd.Series) -> pd.Series:
+    """ALE25-00067 → ALE25 (everything before the last dash); summaries ALEFS25-R20250701(-2) → ALEFS25."""
+    return numbers.str.extract(r"^(.+?)(?:-R\d{8}(?:-\d+)?|-[^-]*)$", expand=False).fillna(numbers)
+
+
+def _day(ts: np.ndarray) -> pd.Series:
+    # date_ts (and the Holded `date` built from it) is billDate read as host-local time: render it back the same way
+    return pd.Series(pd.to_datetime(ts, unit="s", utc=True).tz_convert(tz.tzlocal()).strftime("%Y-%m-%d"))
+
+
+class _Columns:
+    """
+    Append-only column buffers turned into a DataFrame once at the end, typed
+    per column so an empty window still gives string/number columns.
+    """
+    def __init__(self, **dtypes):
+        self.dtypes = dtypes
+        self.cols = {n: [] for n in dtypes}
+
+    def add(self, *values) -> None:
+        for col, v in zip(self.cols.values(), values):
+            col.append(v)
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame({n: pd.Series(v, dtype=self.dtypes[n]) for n, v in self.cols.items()})
+
+
+class _Summaries:
+    """
+    Simplified bills of a `simplified_summary` account folded into the summary
+    invoices the sync issues for them: the one the summary map puts the bill in,
+    else the next one of its day & series (base, or -2, -3... for late bills).
+    """
+    def __init__(self, account: str):
+        self.account = account
+        self.mapping = load_summary_mapping(account)
+        self.coverage = load_summary_coverage(account)
+        self.today = datetime.utcnow().strftime("%Y-%m-%d")
+        self.invoices: dict[str, SummaryInvoice] = {}
+        self.open = 0
+
+    def add(self, bill: ClorianBill) -> None:
+        if bill.day >= self.today:
+            self.open += 1               # day not closed: the sync has not summarized it yet
+            return
+        series = bill_series(bill.bill_number)
+        number = self.mapping.get(bill.bill_number)
+        if number is None:
+            issued, _ = self.coverage.get((bill.day, series), (set(), set()))
+            number = summary_number(series, bill.day)
+            if issued:
+                number = f"{number}-{len(issued) + 1}"
+        inv = self.invoices.get(number)
+        if inv is None:
+            inv = self.invoices[number] = SummaryInvoice(self.account, bill.day, series, number)
+        inv.add(bill)
+
+    def flush(self, bills: "_Columns", taxes: "_Columns") -> None:
+        """One bill row per summary; Holded taxes each rounded line subtotal at its rate."""
+        for inv in self.invoices.values():
+            lines = [(line.tax_pct, round(line.subtotal, 2)) for line in inv.lines.values()]
+            line_taxes = [base * pct / 100 for pct, base in lines]
+            bills.add(self.account, inv.number, inv.date_ts, sum(base for _, base in lines), sum(line_taxes), len(lines))
+            for (pct, base), tax in zip(lines, line_taxes):
+                taxes.add(inv.number, pct, base, tax)
+        if self.open:
+            logger.info(f"🧾 {self.open} simplified bills of {self.account} from today left out: not summarized yet")
+
+
+# LOADERS
+async def load_clorian(account_names: list[str], start_date: str, end_date: str, *, simplified: Optional[bool] = None, concurrency: int = 10) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Stream Clorian bills of every account into three frames:
+    bills (one row per bill), taxes (one row per billTaxes entry) and
+    failed_slices (day slices Clorian did not return: their bills are absent).
+    `simplified=None` loads both the normal and the simplified endpoint.
+    Simplified bills of `simplified_summary` accounts are compared per summary
+    invoice (see `_Summaries`), not per ticket.
+    """
+    summarized = {acc["name"] for acc in CLORIAN_ACCOUNTS if acc.get("simplified_summary")}
+    bills = _Columns(account=object, number=object, ts="int64", base="float64", tax="float64", lines="int64")
+    taxes = _Columns(number=object, rate="float64", base="float64", tax="float64")
+    failed = _Columns(account=object, endpoint=object, slice=object)
+    kinds = [False, True] if simplified is None else [simplified]
+    seen: set[str] = set()
+
+    for account_name in account_names:
+        cs = ClorianService(account_name)
+        await cs.refresh_token()
+        for kind in kinds:
+            summaries = _Summaries(account_name) if kind and account_name in summarized else None
+            async for raw in cs.iter_bills(start_date=start_date, end_date=end_date, simplified=kind, concurrency=concurrency):
+                b = ClorianBill.from_dict(raw)
+                if b.bill_number in seen:
+                    # one docNumber in Holded: a repeated number would multiply rows in every join
+                    logger.warning(f"⚠️  {b.bill_number} returned twice by Clorian ({account_name}), counted once")
+                    continue
+                seen.add(b.bill_number)
+                if summaries is not None:
+                    summaries.add(b)
+                    continue
+                # Holded receives the rounded line subtotals, so that is the expected base
+                bills.add(account_name, b.bill_number, b.date_ts, sum(l.subtotal for l in b.lines), b.tax_amount, len(b.lines))
+                for t in b.taxes:
+                    taxes.add(b.bill_number, t.tax_rate, t.tax_basis, t.tax_amount)
+            if summaries is not None:
+                summaries.flush(bills, taxes)
+            endpoint = "simplified" if kind else "normal"
+            for window in cs.failed_slices.get(endpoint, []):
+                failed.add(account_name, endpoint, window)
+
+    return *clorian_frames(bills, taxes), failed.frame()
+
+
+def clorian_frames(bills: _Columns, taxes: _Columns) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Clorian bill/tax frames with the derived day, series and percent rate columns."""
+    bills_df = bills.frame()
+    taxes_df = taxes.frame()
+    bills_df["day"] = _day(bills_df["ts"].to_numpy())
+    bills_df["series"] = _series(bills_df["number"].astype(str))
+    taxes_df["rate"] = np.where(taxes_df["rate"] <= 1, taxes_df["rate"] * 100, taxes_df["rate"]).round(2)
+    return bills_df, taxes_df
+
+
+async def load_holded(holded: HoldedService, start_ts: int, end_ts: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Load Holded invoices of the window into docs and product-line frames, page by page."""
+    docs = _Columns(id=object, number=object, ts="int64", base="float64", tax="float64")
+    lines = _Columns(id=object, rate="float64", base="float64")
+
+    async for page in holded.iter_documents(start_ts, end_ts, doc_type="invoice"):
+        for d in page:
+            number = d.get("docNumber") or d.get("invoiceNum")
+            if not number:
+                continue
+            base = 0.0
+            for p in d.get("products") or []:
+                sub = p.get("subtotal")
+                if sub is None:
+                    sub = (p.get("price") or 0) * (p.get("units") or 1)
+                base += sub
+                lines.add(d.get("id"), p.get("tax") or 0, sub)
+            docs.add(d.get("id"), number, d.get("date") or 0, d.get("subtotal", base), d.get("tax") or 0)
+
+    return holded_frames(docs, lines)
+
+
+def holded_frames(docs: _Columns, lines: _Columns) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Holded document/line frames with the derived day, series and tax columns."""
+    docs_df = docs.frame()
+    lines_df = lines.frame()
+    docs_df["day"] = _day(docs_df["ts"].to_numpy())
+    docs_df["series"] = _series(docs_df["number"].astype(str))
+    lines_df["tax"] = lines_df["base"] * lines_df["rate"] / 100
+    return docs_df, lines_df
+
+
+# RECONCILIATION
+def reconcile(c_bills: pd.DataFrame, c_taxes: pd.DataFrame, h_docs: pd.DataFrame, h_lines: pd.DataFrame, *, tolerance: float = 0.02) -> dict[str, pd.DataFrame]:
+    """
+    Compare both sides bill by bill and in aggregate.
+
+    Returns DataFrames: missing (in Clorian, not in Holded), extra (in Holded
+    for a Clorian series, not in Clorian), duplicates (Holded documents sharing
+    a number), mismatched (amounts differ by more than `tolerance`), daily
+    (per day/series totals) and tax_rates (per day/series/rate totals). Only
+    the first document of a duplicated number takes part in the comparison.
+    """
+    known_series = c_bills["series"].unique()
+    c_bills = c_bills.drop_duplicates("number")
+    h_docs = h_docs[h_docs["series"].isin(known_series)]
+    duplicates = h_docs[h_docs.duplicated("number", keep=False)].sort_values(["number", "ts"])[["id", "number", "day", "series", "base", "tax"]]
+    h_docs = h_docs.drop_duplicates("number")
+    h_lines = h_lines.merge(h_docs[["id", *KEYS]], on="id")
+
+    joined = c_bills.merge(
+        h_docs[["number", "base", "tax"]],
+        on="number", how="outer", suffixes=("_clorian", "_holded"), indicator=True,
+    )
+    missing = joined[joined["_merge"] == "left_only"][["account", "number", "day", "series", "base_clorian", "tax_clorian"]]
+    extra = h_docs[~h_docs["number"].isin(c_bills["number"])][["number", "day", "series", "base", "tax"]]
+
+    both = joined[joined["_merge"] == "both"].copy()
+    both["base_diff"] = (both["base_holded"] - both["base_clorian"]).round(2)
+    both["tax_diff"] = (both["tax_holded"] - both["tax_clorian"]).round(2)
+    mismatched = both[(both["base_diff"].abs() > tolerance) | (both["tax_diff"].abs() > tolerance)][
+        ["account", "number", "day", "series", "base_clorian", "base_holded", "base_diff", "tax_clorian", "tax_holded", "tax_diff"]
+    ]
+
+    c_daily = c_bills.groupby(KEYS).agg(bills_clorian=("number", "size"), base_clorian=("base", "sum"), tax_clorian=("tax", "sum"))
+    h_daily = h_docs.groupby(KEYS).agg(bills_holded=("number", "size"), base_holded=("base", "sum"), tax_holded=("tax", "sum"))
+    daily = c_daily.join(h_daily, how="outer").fillna(0)
+    daily["bills_diff"] = daily["bills_holded"] - daily["bills_clorian"]
+    daily["base_diff"] = (daily["base_holded"] - daily["base_clorian"]).round(2)
+    daily["tax_diff"] = (daily["tax_holded"] - daily["tax_clorian"]).round(2)
+
+    c_rates = c_taxes.merge(c_bills[["number", *KEYS]], on="number").groupby([*KEYS, "rate"]).agg(
+        base_clorian=("base", "sum"), tax_clorian=("tax", "sum"))
+    h_rates = h_lines.groupby([*KEYS, "rate"]).agg(
+        base_holded=("base", "sum"), tax_holded=("tax", "sum"))
+    tax_rates = c_rates.join(h_rates, how="outer").fillna(0)
+    tax_rates["base_diff"] = (tax_rates["base_holded"] - tax_rates["base_clorian"]).round(2)
+    tax_rates["tax_diff"] = (tax_rates["tax_holded"] - tax_rates["tax_clorian"]).round(2)
+
+    return {
+        "missing": missing.reset_index(drop=True),
+        "extra": extra.reset_index(drop=True),
+        "duplicates": duplicates.reset_index(drop=True),
+        "mismatched": mismatched.reset_index(drop=True),
+        "daily": daily.round(2).reset_index(),
+        "tax_rates": tax_rates.round(2).reset_index(),
+    }
+
+
+async def run_reconciliation(account_names: list[str], start_date: str, end_date: str, out_dir: str, *, simplified: Optional[bool] = None, tolerance: float = 0.02, concurrency: int = 10, allow_partial: bool = False) -> dict[str, int]:
+    """
+    Load both sides, reconcile and write one CSV per report into *out_dir*.
+    A Clorian slice that failed would show its Holded invoices as extra, so it
+    aborts the run unless `allow_partial`, which writes it to failed_slices.csv.
+    """
+    started = time.time()
+    c_bills, c_taxes, failed = await load_clorian(account_names, start_date, end_date, simplified=simplified, concurrency=concurrency)
+    logger.info(f"📄 Loaded {len(c_bills)} Clorian bills in {time.time() - started:.1f}s")
+    if len(failed):
+        slices = ", ".join(f"{r.account}/{r.endpoint} {r.slice}" for r in failed.itertuples())
+        if not allow_partial:
+            raise RuntimeError(f"Clorian did not return {len(failed)} slice(s), reconciliation would be wrong: {slices}")
+        logger.error(f"❌ {len(failed)} Clorian slice(s) missing, extra/daily of those days are unreliable: {slices}")
+
+    # same padding as the sync prefetch
+    w_start = int(datetime.strptime(start_date, "%Y-%m-%d").timestamp()) - 86400
+    w_end = int(datetime.strptime(end_date, "%Y-%m-%d").timestamp()) + 2 * 86400
+    holded = HoldedService()
+    try:
+        h_docs, h_lines = await load_holded(holded, w_start, w_end)
+    finally:
+        await holded.close()
+    logger.info(f"📚 Loaded {len(h_docs)} Holded documents in {time.time() - started:.1f}s")
+
+    t0 = time.time()
+    reports = reconcile(c_bills, c_taxes, h_docs, h_lines, tolerance=tolerance)
+    reports["failed_slices"] = failed
+    logger.info(f"⚖️  Reconciled in {time.time() - t0:.2f}s")
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, df in reports.items():
+        df.to_csv(os.path.join(out_dir, f"{name}.csv"), index=False)
+    return {name: len(df) for name, df in reports.items()}
+
+
+def main():
+    today = datetime.utcnow().date()
+    parser = argparse.ArgumentParser(description="Reconcile Clorian bills against Holded invoices.")
+    parser.add_argument("--account", action="append", help="Clorian account name (repeatable, default: all accounts)")
+    parser.add_argument("--start", default=str(today - timedelta(days=365)), help="YYYY-MM-DD")
+    parser.add_argument("--end", default=str(today), help="YYYY-MM-DD")
+    parser.add_argument("--kind", choices=("normal", "simplified", "all"), default="all")
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--out", default="reconciliation", help="Output directory for the CSV reports")
+    parser.add_argument("--allow-partial", action="store_true", help="Write the reports even if some Clorian slices failed (listed in failed_slices.csv)")
+    args = parser.parse_args()
+
+    accounts = args.account or [acc["name"] for acc in CLORIAN_ACCOUNTS]
+    simplified = {"normal": False, "simplified": True, "all": None}[args.kind]
+    counts = asyncio.run(run_reconciliation(
+        accounts, args.start, args.end, args.out,
+        simplified=simplified,
+        tolerance=args.tolerance,
+        concurrency=args.concurrency,
+        allow_partial=args.allow_partial,
+    ))
+    for name, n in counts.items():
+        print(f"{name:>10}: {n}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    main()
@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """The dependency is considered down: the call was not attempted."""
+
+
+class RetryBudgetExhausted(RuntimeError):
+    """The run spent all the retries it was allowed."""
+
+
+class DeadlineExceeded(RuntimeError):
+    """Not enough time left in the run for the next piece of work."""
+
+
+# Errors that end a run (or an account) early but cleanly: stop, save the resume point, report
+STOP_ERRORS = (CircuitOpenError, RetryBudgetExhausted, DeadlineExceeded)
+
+
+class CircuitBreaker:
+    """
+    Per-host breaker: `closed` → `open` after `failure_threshold` consecutive
+    failures, `half_open` after `reset_timeout` seconds (a single probe call
+    is let through), back to `closed` on success or `open` on failure.
+    Calls go through `guard()`, so the probe is never left in flight by an
+    error or a cancellation the caller did not record.
+    """
+    def __init__(self, host: str, *, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError when the call must not be made; True when the call is the half-open probe."""
+        if self.state == "closed":
+            return False
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuit for {self.host} is open ({self.failures} consecutive failures)")
+            self.state = "half_open"
+            logger.info(f"🟡 Circuit for {self.host} half-open, probing")
+        if self._probe_in_flight:
+            raise CircuitOpenError(f"Circuit for {self.host} is half-open, probe in flight")
+        self._probe_in_flight = True
+        return True
+
+    def release_probe(self) -> None:
+        """The probe ended without saying anything about the host (cancelled): let the next call probe."""
+        self._probe_in_flight = False
+
+    @contextmanager
+    def guard(self):
+        """
+        `before_call()` plus cleanup for the probe: a probe that raises before
+        recording its result (disconnect, payload error, timeout...) counts as
+        a failure, a cancelled one (hedge loser, deadline, cancelled prefetch)
+        just frees the slot. Results recorded inside the block win.
+        """
+        probe = self.before_call()
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            if probe and self._probe_in_flight:
+                self.release_probe()
+            raise
+        except BaseException:
+            if probe and self._probe_in_flight:
+                self.record_failure()
+            raise
+        finally:
+            if probe and self._probe_in_flight:
+                self.release_probe()
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info(f"🟢 Circuit for {self.host} closed again")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning(f"🔴 Circuit for {self.host} opened after {self.failures} consecutive failures")
+
+
+class RetryBudget:
+    """Retries allowed for a whole run, shared by every service and account."""
+    def __init__(self, max_retries: int | None = None):
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("SYNC_RETRY_BUDGET", "60"))
+        self.spent: Dict[str, int] = {}
+
+    @property
+    def remaining(self) -> int:
+        return self.max_retries - sum(self.spent.values())
+
+    def spend(self, source: str) -> None:
+        if self.remaining <= 0:
+            raise RetryBudgetExhausted(f"Retry budget of {self.max_retries} exhausted ({self.spent})")
+        self.spent[source] = self.spent.get(source, 0) + 1
+
+
+class AIMDLimiter:
+    """
+    Adaptive cap on in-flight requests to one host (additive increase,
+    multiplicative decrease).
+
+    Every healthy response (2xx/4xx under `latency_target` seconds) adds
+    `1 / limit`, so the cap grows by about one per round of requests; a
+    timeout, 5xx, 429 or connection error multiplies it by `backoff`, once per
+    round: failures of requests started before the last decrease are ignored. The cap never leaves [minimum, maximum]: `maximum` is
+    the process-wide ceiling for the host, whatever the callers ask for.
+    """
+    def __init__(self, host: str, *, initial: int = 10, minimum: int = 1, maximum: int = 32,
+                 latency_target: float = 5.0, backoff: float = 0.5):
+        self.host = host
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.started = time.monotonic()
+        self.history: List[Tuple[float, int]] = [(0.0, int(self.limit))]
+        self._last_decrease = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop = None
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:      # new event loop (asyncio.run per shard / per test)
+            self._loop, self._cond, self.in_flight = loop, asyncio.Condition(), 0
+        return self._cond
+
+    def _set(self, limit: float) -> None:
+        before = int(self.limit)
+        self.limit = max(self.minimum, min(self.maximum, limit))
+        if int(self.limit) != before:
+            self.history.append((round(time.monotonic() - self.started, 2), int(self.limit)))
+
+    def on_success(self, latency: float) -> None:
+        if latency <= self.latency_target:
+            self._set(self.limit + 1 / self.limit)
+
+    def on_overload(self, started: float) -> None:
+        if started >= self._last_decrease:
+            self._last_decrease = time.monotonic()
+            self._set(self.limit * self.backoff)
+            logger.info(f"🐢 {self.host} overloaded, concurrency down to {int(self.limit)}")
+
+    def record(self, status: Optional[int], started: float) -> None:
+        """Feed one finished request started at *started* (monotonic); status None means timeout / connection error."""
+        if status is None or status >= 500 or status == 429:
+            self.on_overload(started)
+        else:
+            self.on_success(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a free slot under the current cap; yields the monotonic start time."""
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield time.monotonic()
+        finally:
+            async with cond:
+                self.in_flight -= 1
+                cond.notify_all()
+
+    def report(self) -> dict:
+        limits = [l for _, l in self.history]
+        return {"limit": int(self.limit), "min": min(limits), "max": max(limits), "history": self.history[-200:]}
+
+
+class Deadline:
+    """
+    Wall-clock budget of a whole run, created at the entry point (timer
+    trigger, Celery task, CLI) and handed down to every service. Requests
+    use `cap(op_timeout)` as their timeout, and work that would not fit
+    in what is left is not started (`check`).
+    """
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    @classmethod
+    def from_env(cls, default: Optional[float] = 9 * 60) -> "Deadline":
+        """SYNC_DEADLINE_SECONDS (default: 9 minutes of the 10-minute Azure functionTimeout; 0 = none)."""
+        seconds = float(os.getenv("SYNC_DEADLINE_SECONDS", default or 0))
+        return cls(seconds or None)
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, needed: float = 0.0, what: str = "work") -> None:
+        remaining = self.remaining()
+        if remaining <= needed:
+            raise DeadlineExceeded(f"Deadline: {max(remaining, 0):.0f}s left, not starting {what} (needs ~{needed:.0f}s)")
+
+    def cap(self, op_timeout: Optional[float], what: str = "request") -> float:
+        """min(op_timeout, remaining); raises DeadlineExceeded when nothing is left."""
+        self.check(0.0, what)
+        remaining = self.remaining()
+        return remaining if op_timeout is None else min(op_timeout, remaining)
+
+    def client_timeout(self, timeout, what: str = "request"):
+        """Copy of an aiohttp `ClientTimeout` whose total is capped to the remaining budget."""
+        if self.expires_at is None:
+            return timeout
+        return type(timeout)(
+            total=self.cap(timeout.total, what),
+            connect=timeout.connect,
+            sock_connect=timeout.sock_connect,
+            sock_read=timeout.sock_read,
+        )
+
+
+# (deadline, retry budget) of the request in progress, see run_scope
+_scope: ContextVar[Optional[Tuple[Deadline, Optional[RetryBudget]]]] = ContextVar("sync_run_scope", default=None)
+
+
+@contextmanager
+def run_scope(deadline: Deadline, retry_budget: Optional[RetryBudget] = None):
+    """
+    Give the code inside (and every task it starts) its own deadline and retry
+    budget, whatever the long-lived services it calls were configured with:
+    concurrent requests served by one worker never share or reset each other's.
+    """
+    token = _scope.set((deadline, retry_budget))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+class RunLimits:
+    """`deadline` / `retry_budget` of a service: those of the current `run_scope`, else its own."""
+    _deadline: Optional[Deadline] = None
+    _retry_budget: Optional[RetryBudget] = None
+
+    @property
+    def deadline(self) -> Deadline:
+        scope = _scope.get()
+        return scope[0] if scope is not None else self._deadline
+
+    @deadline.setter
+    def deadline(self, value: Deadline) -> None:
+        self._deadline = value
+
+    @property
+    def retry_budget(self) -> Optional[RetryBudget]:
+        scope = _scope.get()
+        return scope[1] if scope is not None else self._retry_budget
+
+    @retry_budget.setter
+    def retry_budget(self, value: Optional[RetryBudget]) -> None:
+        self._retry_budget = value
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_LIMITERS: Dict[str, AIMDLimiter] = {}
+
+
+def get_breaker(url_or_host: str) -> CircuitBreaker:
+    """Return the process-wide breaker of the host of *url_or_host*."""
+    host = urlparse(url_or_host).hostname or url_or_host
+    breaker = _BREAKERS.get(host)
+    if breaker is None:
+        breaker = _BREAKERS[host] = CircuitBreaker(
+            host,
+            failure_threshold=int(os.getenv("SYNC_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("SYNC_BREAKER_RESET_SECONDS", "30")),
+        )
+    return breaker
+
+
+def get_limiter(url_or_host: str, *, initial: int = 10) -> AIMDLimiter:
+    """Return the process-wide adaptive limiter of the host of *url_or_host* (*initial* only applies on creation)."""
+    host = urlparse(url_or_host).hostname or url_or_host
+    limiter = _LIMITERS.get(host)
+    if limiter is None:
+        limiter = _LIMITERS[host] = AIMDLimiter(
+            host,
+            initial=initial,
+            maximum=int(os.getenv("SYNC_MAX_CONCURRENCY", "32")),
+            latency_target=float(os.getenv("SYNC_LATENCY_TARGET_SECONDS", "5")),
+        )
+    return limiter
+
+
+def spend_retry(budget: Optional[RetryBudget], source: str) -> None:
+    """Charge one retry to *budget* (no-op when the caller runs without one)."""
+    if budget is not None:
+        budget.spend(source)
+
+
+def breaker_report() -> dict:
+    return {host: {"state": b.state, "times_opened": b.times_opened} for host, b in _BREAKERS.items()}
+
+
+def limiter_report() -> dict:
+    return {host: l.report() for host, l in _LIMITERS.items()}
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+from src.config.settings import STATE_DIR, _slug
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SERIES_DIR = os.path.join(STATE_DIR, "series")
+# A jump bigger than this is not indexed (the bill still goes through the full duplicate check)
+MAX_GAP = int(os.getenv("SYNC_SERIES_MAX_GAP", "5000"))
+
+
+def parse_bill_number(bill_number: Optional[str]) -> Optional[tuple[str, int]]:
+    """'ALE25-00067' → ('ALE25', 67); None when the number is not `<series>-<digits>`."""
+    if not bill_number or "-" not in bill_number:
+        return None
+    series, _, number = bill_number.rpartition("-")
+    if not series or not number.isdigit():
+        return None
+    return series, int(number)
+
+
+class SeriesIndex:
+    """
+    Which bill numbers of an account are already in Holded, per series
+    (STATE_DIR/series/<account>.json). Clorian numbers are sequential, so a
+    series is just the pushed range [floor, hwm] plus the sparse set of
+    numbers inside it never pushed (gaps). A bill covered by the range and
+    not a gap needs no duplicate lookup; anything else gets the full check.
+    """
+    def __init__(self, account: str, *, state_dir: str = SERIES_DIR):
+        self.account = account
+        self.path = os.path.join(state_dir, f"{_slug(account)}.json")
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            self._mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path) as f:
+                raw = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._mtime, raw = None, {}
+        self.series: dict[str, dict] = {
+            name: {"floor": s["floor"], "hwm": s["hwm"], "gaps": set(s.get("gaps", ()))} for name, s in raw.items()
+        }
+
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def stale(self) -> bool:
+        """Another process rewrote the file since it was read or saved here, and nothing is pending."""
+        return not self._dirty and self._file_mtime() != self._mtime
+
+    def __len__(self) -> int:
+        return len(self.series)
+
+    def covers(self, bill_number: Optional[str]) -> bool:
+        parsed = parse_bill_number(bill_number)
+        if parsed is None:
+            return False
+        s = self.series.get(parsed[0])
+        return s is not None and s["floor"] <= parsed[1] <= s["hwm"] and parsed[1] not in s["gaps"]
+
+    def mark(self, bill_number: Optional[str]) -> None:
+        """Record *bill_number* as present in Holded (created, queued or found as duplicate)."""
+        parsed = parse_bill_number(bill_number)
+        if parsed is None:
+            return
+        name, n = parsed
+        s = self.series.get(name)
+        if s is None:
+            self.series[name] = {"floor": n, "hwm": n, "gaps": set()}
+        elif n > s["hwm"]:
+            if n - s["hwm"] > MAX_GAP:
+                logger.debug(f"#️⃣  {bill_number}: {n - s['hwm']} numbers after the mark of {name}, not indexed")
+                return
+            s["gaps"].update(range(s["hwm"] + 1, n))
+            s["hwm"] = n
+        elif n < s["floor"]:
+            if s["floor"] - n > MAX_GAP:
+                return
+            s["gaps"].update(range(n + 1, s["floor"]))
+            s["floor"] = n
+        elif n in s["gaps"]:
+            s["gaps"].discard(n)
+        else:
+            return
+        self._dirty = True
+
+    def seed(self, bill_numbers: Iterable[str]) -> None:
+        """Build the index from numbers known to be pushed (e.g. the hash store), oldest first."""
+        parsed = sorted(p for p in map(parse_bill_number, bill_numbers) if p is not None)
+        for name, n in parsed:
+            self.mark(f"{name}-{n}")
+
+    def report(self) -> dict:
+        return {name: {"floor": s["floor"], "hwm": s["hwm"], "gaps": len(s["gaps"])} for name, s in sorted(self.series.items())}
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({name: {"floor": s["floor"], "hwm": s["hwm"], "gaps": sorted(s["gaps"])} for name, s in self.series.items()},
+                          f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self._dirty = False
+            self._mtime = self._file_mtime()
+        except OSError as e:
+            logger.warning(f"⚠️  Could not persist the series index of {self.account}: {e}")
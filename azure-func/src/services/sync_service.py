@@ -1,5 +1,6 @@
 import asyncio
 import json
+import os
 import pytz
 import re
 import base64
@@ -7,55 +8,144 @@ import logging
 from datetime import datetime, timedelta
 from collections import defaultdict
 from typing import Dict, Any
-from decimal import Decimal, ROUND_HALF_UP
 import random
 import traceback
 import time
 
 from src.services.clorian_service import ClorianService
 from src.services.holded_service import HoldedService
-from src.config.settings import CLORIAN_ACCOUNTS, get_offset, increment_offset, _clean
+from src.services.bill_model import ClorianBill
+from src.services.bill_archive import ARCHIVE_ENABLED
+from src.services.bill_hashes import BillHashStore, bill_hash, pending_changes, record_change
+from src.services.bill_summary import SummaryInvoice, load_summary_coverage, summarize_bills, record_summary_mapping
+from src.services.memory import BillSpool, DocIndex, MemoryCeiling, StageMeter, peak_rss_mb
+from src.services.series_index import SeriesIndex
+from src.services.resilience import STOP_ERRORS, Deadline, RetryBudget, RunLimits, breaker_report, limiter_report
+from src.services.outbox import OUTBOX_ENABLED, Outbox, drain_outbox
+from src.services.product_catalog import CATALOG_ENABLED, ProductCatalog
+from src.services.profiler import PROFILE_ENABLED, SamplingProfiler
+from src.services.tracing import current_span, start_span, traced, tracer
+from src.services.warm_cache import begin_invocation, cache_report, contacts, holded_docs, product_catalogs
+from src.services.sync_state import LOCK_WAIT_SECONDS, AccountBusy, AccountLock, load_resume_point, save_resume_point, clear_resume_point
+from src.config.settings import CLORIAN_ACCOUNTS, get_offset, increment_offset, _clean, STATE_DIR_PERSISTENT
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+GENERIC_CONTACT_ID = "6870e8c71d1ac03be40e7f16"
 
-class AsyncService:
+# First billDate synced by the daily run
+SYNC_START_DATE = datetime.strptime(os.getenv("SYNC_START_DATE", "2024-07-01"), "%Y-%m-%d")
+
+# Clorian paymentOrigin (lower-cased) → Holded payment method id
+PAYMENT_METHOD_IDS = {
+    "cash": "68a83139c4854186960aac9f",
+    "deferred": "68a820fcb61533185f0c0f8d",
+    "transfer": "688356b04be192a8cd05faea",
+    "voucher": "68a8210f30da643cd9023447",
+    "prepayment": "68a821360555d6c96f0b14de",
+    "paypal-e": "68a827829a619d9b360f6632",
+    "paypal": "68a8217b8562a06be406fa40",
+    "adyen-pos-v": "68a827b3fe7f2e3d7408388f",
+    "pos2": "68a827c5a73dd0823409fd1e",
+    "alipay": "68a827d7543c5c1f860f0659",
+    "wechat": "68a827e2219129001a0540cc",
+    "bizum": "68a827f0471f09253f07c069",
+}
+
+
+def run_summary(account: str, kind: str, dry_run: bool = False) -> dict:
+    """Empty per-account counters filled by the push stages."""
+    return {"account": account, "kind": kind, "dry_run": dry_run, "fetched": 0, "processed": 0,
+            "skipped_duplicates": 0, "skipped_by_hash": 0, "skipped_by_mark": 0, "changed": 0, "pending_changes": 0, "created_contacts": 0, "created_invoices": 0, "queued": 0, "errors": 0,
+            "stopped": None, "duration": 0.0}
+
+
+class AsyncService(RunLimits):
     """Main class to handle asynchronous operations for syncing data between Clorian and Holded."""
-    def __init__(self):
+    def __init__(self, *, max_retries: int | None = None, use_outbox: bool | None = None, deadline: Deadline | None = None, archive: bool | None = None):
         self.tz_mad = pytz.timezone("Europe/Madrid")
-        self.holded_api = HoldedService()
-        self._contact_cache = {}
+        # One retry budget and one deadline per run, shared by Holded and every Clorian account
+        self.retry_budget = RetryBudget(max_retries)
+        self.deadline = deadline or Deadline()
+        self.holded_api = HoldedService(retry_budget=self._retry_budget, deadline=self._deadline)
+        # contacts, tokens, Holded doc numbers and catalogs live in process-level caches (src.services.warm_cache)
+        begin_invocation()
+        self._hash_stores: dict[str, BillHashStore] = {}
+        self._series_indexes: dict[str, SeriesIndex] = {}
+        self._clorian_accounts: dict[str, ClorianService] = {}
+        # Invoices go through the durable outbox (SYNC_OUTBOX=1) instead of being posted inline
+        use_outbox = OUTBOX_ENABLED if use_outbox is None else use_outbox
+        if use_outbox and not STATE_DIR_PERSISTENT:
+            # rows queued in the temp dir would be lost with the instance, never reaching Holded
+            logger.error("❌ SYNC_OUTBOX needs SYNC_STATE_DIR on persistent storage: invoices are posted inline")
+            use_outbox = False
+        self.outbox = Outbox() if use_outbox else None
+        self.drain_result: dict | None = None
+        # Every fetched bill also goes to the local columnar archive (SYNC_ARCHIVE=1)
+        self.archive = None
+        if ARCHIVE_ENABLED if archive is None else archive:
+            from src.services.bill_archive import BillArchive    # pandas/pyarrow only when archiving
+            self.archive = BillArchive()
+        # Past this RSS the fetched bills and the Holded duplicate index spill to disk
+        self.memory = MemoryCeiling()
+
+    @traced("sync.run", lambda self, account_names=None, **k: {"accounts": ", ".join(account_names or ["all"]), "dry_run": k.get("dry_run", False)})
+    async def fetch_clorian_invoices(self, account_names: list[str] | None = None, *, start_date: datetime | None = None, end_date: datetime | None = None, summaries: bool | None = None, dry_run: bool = False, concurrency: int = 10, max_execution_time: float = 8 * 60) -> list[dict]:
+        """
+        Main function to fetch invoices from Clorian and push them to Holded.
 
-    async def fetch_clorian_invoices(self):
-        """Main function to fetch invoices from Clorian."""
-        logger.info(f"📋 Starting invoice sync for {len(CLORIAN_ACCOUNTS)} Clorian accounts")
+        Without arguments this is the daily run: every account, normal bills from
+        SYNC_START_DATE (resuming an interrupted run) and, for accounts with
+        `simplified_summary`, simplified bills as daily summaries. Returns one
+        summary dict per account and kind.
+        """
+        accounts = [acc for acc in CLORIAN_ACCOUNTS if account_names is None or acc.get("name") in account_names]
+        logger.info(f"📋 Starting invoice sync for {len(accounts)} Clorian accounts")
         tasks = []
 
-        for i, acc in enumerate(CLORIAN_ACCOUNTS, 1):
+        for i, acc in enumerate(accounts, 1):
             account_name = acc.get("name", "Unknown Account")
-            logger.info(f"🏢 Processing account {i}/{len(CLORIAN_ACCOUNTS)}: {account_name}")
+            logger.info(f"🏢 Processing account {i}/{len(accounts)}: {account_name}")
             
             try:
-                clorian_account = ClorianService(account_name)
-                logger.info(f"🔑 Refreshing authentication token for {account_name}")
-                await clorian_account.refresh_token()
-                logger.info(f"✅ Token refreshed successfully for {account_name}")
+                clorian_account = self._clorian_account(account_name)
+                logger.info(f"🔑 Checking authentication token for {account_name}")
+                await clorian_account._ensure_token()      # warm token of this worker, or a fresh one
+                logger.info(f"✅ Token ready for {account_name}")
                 
                 # Sync from fixed start date
-                now = datetime.utcnow()
-                start_date = datetime(2024, 7, 1)
-                sync_period = f"{start_date.strftime('%Y-%m-%d %H:%M:%S')} -> {now.strftime('%Y-%m-%d %H:%M:%S')}"
-                logger.info(f"📅 Fixed sync period for {account_name}: {sync_period}")
+                now = end_date or datetime.utcnow()
+                account_start = start_date or SYNC_START_DATE
+                sync_period = f"{account_start.strftime('%Y-%m-%d %H:%M:%S')} -> {now.strftime('%Y-%m-%d %H:%M:%S')}"
+                logger.info(f"📅 Sync period for {account_name}: {sync_period}")
 
+                # An interrupted previous run resumes where it stopped (daily run only)
+                resume_from = load_resume_point(account_name, "normal") if start_date is None else None
+                if resume_from and resume_from > account_start:
+                    logger.info(f"⏩ Resuming {account_name} from {resume_from:%Y-%m-%d %H:%M:%S}")
+
+                options = dict(end_date=now, dry_run=dry_run, concurrency=concurrency, max_execution_time=max_execution_time)
                 tasks.append(
-                    self.process_account_invoices(
+                    self._locked(account_name, "normal", dry_run, self.process_account_invoices(
                         clorian_account,
-                        start_date=start_date,
-                        end_date=now,
+                        start_date=max(account_start, resume_from or account_start),
                         simplified=False,
-                    )
+                        **options,
+                    ))
                 )
+                # Simplified tickets are pushed as one summary invoice per day & series
+                summarize = summaries if summaries is not None else acc.get("simplified_summary")
+                if summarize and self._summary_map_durable(account_name, dry_run):
+                    tasks.append(
+                        self._locked(account_name, "simplified", dry_run, self.process_account_invoices(
+                            clorian_account,
+                            start_date=account_start,
+                            simplified=True,
+                            summarize=True,
+                            **options,
+                        ))
+                    )
                 
             except Exception as e:
                 logger.error(f"❌ Failed to setup account {account_name}: {e}")
@@ -64,15 +154,163 @@ class AsyncService:
 
         if not tasks:
             logger.warning("⚠️  No accounts were successfully initialized")
-            return
+            return []
             
         logger.info(f"⚡ Running parallel sync for {len(tasks)} accounts")
+        producers_done = asyncio.Event()
+        drain = None
+        if self.outbox is not None and not dry_run:
+            # the pusher runs next to the producers and finishes the queue once they are done
+            # (only these accounts: other processes may be draining theirs)
+            drain = asyncio.create_task(drain_outbox(self.outbox, self.holded_api, accounts=[a.get("name") for a in accounts], until=producers_done))
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            producers_done.set()
+            if drain is not None:
+                self.drain_result = await drain
+        failures = [r for r in results if isinstance(r, BaseException)]
+        if failures:
+            logger.error(f"❌ Error during parallel account sync: {failures[0]}")
+            raise failures[0]
+        logger.info("✅ All account syncs completed")
+        return results
+
+    async def _locked(self, account_name: str, kind: str, dry_run: bool, run) -> dict:
+        """
+        Await *run* holding the account lock, so a poll or backfill of the same
+        account and kind never pushes the same bills meanwhile. Waits a little
+        for a poll in progress; still busy after that, the account is skipped.
+        """
+        if dry_run:
+            return await run                        # nothing is written
+        lock = AccountLock(account_name, kind, "daily run")
+        try:
+            await lock.acquire_within(max(0.0, min(LOCK_WAIT_SECONDS, self.deadline.remaining() - 60)))
+        except AccountBusy as e:
+            run.close()
+            logger.warning(f"🔒 Skipping {account_name} [{kind}]: {e}")
+            summary = run_summary(account_name, kind, dry_run)
+            summary["stopped"] = str(e)
+            return summary
         try:
-            await asyncio.gather(*tasks)
-            logger.info("✅ All account syncs completed")
+            return await run
+        finally:
+            lock.release()
+
+    def begin_run(self, *, deadline: Deadline | None = None, max_retries: int | None = None) -> None:
+        """
+        Fresh retry budget and deadline for the next run of a long-lived service
+        that runs one thing at a time (the poller loop). Requests served
+        concurrently by one service (SyncBill) use `run_scope` instead.
+        """
+        self.retry_budget = RetryBudget(max_retries)
+        self.deadline = deadline or Deadline()
+        begin_invocation()
+        for service in (self.holded_api, *self._clorian_accounts.values()):
+            service.retry_budget = self._retry_budget
+            service.deadline = self._deadline
+
+    def _clorian_account(self, account_name: str) -> ClorianService:
+        """Cached ClorianService of *account_name* (keeps its access token between runs)."""
+        service = self._clorian_accounts.get(account_name)
+        if service is None:
+            service = self._clorian_accounts[account_name] = ClorianService(account_name, retry_budget=self._retry_budget, deadline=self._deadline)
+        return service
+
+    async def sync_bills_by_id(self, account_name: str, bill_ids: list[int], *, dry_run: bool = False) -> dict:
+        """
+        On-demand sync of a few normal bills, end to end: fetch each one with
+        `get_bill_by_id`, then the usual push (hash check, duplicate check,
+        contact, transform, invoice). Does not touch the daily resume point.
+        """
+        started = time.time()
+        clorian_account = self._clorian_account(account_name)
+        summary = run_summary(account_name, "on-demand", dry_run)
+        summary.update(requested=len(bill_ids), not_found=[])
+        replies = await asyncio.gather(*(clorian_account.get_bill_by_id(bill_id) for bill_id in bill_ids), return_exceptions=True)
+
+        bills = []
+        for bill_id, reply in zip(bill_ids, replies):
+            if isinstance(reply, STOP_ERRORS):
+                summary["stopped"] = str(reply)
+                continue
+            if isinstance(reply, Exception):
+                logger.error(f"❌ Could not fetch bill {bill_id} from {account_name}: {reply}")
+                summary["errors"] += 1
+                continue
+            found = [b for b in (reply if isinstance(reply, list) else [reply] if reply else []) if str(b.get("billId")) == str(bill_id)]
+            if not found:
+                summary["not_found"].append(bill_id)
+            bills.extend(ClorianBill.from_dict(b) for b in found)
+            await self.archive_bills(account_name, "normal", found)
+        summary["fetched"] = len(bills)
+        logger.info(f"🎯 On-demand sync of {len(bills)}/{len(bill_ids)} bills of {account_name}")
+
+        if bills:
+            holded_docs_cache = await self._prefetch_holded_docs(bills)
+            try:
+                await self.push_bills(clorian_account, bills, holded_docs_cache, summary, process_start=started,
+                                      max_execution_time=float("inf"), dry_run=dry_run)
+            finally:
+                if holded_docs_cache is not None:
+                    holded_docs_cache.close()
+        summary["duration"] = round(time.time() - started, 2)
+        return summary
+
+    async def close(self):
+        """Release pooled HTTP connections (logs Holded connection reuse stats)."""
+        await self.holded_api.close()
+        if self.outbox is not None:
+            self.outbox.close()
+        logger.info(f"🔁 Retries spent: {sum(self.retry_budget.spent.values())}/{self.retry_budget.max_retries} {self.retry_budget.spent}, circuits: {breaker_report()}")
+        for host, rep in limiter_report().items():
+            logger.info(f"🎚️  {host} concurrency: now {rep['limit']}, range {rep['min']}–{rep['max']} ({len(rep['history'])} changes)")
+        logger.info("🔥 Warm caches: " + ", ".join(
+            f"{name} {r['hits']}/{r['hits'] + r['misses']} hits ({r['size']} kept)" for name, r in cache_report().items()))
+        logger.info(f"🧠 Peak RSS {peak_rss_mb():.0f} MB (spill ceiling {self.memory.ceiling_mb:.0f} MB, limit {self.memory.limit_mb:.0f} MB)")
+        if tracer.enabled:
+            tracer.flush()
+
+    async def _product_catalog(self, clorian_account: "ClorianService") -> ProductCatalog | None:
+        """Cached product catalog of the account (None if disabled or it cannot be loaded: lines keep generic names)."""
+        if not CATALOG_ENABLED:
+            return None
+        catalog = product_catalogs.get(clorian_account.name)
+        if catalog is None:
+            catalog = ProductCatalog(clorian_account)
+            product_catalogs.put(clorian_account.name, catalog)
+        catalog.clorian = clorian_account          # revalidate with this run's deadline and retry budget
+        try:
+            await catalog.refresh()
         except Exception as e:
-            logger.error(f"❌ Error during parallel account sync: {e}")
-            raise
+            logger.warning(f"⚠️  Product catalog unavailable for {clorian_account.name}: {e}")
+        return catalog if len(catalog) else None
+
+    async def archive_bills(self, account_name: str, kind: str, raw_bills: list[dict]) -> None:
+        """Write raw bills to the local archive off the event loop (never fails the sync)."""
+        if self.archive is None or not raw_bills:
+            return
+        try:
+            await asyncio.to_thread(self.archive.write, account_name, kind, raw_bills)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not archive {len(raw_bills)} bills of {account_name}: {e}")
+
+    def _hash_store(self, account_name: str) -> BillHashStore:
+        """Hash store of *account_name*, read again when another run (or an ack) rewrote it since."""
+        store = self._hash_stores.get(account_name)
+        if store is None or store.stale():
+            store = self._hash_stores[account_name] = BillHashStore(account_name)
+        return store
+
+    def _series_index(self, account_name: str) -> SeriesIndex:
+        index = self._series_indexes.get(account_name)
+        if index is None or index.stale():
+            index = self._series_indexes[account_name] = SeriesIndex(account_name)
+            if not len(index):
+                # first run with the index: every hashed bill number is known to be in Holded
+                index.seed(self._hash_store(account_name).hashes)
+        return index
 
     def _holded_id(self, obj: dict | None) -> str | None:
         """Returns Holded document / contact ID"""
@@ -80,35 +318,149 @@ class AsyncService:
             return None
         return obj.get("_id") or obj.get("id") or obj.get("contactId")
 
-    async def process_account_invoices(self, clorian_account: "ClorianService",  start_date: str | datetime | None = None, end_date: str | datetime | None = None, days_back: int = 365 * 10,  doc_limit: int = None, simplified: bool = False):
+    @traced("account.sync", lambda self, clorian_account, *a, **k: {"account": clorian_account.name, "kind": "simplified" if k.get("simplified") else "normal"})
+    async def process_account_invoices(self, clorian_account: "ClorianService",  start_date: str | datetime | None = None, end_date: str | datetime | None = None, days_back: int = 365 * 10,  doc_limit: int = None, simplified: bool = False, summarize: bool = False, *, dry_run: bool = False, concurrency: int = 10, max_execution_time: float = 8 * 60) -> dict:
+        """
+        Sync one account and kind of bill. With `dry_run` everything is fetched,
+        checked and transformed but nothing is written to Holded. Returns the
+        account summary (counters, duration, whether the run was stopped early).
+        """
         account_name = clorian_account.name
+        kind = "simplified" if simplified else "normal"
+        summary = run_summary(account_name, kind, dry_run)
         logger.info(f"📊 Starting invoice processing for account: {account_name}")
         process_start = time.time()
-        
+        meter = StageMeter(summary)
+
         try:
+            # a fetch that cannot finish would only leave nothing to push: skip the account
+            self.deadline.check(30, f"the Clorian fetch of {account_name}")
             logger.info(f"🔍 Fetching invoices from Clorian API (account: {account_name}) [simplified={simplified}]")
-            if simplified:
-                all_invoices = await clorian_account.get_bills(
-                    start_date=start_date,
-                    end_date=end_date,
-                    days_back=days_back,
-                    concurrency=10,
-                )
-            else:
-                all_invoices = await clorian_account.get_bills_v2(
-                    start_date=start_date,
-                    end_date=end_date,
-                    days_back=days_back,
-                    concurrency=10,
-                )
+            all_invoices = BillSpool(self.memory)
+
+            async def on_slice(index: int, raw: list[dict]) -> None:
+                # Parse once per slice: dates, amounts, tax rate and NIF are reused by every stage below
+                await self.archive_bills(account_name, kind, raw)
+                all_invoices.add(index, [ClorianBill.from_dict(b) for b in raw])
+
+            fetch = clorian_account.get_bills if simplified else clorian_account.get_bills_v2
+            await fetch(
+                start_date=start_date,
+                end_date=end_date,
+                days_back=days_back,
+                concurrency=concurrency,
+                on_slice=on_slice,
+            )
+            meter.mark("fetch", bills=len(all_invoices), spilled=all_invoices.spilled)
+            failed = clorian_account.failed_slices.get(kind, [])
+            if failed:
+                # those days came back empty: count them so the run does not look clean
+                logger.error(f"❌ {account_name} [{kind}]: {len(failed)} slices failed after every retry: {', '.join(failed)}")
+                summary["failed_slices"] = failed
+                summary["errors"] += len(failed)
             logger.info(f"📄 Retrieved {len(all_invoices)} invoices from {account_name}")
+            limiter = getattr(clorian_account, "limiter", None)
+            if limiter is not None:
+                summary["clorian_concurrency"] = int(limiter.limit)   # where the adaptive limiter ended for this fetch
+            hedger = getattr(clorian_account, "hedger", None)
+            if hedger is not None and hedger.requests:
+                summary["hedging"] = hedger.report()
+        except STOP_ERRORS as e:
+            logger.warning(f"🛑 Skipping {account_name}: {e}")
+            summary["stopped"] = str(e)
+            return summary
         except Exception as e:
             logger.error(f"❌ Failed to fetch invoices from {account_name}: {e}")
             raise
 
+        summary["fetched"] = len(all_invoices)
+        holded_docs_cache = None
+        try:
+            # numbers under the series marks are known to be in Holded: the prefetch only covers the rest
+            holded_docs_cache = await self._prefetch_holded_docs(all_invoices, None if summarize else self._series_index(account_name))
+            meter.mark("prefetch", docs=len(holded_docs_cache or ()), spilled=getattr(holded_docs_cache, "spilled", False))
+
+            if simplified and summarize:
+                await self._push_summaries(clorian_account, all_invoices, holded_docs_cache, process_start, max_execution_time, summary)
+                meter.mark("push")
+                meter.finish(self.memory)
+                return summary
+
+            stopped_at = await self.push_bills(clorian_account, all_invoices, holded_docs_cache, summary,
+                                               process_start=process_start, max_execution_time=max_execution_time, dry_run=dry_run)
+            meter.mark("push")
+            meter.finish(self.memory)
+        finally:
+            # spill files of the bills and of the Holded index go away even when the push raised
+            all_invoices.close()
+            if holded_docs_cache is not None:
+                holded_docs_cache.close()
+        if not dry_run:
+            if stopped_at:
+                save_resume_point(account_name, kind, stopped_at.bill_date, summary["stopped"])
+            else:
+                clear_resume_point(account_name, kind)
+
+        # Log processing summary
+        duration = time.time() - process_start
+        summary["duration"] = round(duration, 2)
+        logger.info(f"📊 Account {account_name} processing summary:")
+        logger.info(f"  📄 Total invoices processed: {summary['processed']}")
+        logger.info(f"  ⏭️  Skipped duplicates: {summary['skipped_duplicates']}")
+        logger.info(f"  #️⃣  Skipped by hash: {summary['skipped_by_hash']} (changed: {summary['changed']}), by series mark: {summary['skipped_by_mark']}")
+        logger.info(f"  👤 New contacts created: {summary['created_contacts']}")
+        logger.info(f"  📋 New invoices created: {summary['created_invoices']}")
+        logger.info(f"  ❌ Errors encountered: {summary['errors']}")
+        logger.info(f"  ⏱️  Processing time: {duration:.2f} seconds")
+        
+        if summary["errors"] > 0:
+            logger.warning(f"⚠️  Account {account_name} completed with {summary['errors']} errors")
+        else:
+            logger.info(f"✅ Account {account_name} processed successfully")
+        current_span().set(fetched=summary["fetched"], created_invoices=summary["created_invoices"], errors=summary["errors"], stopped=summary["stopped"])
+        return summary
+
+    async def _prefetch_holded_docs(self, bills, series: SeriesIndex | None = None) -> DocIndex | None:
+        """
+        Pre-fetch the numbers of the Holded documents in the window of *bills* to
+        avoid per-invoice duplicate calls. Only docNumber → id is kept, page by
+        page, and the index spills to disk past the memory ceiling. Bills that
+        *series* already covers do not widen the window. An empty index means
+        "none of them is in Holded"; None means the prefetch failed (look up
+        each bill). The caller closes the index.
+        """
+        holded_docs_cache = DocIndex(self.memory)
+        try:
+            w_start = w_end = None
+            for x in bills:
+                if series is not None and series.covers(x.bill_number):
+                    continue
+                w_start = x.date_ts if w_start is None else min(w_start, x.date_ts)
+                w_end = x.date_ts if w_end is None else max(w_end, x.date_ts)
+            if w_start is not None:
+                # small padding
+                w_start -= 86400
+                w_end   += 86400
+                async for docs in self.holded_api.iter_documents(w_start, w_end, doc_type="invoice", page_size=200):
+                    pairs = [(str(key), d.get("id") or str(key)) for d in docs if (key := d.get("docNumber") or d.get("invoiceNum"))]
+                    holded_docs_cache.add_many(pairs)
+                    for number, doc_id in pairs:
+                        holded_docs.put(number, doc_id)
+            logger.info(f"📚 Prefetched {len(holded_docs_cache)} Holded docs for duplicate detection")
+        except Exception:
+            holded_docs_cache.close()
+            logger.warning("⚠️  Could not prefetch Holded documents; falling back to per-invoice lookup")
+            return None
+        return holded_docs_cache
+
+    async def push_bills(self, clorian_account: "ClorianService", all_invoices: list[ClorianBill], holded_docs_cache: DocIndex | None, summary: dict, *, process_start: float, max_execution_time: float, dry_run: bool = False) -> ClorianBill | None:
+        """
+        Push *all_invoices* to Holded (duplicate check, contact, invoice) adding
+        the counters to *summary*. Returns the bill the push stopped at (time
+        limit, circuit open, retry budget spent) or None when every bill was handled.
+        """
+        account_name = clorian_account.name
         GENERIC_CODE = ""
-        GENERIC_CONTACT_ID = "6870e8c71d1ac03be40e7f16"
-        self._contact_cache = {}
         
         # Processing counters
         processed_count = 0
@@ -116,39 +468,29 @@ class AsyncService:
         created_contacts = 0
         created_invoices = 0
         errors_count = 0
+        skipped_by_hash = 0
+        skipped_by_mark = 0
+        changed = 0
+        queued = 0
+        hashes = self._hash_store(account_name)
+        series = self._series_index(account_name)
+        pending = {n: c["new_hash"] for n, c in pending_changes(account_name).items()}
 
         def has_nif(n: str) -> bool:
             return bool(n and n.strip())
 
         # Process as many as the platform allows, but keep a hard time budget
+        # (max_execution_time defaults to 8 minutes to leave buffer for cleanup)
         max_invoices_per_run = 10**9  # effectively unlimited; controlled by time
-        max_execution_time = 8 * 60  # 8 minutes to leave buffer for cleanup
         
         if len(all_invoices) > max_invoices_per_run:
             logger.info(f"📅 Processing will be limited by execution time, not by a fixed count")
             # Sort by date (newest first)
-            all_invoices = sorted(all_invoices, key=lambda x: x.get('billDate', ''), reverse=True)
+            all_invoices = sorted(all_invoices, key=lambda x: x.date_ts, reverse=True)
             
-        # Pre-fetch existing Holded documents in the same time window to avoid per-invoice duplicate calls
-        try:
-            holded_docs_cache: dict[str, dict] = {}
-            if all_invoices:
-                min_date = min(x.get("billDate", "2099-12-31 23:59:59") for x in all_invoices)
-                max_date = max(x.get("billDate", "1970-01-01 00:00:00") for x in all_invoices)
-                w_start = int(datetime.strptime(min_date, "%Y-%m-%d %H:%M:%S").timestamp())
-                w_end   = int(datetime.strptime(max_date, "%Y-%m-%d %H:%M:%S").timestamp())
-                # small padding
-                w_start -= 86400
-                w_end   += 86400
-                docs = await self.holded_api.list_documents(w_start, w_end, doc_type="invoice", page_size=200)
-                for d in docs:
-                    key = d.get("docNumber") or d.get("invoiceNum")
-                    if key:
-                        holded_docs_cache[str(key)] = d
-            logger.info(f"📚 Prefetched {len(holded_docs_cache)} Holded docs for duplicate detection")
-        except Exception:
-            holded_docs_cache = {}
-            logger.warning("⚠️  Could not prefetch Holded documents; falling back to per-invoice lookup")
+        stopped = False
+        catalog = await self._product_catalog(clorian_account)
+        bill_seconds = 1.0      # EWMA of the time one bill takes, to stop before the run deadline
 
         logger.info(f"🔄 Processing {len(all_invoices)} invoices for {account_name}")
         for i, bill in enumerate(all_invoices, 1):
@@ -156,128 +498,339 @@ class AsyncService:
             elapsed_time = time.time() - process_start
             if elapsed_time > max_execution_time:
                 logger.warning(f"⏰ Stopping processing after {i-1} invoices due to time limit ({elapsed_time:.1f}s)")
+                stopped = "time limit"
                 break
+            # Don't start a bill that cannot finish before the run deadline
+            if self.deadline.remaining() < max(5.0, 2 * bill_seconds):
+                logger.warning(f"⏰ Stopping {account_name} after {i-1} invoices: {self.deadline.remaining():.1f}s left before the run deadline")
+                stopped = "deadline"
+                break
+            bill_start = time.time()
                 
             # Progress logging every 5 invoices
             if i % 5 == 0 or i == 1:
                 elapsed = elapsed_time
                 remaining_time = max_execution_time - elapsed
                 logger.info(f"📈 Progress: {i}/{len(all_invoices)} invoices ({(i/len(all_invoices)*100):.1f}%) - Elapsed: {elapsed:.1f}s, Remaining: {remaining_time:.1f}s")
+            # --- 0) content hash: same version as last push → nothing to do ----
+            digest = bill_hash(bill)
+            known_digest = hashes.get(bill.bill_number)
+            if known_digest == digest:
+                skipped_by_hash += 1
+                continue
+            if known_digest is not None:
+                # pushed before and changed since (annulled, amounts, customer…) → rectification queue;
+                # the hash stays at the pushed version until the change is acknowledged (bill_hashes --ack)
+                changed += 1
+                if not dry_run and pending.get(bill.bill_number) != digest:
+                    logger.info(f"✏️  Invoice {bill.bill_number} changed since it was pushed, queued for update")
+                    record_change(account_name, bill, known_digest, digest)
+                    pending[bill.bill_number] = digest
+                continue
+            # --- 0b) at or under the series mark and not a known gap → already in Holded
+            if series.covers(bill.bill_number):
+                skipped_by_mark += 1
+                if not dry_run:
+                    hashes.put(bill.bill_number, digest)
+                continue
+
+            bill_span = start_span("bill.push", account=account_name, bill=bill.bill_number)
+            cached_nif = None
             try:
-                bill_number = bill.get("billNumber", "Unknown")
+                bill_number = bill.bill_number or "Unknown"
                 logger.info(f"📋 Processing invoice {i}/{len(all_invoices)}: {bill_number} (Account: {account_name})")
                 
                 # --- 1) duplicados -------------------------------------------------
                 logger.info(f"🔍 Checking for duplicate invoice: {bill_number}")
                 duplicate_check_start = time.time()
-                duplicate_exists = holded_docs_cache.get(bill["billNumber"]) if holded_docs_cache else await self.holded_api.invoice_by_docnumber(bill["billNumber"])
+                duplicate_exists = holded_docs.get(bill.bill_number)
+                if not duplicate_exists:
+                    duplicate_exists = holded_docs_cache.get(bill.bill_number) if holded_docs_cache is not None else await self.holded_api.invoice_by_docnumber(bill.bill_number)
+                    if duplicate_exists:
+                        holded_docs.put(bill.bill_number, (self._holded_id(duplicate_exists) if isinstance(duplicate_exists, dict) else duplicate_exists) or bill.bill_number)
                 duplicate_check_time = time.time() - duplicate_check_start
                 logger.info(f"⏱️  Duplicate check completed in {duplicate_check_time:.2f}s")
                 
                 if duplicate_exists:
                     logger.info(f"⏭️  Invoice {bill_number} already exists in Holded, skipping")
                     skipped_duplicates += 1
+                    if not dry_run:
+                        hashes.put(bill.bill_number, digest)
+                        series.mark(bill.bill_number)
                     continue
 
-                nif = (bill.get("vatNumber") or "").strip().upper()
+                nif = bill.nif
                 holded_contact_id = None                       # ← siempre parte a None
 
                 # --- 2) contacto SOLO si hay NIF -----------------------------------
-                if has_nif(nif):
-                    logger.debug(f"👤 Processing contact with NIF: {nif} for invoice {bill_number}")
-                    holded_contact_id = self._contact_cache.get(nif)
-
-                    if not holded_contact_id:                  # no estaba cacheado
-                        logger.debug(f"🔍 Searching for existing contact with NIF: {nif}")
-                        existing = await self.holded_api.contact_by_code(code=nif)
-                        holded_contact_id = self._holded_id(existing)
-
-                        if not holded_contact_id:              # no existía en Holded
-                            logger.debug(f"🆕 Creating new contact for NIF: {nif}")
-                            contact_create_start = time.time()
-                            created = await self.holded_api.create_contact(
-                                self.transform_clorian_bill_to_holded_contact(bill)
-                            )
-                            contact_create_time = time.time() - contact_create_start
-                            holded_contact_id = self._holded_id(created)
-                            created_contacts += 1
-                            logger.debug(f"✅ Contact created successfully for NIF: {nif} in {contact_create_time:.2f}s")
-                        else:
-                            logger.debug(f"♻️  Using existing contact for NIF: {nif}")
+                with start_span("contact.resolve", bill=bill_number) as contact_span:
+                    if has_nif(nif):
+                        logger.debug(f"👤 Processing contact with NIF: {nif} for invoice {bill_number}")
+                        holded_contact_id = contacts.get(nif)
+
+                        if not holded_contact_id:                  # no estaba cacheado
+                            logger.debug(f"🔍 Searching for existing contact with NIF: {nif}")
+                            existing = await self.holded_api.contact_by_code(code=nif)
+                            holded_contact_id = self._holded_id(existing)
+
+                            if not holded_contact_id and dry_run:
+                                logger.info(f"🧪 [dry-run] Would create contact for NIF: {nif}")
+                                created_contacts += 1
+                                contact_span.set(source="created")
+                            elif not holded_contact_id:              # no existía en Holded
+                                logger.debug(f"🆕 Creating new contact for NIF: {nif}")
+                                contact_create_start = time.time()
+                                created = await self.holded_api.create_contact(
+                                    self.transform_clorian_bill_to_holded_contact(bill)
+                                )
+                                contact_create_time = time.time() - contact_create_start
+                                holded_contact_id = self._holded_id(created)
+                                created_contacts += 1
+                                contact_span.set(source="created")
+                                logger.debug(f"✅ Contact created successfully for NIF: {nif} in {contact_create_time:.2f}s")
+                            else:
+                                logger.debug(f"♻️  Using existing contact for NIF: {nif}")
+                                contact_span.set(source="holded")
 
-                        self._contact_cache[nif] = holded_contact_id  # cachear
+                            if holded_contact_id:
+                                contacts.put(nif, holded_contact_id)  # cachear (también para las próximas invocaciones)
+                        else:
+                            logger.debug(f"💾 Using cached contact for NIF: {nif}")
+                            cached_nif = nif
+                            contact_span.set(source="cache")
                     else:
-                        logger.debug(f"💾 Using cached contact for NIF: {nif}")
-                else:
-                    logger.debug(f"🔓 No NIF found for invoice {bill_number}, using generic contact")
+                        logger.debug(f"🔓 No NIF found for invoice {bill_number}, using generic contact")
+                        contact_span.set(source="generic")
 
                 # --- 3) construir factura ------------------------------------------
                 logger.debug(f"🏗️  Transforming Clorian invoice {bill_number} to Holded format")
-                inv = await self.transform_invoice_clorian_to_holded(
-                    bill,
-                    contact=bool(holded_contact_id)            # True si hay contacto real
-                )
+                with start_span("bill.transform", bill=bill_number, lines=len(bill.lines)):
+                    inv = await self.transform_invoice_clorian_to_holded(
+                        bill,
+                        contact=bool(holded_contact_id),           # True si hay contacto real
+                        catalog=catalog,
+                    )
 
                 inv.update(
                     contactId   = holded_contact_id or GENERIC_CONTACT_ID,
                     contactCode = nif or GENERIC_CODE,
                 )
 
+                if dry_run:
+                    logger.info(f"🧪 [dry-run] Would create invoice {bill_number} with {len(inv['items'])} lines")
+                    created_invoices += 1
+                    processed_count += 1
+                    continue
+
+                if self.outbox is not None:
+                    # durable hand-off: the drain stage pushes it (now or in a later run)
+                    self.outbox.enqueue(account_name, bill.bill_number, inv)
+                    hashes.put(bill.bill_number, digest)
+                    series.mark(bill.bill_number)
+                    queued += 1
+                    processed_count += 1
+                    continue
+
                 logger.info(f"📤 Creating invoice {bill_number} in Holded")
                 invoice_create_start = time.time()
-                await self.holded_api.create_invoice(inv)
+                created = await self.holded_api.create_invoice(inv)
                 invoice_create_time = time.time() - invoice_create_start
+                holded_docs.put(bill.bill_number, self._holded_id(created) or bill.bill_number)
+                hashes.put(bill.bill_number, digest)
+                series.mark(bill.bill_number)
                 created_invoices += 1
                 processed_count += 1
                 logger.info(f"✅ Invoice {bill_number} created successfully in Holded in {invoice_create_time:.2f}s")
 
+            except STOP_ERRORS as exc:
+                # Dependency down or retries used up: stop now, next run resumes from this bill
+                logger.warning(f"🛑 Stopping {account_name} at invoice {bill.bill_number}: {exc}")
+                bill_span.fail(exc)
+                stopped = str(exc)
+                break
             except Exception as exc:
                 errors_count += 1
-                logger.error(f'❌ Error processing invoice {bill.get("billNumber", "Unknown")} (billId: {bill.get("billId", "Unknown")}): {exc}')
+                bill_span.fail(exc)
+                if cached_nif:
+                    # the contact may have been deleted or merged in Holded since it was cached
+                    contacts.invalidate(cached_nif)
+                logger.error(f'❌ Error processing invoice {bill.bill_number or "Unknown"} (billId: {bill.bill_id or "Unknown"}): {exc}')
                 logger.error(f"Traceback: {traceback.format_exc()}")
             finally:
-                # Reduced sleep to speed up processing (was 0.5s)
-                time.sleep(0.1)
-                
-        # Log processing summary
-        duration = time.time() - process_start
-        logger.info(f"📊 Account {account_name} processing summary:")
-        logger.info(f"  📄 Total invoices processed: {processed_count}")
-        logger.info(f"  ⏭️  Skipped duplicates: {skipped_duplicates}")
-        logger.info(f"  👤 New contacts created: {created_contacts}")
-        logger.info(f"  📋 New invoices created: {created_invoices}")
-        logger.info(f"  ❌ Errors encountered: {errors_count}")
-        logger.info(f"  ⏱️  Processing time: {duration:.2f} seconds")
-        
-        if errors_count > 0:
-            logger.warning(f"⚠️  Account {account_name} completed with {errors_count} errors")
-        else:
-            logger.info(f"✅ Account {account_name} processed successfully")
+                # Reduced sleep to speed up processing (was 0.5s); non-blocking so
+                # the other accounts on this event loop keep running meanwhile
+                bill_span.end()
+                if not dry_run and self.outbox is None:
+                    await asyncio.sleep(0.1)
+                bill_seconds = 0.8 * bill_seconds + 0.2 * (time.time() - bill_start)
+
+        hashes.save()
+        series.save()
+        if skipped_by_hash or changed:
+            logger.info(f"#️⃣  {account_name}: {skipped_by_hash} bills unchanged since last push (skipped by hash), {changed} changed")
+        if skipped_by_mark:
+            logger.info(f"#️⃣  {account_name}: {skipped_by_mark} bills under their series mark skipped without a Holded lookup")
+
+        summary["processed"] += processed_count
+        summary["skipped_duplicates"] += skipped_duplicates
+        summary["skipped_by_hash"] += skipped_by_hash
+        summary["skipped_by_mark"] += skipped_by_mark
+        summary["changed"] += changed
+        summary["pending_changes"] = len(pending)
+        if pending:
+            logger.warning(f"✏️  {account_name}: {len(pending)} bills changed after they were pushed and wait for a rectification "
+                           f"(python -m src.services.bill_hashes --account \"{account_name}\")")
+        summary["created_contacts"] += created_contacts
+        summary["created_invoices"] += created_invoices
+        summary["queued"] += queued
+        summary["errors"] += errors_count
+        if stopped:
+            summary["stopped"] = stopped
+            return bill
+        return None
+
+    @staticmethod
+    def _summary_map_durable(account_name: str, dry_run: bool) -> bool:
+        """
+        Summaries need the summary map to outlive the instance: in the temp
+        STATE_DIR a recycle forgets which tickets were invoiced, and late ones
+        would never get their supplementary summary. Dry runs record nothing.
+        """
+        if STATE_DIR_PERSISTENT or dry_run:
+            return True
+        logger.error(f"❌ Summary invoices of {account_name} skipped: simplified_summary needs SYNC_STATE_DIR on persistent storage")
+        return False
+
+    async def _push_summaries(self, clorian_account: "ClorianService", bills: list[ClorianBill], holded_docs_cache: DocIndex | None, process_start: float, max_execution_time: float, result: dict) -> dict:
+        """
+        Push simplified bills as daily summary invoices (one per day & series).
+        Bills that reach Clorian after their day was summarized go out in a
+        supplementary summary <number>-2, -3... (coverage from the summary map).
+        """
+        account_name = clorian_account.name
+        if not self._summary_map_durable(account_name, result["dry_run"]):
+            result["errors"] += 1
+            result["stopped"] = "SYNC_STATE_DIR not set"
+            return result
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        summaries = summarize_bills(bills, account_name, until_day=today)
+        logger.info(f"🧾 {len(bills)} simplified bills grouped into {len(summaries)} summary invoices for {account_name}")
+
+        created = skipped = errors = covered = unmapped = 0
+        coverage = load_summary_coverage(account_name)
+        pending, late, suffix = [], set(), {}
+        for summary in summaries:
+            issued, mapped = coverage.get((summary.day, summary.series), (set(), set()))
+            if summary.number not in issued:
+                pending.append(summary)              # never issued by this sync (or issued before the map): as before
+                continue
+            missing = [n for n in summary.bill_numbers if n not in mapped]
+            if missing:
+                late.update(missing)
+                suffix[(summary.day, summary.series)] = len(issued) + 1
+            else:
+                skipped += 1
+        if late:
+            for extra in summarize_bills((b for b in bills if b.bill_number in late), account_name, until_day=today):
+                extra.number = f"{extra.number}-{suffix[(extra.day, extra.series)]}"
+                pending.append(extra)
+            pending.sort(key=lambda s: (s.day, s.series, s.number))
+            logger.info(f"🧾 {len(late)} late simplified bills of {account_name} go into supplementary summaries")
+
+        for summary in pending:
+            if time.time() - process_start > max_execution_time:
+                logger.warning(f"⏰ Stopping summary push for {account_name} due to time limit")
+                result["stopped"] = "time limit"
+                break
+            if self.deadline.remaining() < 5:
+                logger.warning(f"⏰ Stopping summary push for {account_name}: run deadline reached")
+                result["stopped"] = "deadline"
+                break
+            try:
+                exists = holded_docs_cache.get(summary.number) if holded_docs_cache is not None else await self.holded_api.invoice_by_docnumber(summary.number)
+                if exists:
+                    skipped += 1
+                    unmapped += 1                    # in Holded but not in the summary map: its late bills cannot be told apart
+                    continue
+                if result["dry_run"]:
+                    logger.info(f"🧪 [dry-run] Would create summary {summary.number} ({len(summary.bill_numbers)} bills)")
+                    created += 1
+                    covered += len(summary.bill_numbers)
+                    continue
+                await self.holded_api.create_invoice(self.transform_summary_to_holded(summary))
+                record_summary_mapping(summary)
+                created += 1
+                covered += len(summary.bill_numbers)
+                logger.info(f"✅ Summary {summary.number} created ({len(summary.bill_numbers)} bills, {len(summary.lines)} lines)")
+            except STOP_ERRORS as exc:
+                logger.warning(f"🛑 Stopping summary push for {account_name} at {summary.number}: {exc}")
+                result["stopped"] = str(exc)
+                break
+            except Exception as exc:
+                errors += 1
+                logger.error(f"❌ Error pushing summary {summary.number}: {exc}")
+                logger.error(f"Traceback: {traceback.format_exc()}")
+
+        logger.info(f"📊 Account {account_name} summary invoices: {created} created covering {covered} bills, "
+                    f"{skipped} already in Holded, {errors} errors, {time.time() - process_start:.2f}s")
+        if unmapped:
+            logger.warning(f"⚠️  {unmapped} summaries of {account_name} are in Holded but not in the summary map: late bills of those days are not checked")
+        result["processed"] += covered
+        result["skipped_duplicates"] += skipped
+        result["created_invoices"] += created
+        result["errors"] += errors
+        result["duration"] = round(time.time() - process_start, 2)
+        return result
 
-    async def transform_invoice_clorian_to_holded(self, clorian_invoice: dict, contact: bool):
-        """Build the JSON body for POST /documents/invoice (Holded)"""
-        bill_number = clorian_invoice.get("billNumber", "Unknown")
-        bill_id = clorian_invoice.get("billId", "Unknown")
+    def transform_summary_to_holded(self, summary: SummaryInvoice) -> Dict[str, Any]:
+        """Build the JSON body for POST /documents/invoice from a daily summary of simplified bills."""
+        items = [
+            {
+                "name":     f"Ventas simplificadas {summary.day} · IVA {line.tax_pct:g}% · {line.payment_origin or 'n/a'}",
+                "desc":     f"{line.bills} tickets",
+                "subtotal": round(line.subtotal, 2),
+                "tax":      line.tax_pct,
+                "units":    1,
+            }
+            for line in summary.lines.values()
+        ]
+        origins = summary.payment_origins
+        return {
+            "docType":         "invoice",
+            "invoiceNum":      summary.number,
+            "date":            summary.date_ts,
+            "contactName":     "cliente general",
+            "contactId":       GENERIC_CONTACT_ID,
+            "notes":           f"{len(summary.bill_numbers)} facturas simplificadas {summary.series} del {summary.day}: "
+                               f"{summary.bill_numbers[0]} … {summary.bill_numbers[-1]}",
+            "items":           items,
+            "paymentMethodId": PAYMENT_METHOD_IDS.get(origins.pop(), "") if len(origins) == 1 else "",
+        }
+
+    async def transform_invoice_clorian_to_holded(self, clorian_invoice: ClorianBill, contact: bool, *, catalog: ProductCatalog | None = None):
+        """Build the JSON body for POST /documents/invoice (Holded)
+
+        With a product *catalog*, lines are named after the Clorian product and
+        mapped to the configured Holded service when the line carries a productId.
+        """
+        bill_number = clorian_invoice.bill_number or "Unknown"
+        bill_id = clorian_invoice.bill_id or "Unknown"
         logger.debug(f"🔄 Starting transformation for invoice {bill_number} (ID: {bill_id})")
 
-        # --- utilidades -------------------------------------------------
-        def _round2(x: float) -> float:
-            return float(Decimal(str(x)).quantize(Decimal("0.01"), ROUND_HALF_UP))
+        has_nif = clorian_invoice.has_nif
+        country_code = clorian_invoice.country
 
-        has_nif = bool((clorian_invoice.get("vatNumber") or "").strip())
-        country_code = (clorian_invoice.get("country") or "")[:2].upper()
-        
         logger.debug(f"📋 Invoice details: has_nif={has_nif}, country={country_code}, contact={contact}")
 
         # ---------- CONTACT NAME (la parte importante) ------------------
         if has_nif:
             contact_name = (
-                clorian_invoice.get("legalEntityName")                   # empresa
+                clorian_invoice.legal_entity_name                        # empresa
                 or " ".join(                                             # persona
                     filter(None, (
-                        clorian_invoice.get("firstName"),
-                        clorian_invoice.get("lastName1"),
-                        clorian_invoice.get("lastName2"),
+                        clorian_invoice.first_name,
+                        clorian_invoice.last_name1,
+                        clorian_invoice.last_name2,
                     ))
                 ).strip()
             )
@@ -288,97 +841,74 @@ class AsyncService:
         # ---------- cabecera Holded -------------------------------------
         holded: Dict[str, Any] = {
             "docType":          "invoice",
-            "invoiceNum":       clorian_invoice["billNumber"],
-            "date":             int(datetime.strptime(
-                                    clorian_invoice["billDate"],
-                                    "%Y-%m-%d %H:%M:%S"
-                                  ).timestamp()),
+            "invoiceNum":       clorian_invoice.bill_number,
+            "date":             clorian_invoice.date_ts,
             "contactName":      contact_name,
-            "contactCode":      clorian_invoice.get("vatNumber", "") if has_nif else "",
-            "contactAddress":   clorian_invoice.get("address", ""),
-            "contactCity":      clorian_invoice.get("city", ""),
+            "contactCode":      clorian_invoice.nif,
+            "contactAddress":   clorian_invoice.address,
+            "contactCity":      clorian_invoice.city,
             "contactCountryCode": country_code,
-            "contactCp":        clorian_invoice.get("postalCode", ""),
+            "contactCp":        clorian_invoice.postal_code,
             "items":            [],
         }
 
         if contact:                           # ya teníamos el contacto creado
-            holded["contactId"] = clorian_invoice["clientId"]
+            holded["contactId"] = clorian_invoice.client_id
         # else:
         #     holded["contactId"] = "64ff7d0f4f8cb00012345678"
 
         # ---------- líneas / impuestos ----------------------------------
-        taxes        = clorian_invoice.get("billTaxes", [])
-        default_rate = taxes[0]["taxRate"] if taxes else 0
-
-        for line in clorian_invoice.get("billLines", []):
-            rate = next((t["taxRate"] for t in taxes
-                         if t["billId"] == clorian_invoice["billId"]), default_rate)
-            rate_pct = round(rate * 100, 2) if rate <= 1 else round(rate, 2)
-
+        rate_pct = clorian_invoice.tax_pct
+        for line in clorian_invoice.lines:
+            reservation_id = line.reservation_id if line.reservation_id is not None else ""
             holded["items"].append({
-                "serviceId": str(line.get("reservationId", "")),
-                "name":      f"Reserva {line.get('reservationId', '')}",
-                "subtotal":  _round2(line.get("billLineBaseAmount", 0)),
+                "serviceId": (catalog and catalog.holded_service_id(line)) or str(reservation_id),
+                "name":      catalog.line_name(line) if catalog else f"Reserva {reservation_id}",
+                "subtotal":  line.subtotal,
                 "tax":       rate_pct,
             })
 
         # ---------- forma de pago ---------------------------------------
-        origin = (clorian_invoice.get("billLines", [{}])[0]
-                  .get("paymentOrigin", "").lower())
-        holded["paymentMethodId"] = {
-        "cash": "68a83139c4854186960aac9f",
-        "deferred": "68a820fcb61533185f0c0f8d",
-        "transfer": "688356b04be192a8cd05faea",
-        "voucher": "68a8210f30da643cd9023447",
-        "prepayment": "68a821360555d6c96f0b14de",
-        "paypal-e": "68a827829a619d9b360f6632",
-        "paypal": "68a8217b8562a06be406fa40",
-        "adyen-pos-v": "68a827b3fe7f2e3d7408388f",
-        "pos2": "68a827c5a73dd0823409fd1e",
-        "alipay": "68a827d7543c5c1f860f0659",
-        "wechat": "68a827e2219129001a0540cc",
-        "bizum": "68a827f0471f09253f07c069"
-        }.get(origin, "")
+        holded["paymentMethodId"] = PAYMENT_METHOD_IDS.get(clorian_invoice.payment_origin, "")
 
         return holded
 
-    def transform_clorian_bill_to_holded_contact(self, bill: Dict[str, Any], *, contact_type: str = "client"):
+    def transform_clorian_bill_to_holded_contact(self, bill: ClorianBill, *, contact_type: str = "client"):
         """Build the JSON body for POST /contacts in Holded from a Clorian bill."""
-        is_person = bill.get("personType", "").upper() == "INDIVIDUAL"
+        is_person = bill.person_type == "INDIVIDUAL"
 
         if is_person:
             name = _clean(
                 " ".join(
                     p
                     for p in (
-                        bill.get("firstName"),
-                        bill.get("lastName1"),
-                        bill.get("lastName2"),
+                        bill.first_name,
+                        bill.last_name1,
+                        bill.last_name2,
                     )
                     if p
                 )
             ) or "Unnamed person"
         else:
-            name = _clean(bill.get("legalEntityName")) or "Unnamed company"
+            name = _clean(bill.legal_entity_name) or "Unnamed company"
 
         contact: Dict[str, Any] = {
             "name": name,
-            "code": _clean(bill.get("vatNumber")),
+            "code": _clean(bill.nif),
             "type": contact_type,  # client / supplier / …
             "isperson": is_person,
-            "email": _clean(bill.get("email")),
-            "phone": _clean(bill.get("mobile") or bill.get("telephone")),
+            "email": _clean(bill.email),
+            "phone": _clean(bill.phone),
             "billAddress": {
-                "address": _clean(bill.get("address"), 120),
-                "city": _clean(bill.get("city"), 60),
-                "postalCode": _clean(bill.get("postalCode"), 15),
-                "province": _clean(bill.get("state"), 60),
-                "country": (bill.get("country") or "")[:2].upper(),
+                "address": _clean(bill.address, 120),
+                "city": _clean(bill.city, 60),
+                "postalCode": _clean(bill.postal_code, 15),
+                "province": _clean(bill.state, 60),
+                "country": bill.country,
             },
         }
 
-        client_id = bill.get("clientId")
+        client_id = bill.client_id
         if client_id:
             contact["CustomId"] = str(client_id)
 
@@ -395,13 +925,17 @@ async def invoice_converter():
     
     pass
 
-async def migration_proceed():
-    """Main entry point for the Clorian to Holded sync process."""
+async def migration_proceed(deadline: Deadline | None = None, profile: bool | None = None):
+    """
+    Main entry point for the Clorian to Holded sync process (*deadline*: the
+    run's, default SYNC_DEADLINE_SECONDS; *profile*: sample the run, default SYNC_PROFILE).
+    """
     logger.info("🚀 Starting Clorian to Holded sync process")
     start_time = time.time()
     
+    profiler = SamplingProfiler().start() if (PROFILE_ENABLED if profile is None else profile) else None
+    async_service = AsyncService(deadline=deadline or Deadline.from_env())
     try:
-        async_service = AsyncService()
         await async_service.fetch_clorian_invoices()
         
         duration = time.time() - start_time
@@ -412,6 +946,11 @@ async def migration_proceed():
         logger.error(f"❌ Sync process failed after {duration:.2f} seconds: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise
+    finally:
+        await async_service.close()
+        if profiler is not None:
+            profiler.stop()
+            profiler.write()
 
 async def main_test():
     clorian_account = ClorianService("Clorian Flamenco Granada")
@@ -478,7 +1017,7 @@ async def main_test():
 
     # new_contact = async_service.transform_clorian_bill_to_holded_contact(clorian_bill)
 
-    holded_bill = await async_service.transform_invoice_clorian_to_holded(clorian_bill)
+    holded_bill = await async_service.transform_invoice_clorian_to_holded(ClorianBill.from_dict(clorian_bill), contact=False)
     print("Holded bill:", holded_bill)
 
     with open("holded_invoice.json", "w") as f:
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from src.config.settings import STATE_DIR, _slug
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+RESUME_FILE = os.path.join(STATE_DIR, "resume.json")
+LOCK_DIR = os.path.join(STATE_DIR, "locks")
+# A lock older than this belongs to a run that died without releasing it
+LOCK_STALE_SECONDS = float(os.getenv("SYNC_LOCK_STALE_SECONDS", "3600"))
+# How long the daily run waits for a poll holding the same account
+LOCK_WAIT_SECONDS = float(os.getenv("SYNC_LOCK_WAIT_SECONDS", "120"))
+
+
+def _load() -> dict:
+    try:
+        with open(RESUME_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save(state: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(RESUME_FILE), exist_ok=True)
+        tmp = RESUME_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, RESUME_FILE)
+    except OSError as e:
+        logger.warning(f"⚠️  Could not persist resume state: {e}")
+
+
+def load_resume_point(account: str, kind: str) -> Optional[datetime]:
+    """Return the billDate a previous interrupted run stopped at, if any."""
+    entry = _load().get(account, {}).get(kind)
+    if not entry:
+        return None
+    return datetime.strptime(entry["bill_date"], "%Y-%m-%d %H:%M:%S")
+
+
+def save_resume_point(account: str, kind: str, bill_date: str, reason: str) -> None:
+    """Remember where an interrupted run stopped so the next one starts there."""
+    state = _load()
+    state.setdefault(account, {})[kind] = {
+        "bill_date": bill_date,
+        "reason": reason,
+        "saved_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    _save(state)
+    logger.info(f"💾 Resume point for {account} [{kind}] saved at {bill_date} ({reason})")
+
+
+def clear_resume_point(account: str, kind: str) -> None:
+    state = _load()
+    if state.get(account, {}).pop(kind, None) is not None:
+        _save(state)
+
+
+class AccountBusy(RuntimeError):
+    """Another run (daily, poll, backfill) is pushing the same account and kind."""
+
+
+class AccountLock:
+    """
+    Lock file per account and kind under STATE_DIR/locks, taken by every run
+    that pushes to Holded (daily run, micro-batch poll, backfill) so two of
+    them never create the same bill. Across scaled-out instances it only
+    works with SYNC_STATE_DIR on shared storage (e.g. /home/data on Azure).
+    """
+    def __init__(self, account: str, kind: str, owner: str, *, lock_dir: str = LOCK_DIR):
+        self.account = account
+        self.kind = kind
+        self.owner = owner
+        self.path = os.path.join(lock_dir, f"{_slug(account)}-{kind}.lock")
+        self.held = False
+
+    def _holder(self) -> str:
+        try:
+            with open(self.path) as f:
+                info = json.load(f)
+            return f"{info.get('owner')} since {info.get('at')}"
+        except (OSError, json.JSONDecodeError):
+            return "unknown run"
+
+    def acquire(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.path.getmtime(self.path)
+            except FileNotFoundError:
+                return self.acquire()                # released in between
+            if age < LOCK_STALE_SECONDS:
+                raise AccountBusy(f"{self.account} [{self.kind}] is locked by {self._holder()} ({self.path})")
+            logger.warning(f"🔓 Taking over the stale lock of {self.account} [{self.kind}] ({self._holder()}, {age:.0f}s old)")
+            os.remove(self.path)
+            return self.acquire()
+        os.write(fd, json.dumps({"owner": self.owner, "pid": os.getpid(),
+                                 "at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}).encode())
+        os.close(fd)
+        self.held = True
+
+    async def acquire_within(self, seconds: float, *, every: float = 5.0) -> None:
+        """Wait up to *seconds* for the lock (a poll holds it for a minute at most); AccountBusy after that."""
+        give_up = time.monotonic() + seconds
+        while True:
+            try:
+                return self.acquire()
+            except AccountBusy:
+                if time.monotonic() + every > give_up:
+                    raise
+            await asyncio.sleep(every)
+
+    def touch(self) -> None:
+        """Long holders (backfill) refresh the lock so it never looks stale while they run."""
+        if self.held:
+            try:
+                os.utime(self.path)
+            except OSError:
+                pass
+
+    def release(self) -> None:
+        if not self.held:
+            return
+        self.held = False
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,251 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from src.config.settings import STATE_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TRACE_ENABLED = os.getenv("SYNC_TRACE", "0").lower() in ("1", "true", "yes")
+TRACE_ENDPOINT = os.getenv("SYNC_TRACE_ENDPOINT")           # OTLP/HTTP JSON, e.g. http://localhost:4318/v1/traces
+TRACES_DIR = os.path.join(STATE_DIR, "traces")
+SERVICE_NAME = "clorian-holded-sync"
+OTLP_BATCH = 512
+OTLP_QUEUE = 8                  # batches waiting for the sender thread; past that they are dropped
+
+_current: ContextVar[Optional["Span"]] = ContextVar("sync_span", default=None)
+
+
+class Span:
+    """One timed operation; parent/child links follow the asyncio task context."""
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error", "lane", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        parent = _current.get()
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.end_ns = 0
+        task = asyncio.current_task() if _loop_running() else None
+        self.lane = tracer.lane(task)
+        self._token = _current.set(self)
+        self.start_ns = time.time_ns()
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def fail(self, exc: BaseException) -> None:
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def end(self, **attributes) -> None:
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        self.attributes.update(attributes)
+        try:
+            _current.reset(self._token)
+        except ValueError:          # ended from another context: just drop the link
+            pass
+        self.tracer.export(self)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None and not isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+            self.fail(exc)
+        self.end()
+
+
+class _NoopSpan:
+    """What `start_span` returns while tracing is off: every call is a no-op."""
+    __slots__ = ()
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def fail(self, exc: BaseException) -> None:
+        pass
+
+    def end(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class Tracer:
+    """
+    Writes finished spans as they end, so a long run does not keep them in
+    memory: Chrome trace-event JSON under STATE_DIR/traces (open it in
+    Perfetto or chrome://tracing for the waterfall; one lane per asyncio
+    task) and, with SYNC_TRACE_ENDPOINT, OTLP/HTTP JSON batches to a collector.
+    The batches are posted by a background thread, never on the event loop.
+    """
+    def __init__(self, enabled: bool = TRACE_ENABLED, *, endpoint: Optional[str] = TRACE_ENDPOINT, path: Optional[str] = None):
+        self.enabled = enabled
+        self.endpoint = endpoint
+        self.path = path
+        self.spans = 0
+        self._file = None
+        self._lanes: dict[int, int] = {}
+        self._batch: list[dict] = []
+        self._queue: Optional[queue.Queue] = None
+        self._sender: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def lane(self, task) -> int:
+        key = id(task) if task is not None else 0
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = len(self._lanes) + 1
+        return lane
+
+    def export(self, span: Span) -> None:
+        self.spans += 1
+        if self._file is None:
+            self.path = self.path or os.path.join(TRACES_DIR, f"trace-{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}.json")
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "w")
+            self._file.write("[\n")          # the trace-event array may be left unterminated
+        args = {**span.attributes, "span_id": span.span_id, "parent_id": span.parent_id, "trace_id": span.trace_id}
+        if span.error:
+            args["error"] = span.error
+        self._file.write(json.dumps({
+            "name": span.name, "cat": span.name.split(".")[0], "ph": "X",
+            "ts": span.start_ns // 1000, "dur": (span.end_ns - span.start_ns) // 1000,
+            "pid": os.getpid(), "tid": span.lane, "args": args,
+        }, default=str) + ",\n")
+        if self.endpoint:
+            self._batch.append(_otlp_span(span))
+            if len(self._batch) >= OTLP_BATCH:
+                self._post()
+
+    def _post(self) -> None:
+        """Hand the current batch to the sender thread (started on first use); drop it if the thread is behind."""
+        batch, self._batch = self._batch, []
+        if self._sender is None:
+            self._queue = queue.Queue(maxsize=OTLP_QUEUE)
+            self._sender = threading.Thread(target=self._send_loop, args=(self._queue, self.endpoint), name="otlp-sender", daemon=True)
+            self._sender.start()
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            self.dropped += len(batch)
+
+    def _send_loop(self, batches: queue.Queue, endpoint: str) -> None:
+        while (batch := batches.get()) is not None:
+            if self.endpoint is None:
+                continue                         # collector gone: drain what is left
+            body = {"resourceSpans": [{
+                "resource": {"attributes": [_otlp_attr("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": batch}],
+            }]}
+            request = urllib.request.Request(endpoint, data=json.dumps(body, default=str).encode(), headers={"Content-Type": "application/json"})
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception as e:
+                logger.warning(f"⚠️  Trace collector {endpoint} unreachable ({e}); spans only go to {self.path}")
+                self.endpoint = None
+
+    def flush(self, timeout: float = 10.0) -> Optional[str]:
+        """Send the pending collector batch (waiting up to *timeout* for the sender) and close the trace file. Returns its path."""
+        if self.endpoint and self._batch:
+            self._post()
+        if self._sender is not None:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass                                  # still stuck on a slow collector: the daemon thread is left behind
+            self._sender.join(timeout)
+            self._sender = self._queue = None
+        if self.dropped:
+            logger.warning(f"⚠️  {self.dropped} spans not sent to {self.endpoint}: the collector could not keep up")
+            self.dropped = 0
+        if self._file is None:
+            return None
+        self._file.write("{}]\n")
+        self._file.close()
+        self._file = None
+        logger.info(f"🧭 {self.spans} spans written to {self.path}")
+        path, self.path, self._lanes = self.path, None, {}
+        return path
+
+
+def _otlp_attr(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(span: Span) -> dict:
+    out = {
+        "traceId": span.trace_id, "spanId": span.span_id, "name": span.name, "kind": 1,
+        "startTimeUnixNano": str(span.start_ns), "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_otlp_attr(k, v) for k, v in span.attributes.items() if v is not None],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        out["parentSpanId"] = span.parent_id
+    return out
+
+
+tracer = Tracer()
+
+
+def start_span(name: str, **attributes):
+    """Open a span (child of the current one); use it as a context manager or call `.end()`."""
+    if not tracer.enabled:
+        return NOOP_SPAN
+    return Span(tracer, name, attributes)
+
+
+def current_span():
+    """The innermost open span of this task (a no-op span when tracing is off)."""
+    return (_current.get() if tracer.enabled else None) or NOOP_SPAN
+
+
+def traced(name: str, attributes: Optional[Callable[..., dict]] = None):
+    """Wrap a coroutine function in a span; *attributes* gets the call arguments."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return await fn(*args, **kwargs)
+            with Span(tracer, name, attributes(*args, **kwargs) if attributes else {}):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
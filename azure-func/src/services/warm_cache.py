@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+WARM_CACHE_ENABLED = os.getenv("SYNC_WARM_CACHE", "1").lower() in ("1", "true", "yes")
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Process-level LRU cache with a TTL per entry. Azure reuses a warm worker
+    process between invocations, so whatever sits here survives until the
+    worker is recycled, the entry expires or `max_size` pushes it out.
+    Hits and misses are counted per invocation (see `begin_invocation`).
+    """
+    def __init__(self, name: str, *, ttl: float, max_size: int):
+        self.name = name
+        self.ttl = float(os.getenv(f"SYNC_CACHE_{name.upper()}_TTL_SECONDS", str(ttl)))
+        self.max_size = int(os.getenv(f"SYNC_CACHE_{name.upper()}_MAX", str(max_size)))
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if not WARM_CACHE_ENABLED:
+            return default
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires, value = entry
+        if time.monotonic() >= expires:
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any, *, ttl: Optional[float] = None) -> None:
+        if not WARM_CACHE_ENABLED:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def report(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None}
+
+
+# NIF → Holded contact id
+contacts = TTLCache("contacts", ttl=6 * 3600, max_size=50_000)
+# Clorian account → access/refresh token, expiry and POS (the entry expires with the token)
+clorian_tokens = TTLCache("tokens", ttl=3600, max_size=64)
+# Holded docNumber → document id, only for documents seen to exist
+holded_docs = TTLCache("docs", ttl=30 * 60, max_size=200_000)
+# Clorian account → ProductCatalog (the catalog revalidates itself after its own TTL)
+product_catalogs = TTLCache("products", ttl=24 * 3600, max_size=64)
+
+CACHES = (contacts, clorian_tokens, holded_docs, product_catalogs)
+
+
+def begin_invocation() -> None:
+    """Start counting hits and misses for a new invocation (the cached entries stay)."""
+    for cache in CACHES:
+        cache.hits = cache.misses = cache.evictions = 0
+
+
+def cache_report() -> dict:
+    """Per-cache size and hit ratio since the last `begin_invocation`."""
+    return {cache.name: cache.report() for cache in CACHES}
+
+
+def clear_all() -> None:
+    for cache in CACHES:
+        cache.clear()
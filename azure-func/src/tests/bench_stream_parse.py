@@ -0,0 +1,64 @@
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+
+from src.services.json_stream import iter_json_array
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FIXTURE = os.path.join(ROOT, "simplified_bills.json")
+
+
+def synthetic_day(n_bills: int = 50_000) -> bytes:
+    """Build the body of one very dense /ws/bills/simplified day from the fixture."""
+    with open(FIXTURE) as f:
+        sample = json.load(f)
+    bills = []
+    for i in range(n_bills):
+        bill = dict(sample[i % len(sample)])
+        bill["billId"] = 90_000_000 + i
+        bill["billNumber"] = f"SYNFS25-{i:08d}"
+        bills.append(bill)
+    return json.dumps(bills).encode()
+
+
+async def _chunks(body: bytes, size: int):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def bench_buffered(body: bytes) -> dict:
+    """What `await r.json()` does: whole body decoded and materialised."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    bills = json.loads(body.decode("utf-8"))
+    count = sum(1 for _ in bills)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"bills": count, "seconds": round(elapsed, 3), "peak_mb": round(peak / 2**20, 1)}
+
+
+def bench_streaming(body: bytes, chunk_size: int = 64 * 1024) -> dict:
+    """What `ClorianService.iter_bills` does: one bill alive at a time."""
+    async def run():
+        count = 0
+        async for _bill in iter_json_array(_chunks(body, chunk_size)):
+            count += 1
+        return count
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    count = asyncio.run(run())
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"bills": count, "seconds": round(elapsed, 3), "peak_mb": round(peak / 2**20, 1)}
+
+
+if __name__ == "__main__":
+    body = synthetic_day()
+    print(f"Synthetic day: {len(body) / 2**20:.1f} MB")
+    print("buffered  (r.json())   :", bench_buffered(body))
+    print("streaming (iter_bills) :", bench_streaming(body))
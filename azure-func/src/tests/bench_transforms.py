@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import decimal
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from src.services.bill_model import ClorianBill
+from src.services.clorian_service import ClorianService
+from src.services.export_service import split_tax_batch
+from src.services.sync_service import AsyncService
+from src.config.settings import _clean
+from src.tests.data_view import purchases_to_bill_csv, split_tax
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+NORMAL_FIXTURE = os.path.join(ROOT, "normal_bills.json")
+SIMPLIFIED_FIXTURE = os.path.join(ROOT, "simplified_bills.json")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+NAMES = ["José María", "Ñúñez  Péréz", "Françoise d'Été", "  Müller\tGmbH  ", "Visitours Excursiones S.L."]
+
+
+def scaled(fixture: str, n: int, seed: int = 7) -> list[dict]:
+    """*n* bills cycled from *fixture*, with unique ids/numbers and varied (accented) names."""
+    rng = random.Random(seed)
+    with open(fixture) as f:
+        sample = json.load(f)
+    bills = []
+    for i in range(n):
+        bill = dict(sample[i % len(sample)])
+        bill["billId"] = 80_000_000 + i
+        bill["billNumber"] = f"BENCH25-{i:08d}"
+        bill["firstName"] = rng.choice(NAMES)
+        bill["legalEntityName"] = bill.get("legalEntityName") or rng.choice(NAMES)
+        bill["address"] = f"{rng.choice(NAMES)} {i}, Planta {i % 7}"
+        bills.append(bill)
+    return bills
+
+
+def synthetic_purchases(bills: list[dict]) -> list[dict]:
+    """Purchases (purchase → reservation → ticket) shaped like /ws/purchases, one reservation per bill line."""
+    purchases = []
+    for bill in bills:
+        reservations = []
+        for line in bill.get("billLines") or []:
+            gross = round((line.get("billLineBaseAmount") or 0) + (line.get("billLineTaxAmount") or 0), 2)
+            reservations.append({
+                "reservationId": line.get("reservationId"), "status": "CONFIRMED", "productName": "Espectáculo",
+                "salesGroupName": "Web", "ticketList": [
+                    {"amount": round(gross / 2, 2), "taxRate": 0.1, "ticketComplementSet": [], "ticketExtraSet": [{"price": 0.0}]},
+                    {"amount": round(gross - gross / 2, 2), "taxRate": 0.1, "ticketComplementSet": [], "ticketExtraSet": []},
+                ],
+            })
+        purchases.append({"firstName": bill.get("firstName", ""), "lastName": bill.get("lastName1", ""), "email": "a@b.c",
+                          "telephone": "600000000", "country": "ES", "reservationList": reservations})
+    return purchases
+
+
+def _drive(coro):
+    """Run a coroutine that never awaits anything (the transforms) without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine suspended")
+
+
+def build_cases(scale: int) -> dict:
+    """name → (callable, operations per call)."""
+    normal_raw = scaled(NORMAL_FIXTURE, scale)
+    simplified_raw = scaled(SIMPLIFIED_FIXTURE, scale)
+    normal = [ClorianBill.from_dict(b) for b in normal_raw]
+    simplified = [ClorianBill.from_dict(b) for b in simplified_raw]
+    service = AsyncService(use_outbox=False, archive=False)
+    texts = [b["address"] for b in normal_raw] + [b["firstName"] for b in normal_raw]
+    gross = [decimal.Decimal(str(round(b.base_amount + b.tax_amount, 2))) for b in simplified]
+    rates = [decimal.Decimal(str(b.tax_pct / 100)) for b in simplified]
+    gross_a, rate_a = np.array([float(g) for g in gross]), np.array([float(r) for r in rates])
+    purchases = synthetic_purchases(normal_raw)
+    csv_path = os.path.join(tempfile.gettempdir(), "bench_clorian_bill.csv")
+    start = datetime(2015, 1, 1)
+
+    return {
+        "clean": (lambda: [_clean(t, 120) for t in texts], len(texts)),
+        "bill_from_dict": (lambda: [ClorianBill.from_dict(b) for b in simplified_raw], len(simplified_raw)),
+        "transform_invoice_normal": (lambda: [_drive(service.transform_invoice_clorian_to_holded(b, contact=True)) for b in normal], len(normal)),
+        "transform_invoice_simplified": (lambda: [_drive(service.transform_invoice_clorian_to_holded(b, contact=False)) for b in simplified], len(simplified)),
+        "transform_contact": (lambda: [service.transform_clorian_bill_to_holded_contact(b) for b in normal], len(normal)),
+        "day_windows_10y": (lambda: list(ClorianService._day_windows(start, start + timedelta(days=3652))), 3653),
+        "exact_windows_10y": (lambda: list(ClorianService._exact_windows(start + timedelta(hours=7), start + timedelta(days=3652))), 3653),
+        "split_tax": (lambda: [split_tax(g, r) for g, r in zip(gross, rates)], len(gross)),
+        "split_tax_batch": (lambda: split_tax_batch(gross_a, rate_a), len(gross)),
+        "purchases_to_bill_csv": (lambda: purchases_to_bill_csv(purchases, csv_path), sum(len(p["reservationList"]) for p in purchases)),
+    }
+
+
+def run(cases: dict, repeat: int = 5) -> dict:
+    """Best-of-*repeat* time of every case, as nanoseconds per operation."""
+    results = {}
+    for name, (fn, ops) in cases.items():
+        fn()                                        # warm-up (imports, caches, interned strings)
+        best = min(_timed(fn) for _ in range(repeat))
+        results[name] = {"ns_per_op": round(best / ops * 1e9, 1), "ops": ops}
+    return results
+
+
+def _timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Print every case against the baseline; return the names slower than `1 + threshold` times."""
+    regressions = []
+    print(f"{'case':<30} {'ns/op':>12} {'baseline':>12} {'ratio':>7}")
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:<30} {r['ns_per_op']:>12.1f} {'-':>12} {'new':>7}")
+            continue
+        ratio = r["ns_per_op"] / base["ns_per_op"] if base["ns_per_op"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  ⚠️  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:<30} {r['ns_per_op']:>12.1f} {base['ns_per_op']:>12.1f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the pure transform-layer functions.")
+    parser.add_argument("--scale", type=int, default=5_000, help="Bills generated from each fixture")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", help="Run only these cases (repeatable)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown vs the baseline (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    cases = build_cases(args.scale)
+    if args.only:
+        cases = {k: v for k, v in cases.items() if k in args.only}
+    results = run(cases, args.repeat)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+    base_scale = baseline.get("meta", {}).get("scale")
+    if baseline and base_scale != args.scale:
+        # ns/op depends on the scale (cache effects, dict sizes): the ratios would mean nothing
+        print(f"⚠️  Baseline {args.baseline} was taken at --scale {base_scale}, this run is --scale {args.scale}: not comparing")
+        baseline = {}
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "meta": {"python": platform.python_version(), "machine": platform.machine(), "scale": args.scale,
+                         "saved_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")},
+                "results": {**baseline.get("results", {}), **results},
+            }, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
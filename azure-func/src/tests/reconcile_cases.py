@@ -0,0 +1,122 @@
+"""
+Offline cases for reconcile_service: builds the frames the loaders would build
+and checks the reports, no Clorian/Holded calls.
+
+    python -m src.tests.reconcile_cases
+"""
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+
+# the summary cases write a summary map: never into a real state dir
+os.environ["SYNC_STATE_DIR"] = tempfile.mkdtemp(prefix="reconcile_cases_")
+
+import pandas as pd
+
+from src.services.bill_model import ClorianBill
+from src.services.bill_summary import bill_series, record_summary_mapping, summarize_bills, summary_number
+from src.services.reconcile_service import _Columns, _Summaries, _series, clorian_frames, holded_frames, reconcile
+from src.tests.synth_bills import BillGenerator, learn_profile
+
+TS = int(datetime(2025, 7, 1, 12, 0).timestamp())
+
+
+def _clorian(rows: list[tuple]) -> tuple:
+    bills = _Columns(account=object, number=object, ts="int64", base="float64", tax="float64", lines="int64")
+    taxes = _Columns(number=object, rate="float64", base="float64", tax="float64")
+    for number, base, tax in rows:
+        bills.add("acc", number, TS, base, tax, 1)
+        taxes.add(number, 0.21, base, tax)
+    return clorian_frames(bills, taxes)
+
+
+def _holded(rows: list[tuple]) -> tuple:
+    docs = _Columns(id=object, number=object, ts="int64", base="float64", tax="float64")
+    lines = _Columns(id=object, rate="float64", base="float64")
+    for doc_id, number, base, tax in rows:
+        docs.add(doc_id, number, TS, base, tax)
+        lines.add(doc_id, 21, base)
+    return holded_frames(docs, lines)
+
+
+def case_empty_clorian():
+    reports = reconcile(*_clorian([]), *_holded([("h1", "ALE25-00001", 10.0, 2.1)]))
+    assert all(len(df) == 0 for name, df in reports.items() if name not in ("daily", "tax_rates")), reports
+
+
+def case_empty_holded():
+    reports = reconcile(*_clorian([("ALE25-00001", 10.0, 2.1)]), *_holded([]))
+    assert list(reports["missing"]["number"]) == ["ALE25-00001"], reports["missing"]
+    assert reports["daily"]["bills_diff"].tolist() == [-1], reports["daily"]
+
+
+def case_both_empty():
+    reports = reconcile(*_clorian([]), *_holded([]))
+    assert all(len(df) == 0 for df in reports.values()), reports
+
+
+def case_mismatch_and_extra():
+    reports = reconcile(
+        *_clorian([("ALE25-00001", 10.0, 2.1), ("ALE25-00002", 20.0, 4.2)]),
+        *_holded([("h1", "ALE25-00001", 10.0, 2.1), ("h2", "ALE25-00002", 25.0, 5.25), ("h3", "ALE25-00003", 5.0, 1.05), ("h4", "OTHER-00001", 1.0, 0.21)]),
+    )
+    assert list(reports["mismatched"]["number"]) == ["ALE25-00002"], reports["mismatched"]
+    # OTHER is not a Clorian series: not ours to report
+    assert list(reports["extra"]["number"]) == ["ALE25-00003"], reports["extra"]
+    assert len(reports["missing"]) == 0, reports["missing"]
+
+
+def case_summary_series():
+    numbers = pd.Series(["ALE25-00067", "ALEFS25-R20250701", "ALEFS25-R20250701-2", "A-B25-00001", "NODASH"])
+    assert _series(numbers).tolist() == ["ALE25", "ALEFS25", "ALEFS25", "A-B25", "NODASH"], _series(numbers)
+
+
+def case_simplified_summary_account():
+    account = "summary-case"
+    day_bills = BillGenerator(learn_profile(), [account]).day_bills(0, "simplified", date(2025, 7, 1))
+    tickets = [ClorianBill.from_dict(b) for b in day_bills]
+    # the sync summarized the day without its last ticket, which arrived late
+    issued = summarize_bills(tickets[:-1], account)
+    for inv in issued:
+        record_summary_mapping(inv)
+
+    summaries = _Summaries(account)
+    for b in tickets:
+        summaries.add(b)
+    c_bills = _Columns(account=object, number=object, ts="int64", base="float64", tax="float64", lines="int64")
+    c_taxes = _Columns(number=object, rate="float64", base="float64", tax="float64")
+    summaries.flush(c_bills, c_taxes)
+
+    # Holded holds what the sync created: one invoice per issued summary, lines at rounded subtotals
+    docs = _Columns(id=object, number=object, ts="int64", base="float64", tax="float64")
+    lines = _Columns(id=object, rate="float64", base="float64")
+    for inv in issued:
+        items = [(l.tax_pct, round(l.subtotal, 2)) for l in inv.lines.values()]
+        docs.add(inv.number, inv.number, inv.date_ts, sum(b for _, b in items), sum(b * p / 100 for p, b in items))
+        for pct, base in items:
+            lines.add(inv.number, pct, base)
+
+    reports = reconcile(*clorian_frames(c_bills, c_taxes), *holded_frames(docs, lines))
+    assert len(reports["extra"]) == 0 and len(reports["mismatched"]) == 0, reports
+    # only the late ticket is missing, as the supplementary summary the next run will push
+    late = summary_number(bill_series(tickets[-1].bill_number), tickets[-1].day)
+    if late in {inv.number for inv in issued}:
+        late += "-2"
+    assert reports["missing"]["number"].tolist() == [late], reports["missing"]
+
+
+def main():
+    failed = 0
+    for name, case in [(n, f) for n, f in globals().items() if n.startswith("case_")]:
+        try:
+            case()
+            print(f"✅ {name}")
+        except Exception as e:
+            failed += 1
+            print(f"❌ {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional
+
+import numpy as np
+
+from src.config.settings import CLORIAN_ACCOUNTS, _slug
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+NORMAL_FIXTURE = os.path.join(ROOT, "normal_bills.json")
+SIMPLIFIED_FIXTURE = os.path.join(ROOT, "simplified_bills.json")
+KINDS = ("normal", "simplified")
+TS = "%Y-%m-%d %H:%M:%S"
+EPOCH = date(2000, 1, 1)
+# billId = (account * 2 + kind) * ID_ACCOUNT + day * ID_DAY + n  → decodable without any index
+ID_ACCOUNT, ID_DAY = 10**10, 10**5
+MAX_PER_DAY = ID_DAY // 2 - 1
+DNI_LETTERS = "TRWAGMYFPDXBNJZSQVHLCKE"
+
+
+@dataclass
+class KindProfile:
+    """Field distributions of one kind of bill, learned from a fixture."""
+    daily_mean: float
+    daily_var: float
+    line_counts: dict[int, float]
+    tax_rates: dict[float, float]
+    payment_origins: dict[str, float]
+    sales_groups: dict[int, float]
+    series: dict[str, float]                      # template ({code}, {yy}) → share
+    annul_series: dict[str, str]                  # series template → its annulation series template
+    digits: dict[str, int]                        # series template → zero padding
+    annulation_rate: float
+    hours: dict[int, float]
+    line_amounts: list[float] = field(default_factory=list)
+    customers: list[dict] = field(default_factory=list)
+    nif_share: float = 0.0
+    unique_nif_ratio: float = 1.0
+
+
+def _shares(counter: Counter) -> dict:
+    total = sum(counter.values()) or 1
+    return {k: v / total for k, v in counter.most_common()}
+
+
+def _series_of(number: str) -> tuple[str, str]:
+    series, _, digits = number.rpartition("-")
+    return series, digits
+
+
+def _template(series: str, code: str, yy: str) -> str:
+    return "{code}" + series[len(code):].replace(yy, "{yy}", 1)
+
+
+def _code(bills: list[dict]) -> str:
+    """Letters every series of the fixture starts with (the account code, 'ALE')."""
+    heads = [re.match(r"[A-Z]*", _series_of(b["billNumber"])[0]).group() for b in bills]
+    code = os.path.commonprefix(heads)
+    return code or heads[0]
+
+
+def learn_kind(bills: list[dict]) -> KindProfile:
+    code = _code(bills)
+    days = Counter(b["billDate"][:10] for b in bills if not b.get("annulation"))
+    counts = np.array(list(days.values()) or [1], dtype=float)
+    series, digits, annul_series = Counter(), {}, {}
+    by_id = {b["billId"]: b for b in bills}
+    for b in bills:
+        raw, pad = _series_of(b["billNumber"])
+        t = _template(raw, code, b["billDate"][2:4])
+        digits[t] = len(pad)
+        if b.get("annulation"):
+            parent = by_id.get(b.get("parentBillId"))
+            if parent is not None:
+                annul_series[_template(_series_of(parent["billNumber"])[0], code, parent["billDate"][2:4])] = t
+        else:
+            series[t] += 1
+    lines = [l for b in bills if not b.get("annulation") for l in b.get("billLines") or []]
+    with_nif = [b for b in bills if (b.get("vatNumber") or "").strip()]
+    customers, seen = [], set()
+    for b in with_nif:
+        if b["vatNumber"] in seen:
+            continue
+        seen.add(b["vatNumber"])
+        customers.append({k: b.get(k) for k in ("legalEntityName", "firstName", "lastName1", "vatNumberType", "vatNumber", "address",
+                                                  "city", "state", "postalCode", "country", "languageId", "personType") if k in b})
+    return KindProfile(
+        daily_mean=float(counts.mean()),
+        daily_var=float(counts.var()) if len(counts) > 1 else float(counts.mean()),
+        line_counts=_shares(Counter(len(b.get("billLines") or []) or 1 for b in bills if not b.get("annulation"))),
+        tax_rates=_shares(Counter(t["taxRate"] for b in bills for t in b.get("billTaxes") or [])) or {0.1: 1.0},
+        payment_origins=_shares(Counter(l.get("paymentOrigin") for l in lines if l.get("paymentOrigin"))),
+        sales_groups=_shares(Counter(l.get("paymentSalesGroupId") for l in lines if l.get("paymentSalesGroupId"))),
+        series=_shares(series),
+        annul_series=annul_series,
+        digits=digits,
+        annulation_rate=sum(1 for b in bills if b.get("annulation")) / max(1, sum(series.values())),
+        hours=_shares(Counter(int(b["billDate"][11:13]) for b in bills)),
+        line_amounts=sorted(l["billLineBaseAmount"] for l in lines if (l.get("billLineBaseAmount") or 0) > 0),
+        customers=customers,
+        nif_share=len(with_nif) / max(1, len(bills)),
+        unique_nif_ratio=len(seen) / max(1, len(with_nif)),
+    )
+
+
+def learn_profile(normal_path: str = NORMAL_FIXTURE, simplified_path: str = SIMPLIFIED_FIXTURE) -> dict[str, KindProfile]:
+    profile = {}
+    for kind, path in (("normal", normal_path), ("simplified", simplified_path)):
+        with open(path) as f:
+            profile[kind] = learn_kind(json.load(f))
+    return profile
+
+
+def account_code(name: str) -> str:
+    """'Clorian Flamenco Granada' → 'CFG' (series prefix of the synthetic bills)."""
+    words = [w for w in _slug(name).split("-") if w]
+    return ("".join(w[0] for w in words[:4]) or "SYN").upper()
+
+
+def _pick(rng: random.Random, shares: dict):
+    return rng.choices(list(shares), weights=list(shares.values()))[0]
+
+
+def _dni(n: int) -> str:
+    return f"{n:08d}{DNI_LETTERS[n % 23]}"
+
+
+def _cif(letter: str, n: int) -> str:
+    digits = f"{n:07d}"
+    odd = sum(sum(divmod(int(d) * 2, 10)) for d in digits[::2])
+    even = sum(int(d) for d in digits[1::2])
+    control = (10 - (odd + even) % 10) % 10
+    return f"{letter}{digits}{'JABCDEFGHI'[control] if letter in 'PQSW' else control}"
+
+
+def synthetic_nif(template: str, n: int) -> str:
+    """A NIF of the same shape as *template* (CIF, NIE or DNI) with valid control character."""
+    template = (template or "").strip().upper()
+    if template[:1] and template[0] in "XYZ":
+        head = "XYZ".index(template[0])
+        return template[0] + _dni(head * 10**7 + n % 10**7)[1:]
+    if template[:1].isalpha():
+        return _cif(template[0], n % 10**7)
+    return _dni(n % 10**8)
+
+
+class BillGenerator:
+    """
+    Deterministic synthetic Clorian bills shaped like the fixtures.
+
+    Every (account, kind, day) is generated on its own from a seed derived from
+    them, so any window can be produced in any order (NDJSON dumps, or a mock
+    API answering arbitrary slices) and always gives the same bills. Numbers
+    stay sequential per series and year, as Clorian's are.
+    """
+    def __init__(self, profile: dict[str, KindProfile], accounts: list[str], *, seed: int = 7, volume: float = 1.0,
+                 annulation_rate: Optional[float] = None, customers: int = 5_000):
+        self.profile = profile
+        self.accounts = accounts
+        self.seed = seed
+        self.volume = volume
+        self.annulation_rate = annulation_rate
+        self.customers = customers
+        self._series = {kind: list(p.series) for kind, p in profile.items()}
+        self._shares = {kind: np.array(list(p.series.values())) for kind, p in profile.items()}
+
+    # COUNTS (cheap: numbers are prefix sums of them)
+    def _counts(self, account: int, kind: str, day: date) -> tuple[np.ndarray, np.ndarray]:
+        """Bills and annulations of every series on *day*."""
+        p = self.profile[kind]
+        rng = np.random.default_rng([self.seed, account, KINDS.index(kind), day.toordinal()])
+        mean = p.daily_mean * self.volume
+        # gamma–Poisson: keeps the day-to-day spread of the fixture (busy days, quiet days)
+        shape = mean ** 2 / max(p.daily_var * self.volume ** 2 - mean, 1e-6) if p.daily_var * self.volume ** 2 > mean else None
+        lam = rng.gamma(shape, mean / shape) if shape else mean
+        total = min(int(rng.poisson(lam)), MAX_PER_DAY)
+        per_series = rng.multinomial(total, self._shares[kind])
+        rate = p.annulation_rate if self.annulation_rate is None else self.annulation_rate
+        return per_series, rng.binomial(per_series, min(1.0, rate))
+
+    @functools.lru_cache(maxsize=256)
+    def _year_offsets(self, account: int, kind: str, year: int) -> np.ndarray:
+        """Per day of *year*, the numbers used before it in every series (bills, then annulations)."""
+        first = date(year, 1, 1)
+        days = (date(year + 1, 1, 1) - first).days
+        out = np.zeros((days + 1, 2 * len(self._series[kind])), dtype=np.int64)
+        for d in range(days):
+            bills, annulled = self._counts(account, kind, first + timedelta(days=d))
+            out[d + 1] = out[d] + np.concatenate([bills, annulled])
+        return out
+
+    # BILLS
+    @functools.lru_cache(maxsize=4096)
+    def day_bills(self, account: int, kind: str, day: date) -> tuple[dict, ...]:
+        """Every bill (annulations included) billed on *day*, in billDate order."""
+        p = self.profile[kind]
+        name = self.accounts[account]
+        code = account_code(name)
+        per_series, annulled = self._counts(account, kind, day)
+        offsets = self._year_offsets(account, kind, day.year)[(day - date(day.year, 1, 1)).days]
+        rng = random.Random(f"{self.seed}:{account}:{kind}:{day.isoformat()}")
+        n_series = len(self._series[kind])
+        day_id = (account * 2 + KINDS.index(kind)) * ID_ACCOUNT + (day - EPOCH).days * ID_DAY
+        yy = f"{day.year % 100:02d}"
+        client_id = next((a.get("client_id") for a in CLORIAN_ACCOUNTS if a.get("name") == name), 100 + account)
+
+        stamps = sorted(
+            (datetime(day.year, day.month, day.day, _pick(rng, p.hours), rng.randrange(60), rng.randrange(60)), s)
+            for s, count in enumerate(per_series) for _ in range(count)
+        )
+        bills, seq = [], [0] * (2 * n_series)
+        for i, (stamp, s) in enumerate(stamps):
+            template = self._series[kind][s]
+            seq[s] += 1
+            number = f"{template.format(code=code, yy=yy)}-{offsets[s] + seq[s]:0{p.digits.get(template, 6)}d}"
+            bills.append(self._bill(rng, p, kind, day_id + i, number, stamp, client_id, account))
+
+        # annulations: same day, later, negative copy of a random bill of the series
+        annulations = []
+        for s, count in enumerate(annulled):
+            parents = [b for b, (_, ps) in zip(bills, stamps) if ps == s]
+            template = p.annul_series.get(self._series[kind][s], self._series[kind][s] + "-A")
+            for parent in rng.sample(parents, min(count, len(parents))):
+                parent["status"] = "canceled"
+                start = datetime.strptime(parent["billDate"], TS)
+                stamp = start + timedelta(seconds=rng.randint(1, max(1, int((datetime.combine(day, datetime.max.time()) - start).total_seconds()))))
+                annulations.append((stamp.replace(microsecond=0), s, template, parent))
+        annulations.sort(key=lambda a: a[0])
+        for j, (stamp, s, template, parent) in enumerate(annulations, len(bills)):
+            seq[n_series + s] += 1
+            number = f"{template.format(code=code, yy=yy)}-{offsets[n_series + s] + seq[n_series + s]:0{p.digits.get(template, 8)}d}"
+            bills.append(self._annulation(parent, day_id + j, number, stamp))
+        bills.sort(key=lambda b: b["billDate"])
+        return tuple(bills)
+
+    def _customer(self, rng: random.Random, p: KindProfile, account: int) -> dict:
+        pool = max(1, int(self.customers * p.unique_nif_ratio))
+        n = rng.randrange(pool)
+        crng = random.Random(f"{self.seed}:{account}:customer:{n}")
+        template = dict(crng.choice(p.customers))
+        template["vatNumber"] = synthetic_nif(template.get("vatNumber"), account * 10**6 + n)
+        return template
+
+    def _bill(self, rng: random.Random, p: KindProfile, kind: str, bill_id: int, number: str, stamp: datetime, client_id, account: int) -> dict:
+        rate = _pick(rng, p.tax_rates)
+        origin = _pick(rng, p.payment_origins)
+        group = _pick(rng, p.sales_groups) if p.sales_groups else None
+        paid = stamp - timedelta(seconds=rng.randint(5, 3 * 86400 if kind == "normal" else 60))
+        lines = []
+        for k in range(min(_pick(rng, p.line_counts), 99)):
+            base = round(rng.choice(p.line_amounts) * rng.lognormvariate(0, 0.1), 6) if p.line_amounts else 10.0
+            line_id = bill_id * 100 + k
+            lines.append({
+                "billLineId": line_id, "billLineBaseAmount": base, "billLineTaxAmount": round(base * rate, 6),
+                "paymentDate": paid.strftime(TS), "paymentReference": str(rng.randrange(10**18, 10**19)),
+                "reservationId": line_id, "paymentId": bill_id, "firstPayment": True, "secondPayment": True,
+                "paymentOrigin": origin, "paymentCreationDate": (paid - timedelta(seconds=rng.randint(30, 300))).strftime(TS),
+                "paymentModificationDate": paid.strftime(TS), "paymentSalesGroupId": group, "paymentReservationId": bill_id,
+            })
+        base = round(sum(l["billLineBaseAmount"] for l in lines), 6)
+        tax = round(sum(l["billLineTaxAmount"] for l in lines), 6)
+        bill = {
+            "billId": bill_id, "simplified": kind == "simplified",
+            "processDate": stamp.strftime("%Y-%m-%d 00:00:00") if kind == "normal" else stamp.strftime(TS),
+            "clientId": client_id, "status": "valid", "annulation": False, "billDate": stamp.strftime(TS), "billNumber": number,
+            "baseAmount": base, "taxAmount": tax,
+            "billLines": lines,
+            "billTaxes": [{"billId": bill_id, "taxRate": rate, "taxAmount": tax, "taxBasis": round(base, 5)}],
+        }
+        if kind == "normal":
+            bill.update(billSender="client", type="individual", operationStartDatetime=bill["billDate"], operationEndDatetime=bill["billDate"])
+            if p.customers and rng.random() < p.nif_share:
+                bill.update(self._customer(rng, p, account))
+        return bill
+
+    @staticmethod
+    def _annulation(parent: dict, bill_id: int, number: str, stamp: datetime) -> dict:
+        lines = [{**l, "billLineBaseAmount": -l["billLineBaseAmount"], "billLineTaxAmount": -l["billLineTaxAmount"]} for l in parent["billLines"]]
+        return {
+            **{k: v for k, v in parent.items() if k not in ("billLines", "billTaxes")},
+            "billId": bill_id, "status": "valid", "annulation": True, "billNumber": number, "parentBillId": parent["billId"],
+            "billDate": stamp.strftime(TS), "processDate": stamp.strftime(TS),
+            "baseAmount": -parent["baseAmount"], "taxAmount": -parent["taxAmount"], "billLines": lines,
+            "billTaxes": [{**t, "billId": bill_id, "taxAmount": -t["taxAmount"], "taxBasis": -t["taxBasis"]} for t in parent["billTaxes"]],
+        }
+
+    def bills_between(self, account: int, kind: str, start: datetime, end: datetime) -> Iterator[dict]:
+        """Bills with billDate in [start, end], oldest first (what /ws/bills/{kind} answers)."""
+        lo, hi = start.strftime(TS), end.strftime(TS)
+        day = start.date()
+        while day <= end.date():
+            for bill in self.day_bills(account, kind, day):
+                if lo <= bill["billDate"] <= hi:
+                    yield bill
+            day += timedelta(days=1)
+
+    def bill_by_id(self, bill_id: int) -> Optional[dict]:
+        group, rest = divmod(bill_id, ID_ACCOUNT)
+        account, kind = divmod(group, 2)
+        if account >= len(self.accounts) or kind >= len(KINDS):
+            return None
+        bills = self.day_bills(account, KINDS[kind], EPOCH + timedelta(days=rest // ID_DAY))
+        return next((b for b in bills if b["billId"] == bill_id), None)
+
+
+def write_ndjson(generator: BillGenerator, out_dir: str, start: date, end: date, kinds: tuple[str, ...]) -> dict:
+    """<out_dir>/<account>/<kind>.ndjson for every account and kind. Returns counts."""
+    totals = Counter()
+    for account, name in enumerate(generator.accounts):
+        os.makedirs(os.path.join(out_dir, _slug(name)), exist_ok=True)
+        for kind in kinds:
+            with open(os.path.join(out_dir, _slug(name), f"{kind}.ndjson"), "w") as f:
+                day = start
+                while day <= end:
+                    for bill in generator.day_bills(account, kind, day):
+                        f.write(json.dumps(bill, ensure_ascii=False) + "\n")
+                        totals["bills"] += 1
+                        totals["lines"] += len(bill["billLines"])
+                        totals["annulations"] += bill["annulation"]
+                    day += timedelta(days=1)
+                totals["bytes"] += f.tell()
+            generator.day_bills.cache_clear()
+    return dict(totals)
+
+
+# MOCK CLORIAN API
+def make_app(generator: BillGenerator, *, latency_ms: float = 0.0, error_rate: float = 0.0):
+    """aiohttp app answering the Clorian endpoints the sync uses, from *generator*."""
+    from aiohttp import web
+
+    by_client: dict[str, list[int]] = {}
+    for index, name in enumerate(generator.accounts):
+        acc = next((a for a in CLORIAN_ACCOUNTS if a.get("name") == name), {})
+        by_client.setdefault(str(acc.get("client_id", 100 + index)), []).append(index)
+    pos_of = {index: str(next((a.get("pos") or a.get("pos_id") for a in CLORIAN_ACCOUNTS if a.get("name") == name), "")) for index, name in enumerate(generator.accounts)}
+    chaos = random.Random(generator.seed)
+
+    async def delay():
+        if latency_ms:
+            await asyncio.sleep(chaos.expovariate(1 / latency_ms) / 1000)
+
+    def account_of(request) -> Optional[int]:
+        candidates = by_client.get(request.query.get("clientId", ""), [])
+        pos = request.headers.get("pos")
+        return next((i for i in candidates if pos_of[i] == pos), candidates[0] if candidates else None)
+
+    async def token(request):
+        return web.json_response({"access_token": f"synthetic-{time.time_ns()}", "refresh_token": "synthetic-refresh",
+                                  "expires_in": 3600, "posAllowed": [p for p in pos_of.values() if p]})
+
+    async def bills(request):
+        await delay()
+        if error_rate and chaos.random() < error_rate:
+            return web.json_response({"error": "synthetic failure"}, status=503)
+        kind = request.match_info["kind"]
+        if kind not in KINDS:
+            raise web.HTTPNotFound()
+        if "billId" in request.query:
+            bill = generator.bill_by_id(int(request.query["billId"]))
+            return web.json_response([bill]) if bill else web.json_response([], status=404)
+        account = account_of(request)
+        if account is None:
+            return web.json_response([])
+        start = datetime.strptime(request.query["startDatetime"], "%Y%m%d%H%M%S")
+        end = datetime.strptime(request.query["endDatetime"], "%Y%m%d%H%M%S")
+        return web.json_response(list(generator.bills_between(account, kind, start, end)))
+
+    async def empty(request):
+        await delay()
+        return web.json_response([])
+
+    app = web.Application()
+    app.add_routes([
+        web.post("/user/oauth/token", token),
+        web.get("/ws/bills/{kind}", bills),
+        web.get("/ws/masters/products", empty),
+        web.get("/ws/purchases", empty),
+    ])
+    return app
+
+
+def _day(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic Clorian bills learned from the fixtures (NDJSON or a mock API).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="Write <out>/<account>/<kind>.ndjson")
+    gen.add_argument("--out", required=True)
+    gen.add_argument("--start", type=_day, required=True, help="YYYY-MM-DD")
+    gen.add_argument("--end", type=_day, required=True, help="YYYY-MM-DD")
+    gen.add_argument("--accounts", type=int, default=1, help="Synthetic accounts (ignored with --account)")
+    serve = sub.add_parser("serve", help="Mock Clorian API; run the sync with CLORIAN_BASE_URL=http://<host>:<port>")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8089)
+    serve.add_argument("--latency-ms", type=float, default=0.0, help="Mean (exponential) latency of the bill endpoints")
+    serve.add_argument("--error-rate", type=float, default=0.0, help="Share of bill requests answered 503")
+    sub.add_parser("profile", help="Print the distributions learned from the fixtures")
+    for p in (gen, serve):
+        p.add_argument("--account", action="append", help="Account name (repeatable; serve defaults to the credentials.json accounts)")
+        p.add_argument("--kind", action="append", choices=KINDS)
+        p.add_argument("--seed", type=int, default=7)
+        p.add_argument("--volume", type=float, default=1.0, help="Multiplier of the fixtures' bills per day")
+        p.add_argument("--annulation-rate", type=float, help="Override the learned share of annulled bills")
+        p.add_argument("--customers", type=int, default=5_000, help="Distinct customers (NIFs) per account before reuse")
+    args = parser.parse_args()
+
+    profile = learn_profile()
+    if args.command == "profile":
+        print(json.dumps({k: {**asdict(p), "line_amounts": len(p.line_amounts), "customers": len(p.customers)} for k, p in profile.items()},
+                         indent=2, default=str))
+        return
+
+    if args.command == "generate":
+        accounts = args.account or [f"Synthetic {i + 1:02d}" for i in range(args.accounts)]
+    else:
+        accounts = args.account or [a["name"] for a in CLORIAN_ACCOUNTS]
+    generator = BillGenerator(profile, accounts, seed=args.seed, volume=args.volume,
+                              annulation_rate=args.annulation_rate, customers=args.customers)
+
+    if args.command == "generate":
+        started = time.perf_counter()
+        totals = write_ndjson(generator, args.out, args.start, args.end, tuple(args.kind or KINDS))
+        elapsed = time.perf_counter() - started
+        logger.info(f"🧪 {totals.get('bills', 0)} bills ({totals.get('lines', 0)} lines, {totals.get('annulations', 0)} annulations, "
+                    f"{totals.get('bytes', 0) / 2**20:.1f} MB) for {len(accounts)} accounts in {elapsed:.1f}s → {args.out}")
+        return
+
+    from aiohttp import web
+    logger.info(f"🧪 Mock Clorian API for {len(accounts)} accounts on http://{args.host}:{args.port} (volume ×{args.volume})")
+    web.run_app(make_app(generator, latency_ms=args.latency_ms, error_rate=args.error_rate), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    main()
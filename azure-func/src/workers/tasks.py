@@ -1,4 +1,5 @@
 from celery import shared_task
+from src.services.resilience import Deadline
 from src.services.sync_service import AsyncService 
 import asyncio
 
@@ -6,7 +7,7 @@ import asyncio
 @shared_task
 def main_periodic_tasks():
     """Runs every 24 hours."""
-    async_service = AsyncService()
+    async_service = AsyncService(deadline=Deadline.from_env())
     asyncio.run(holded_to_cegid(async_service))
 
 async def holded_to_cegid(async_service: AsyncService) -> int: